@@ -1,100 +1,108 @@
-import pandas as pd
-import numpy as np
-from sklearn.ensemble import IsolationForest
-from datetime import datetime
-import warnings
-
-# Suppress specific pandas warnings
-warnings.filterwarnings('ignore', category=UserWarning, module='pandas')
-warnings.filterwarnings('ignore', category=pd.errors.SettingWithCopyWarning)
+import argparse
+
+from anomaly_pipeline import feature_matrix, load_transactions, parcel_id_col, transaction_date_col
+from anomaly_stream import score_stream
+from columnar_cache import HAVE_PYARROW, write_table
+from geo_index import geo_index_for
+from model_artifact import load_anomaly_artifact
+from prescreen_rules import ANOMALY, INELIGIBLE, MODEL, RULES, load_rules, prescreen_and_score, summarize
+
+parser = argparse.ArgumentParser(description="Score land transactions with the trained anomaly model")
+parser.add_argument('--input', default='anomaly.csv', help='transaction file: CSV, Parquet or Arrow IPC '
+                                                            '(default: anomaly.csv)')
+parser.add_argument('--stream', action='store_true',
+                    help='process the file in chunks with bounded memory and write every scored row to --output')
+parser.add_argument('--output', help='write scored rows here; .parquet / .arrow / .csv by extension '
+                                     '(--stream default: anomaly_scored.parquet, or .csv without pyarrow)')
+parser.add_argument('--chunksize', type=int, default=100_000, help='rows per chunk for --stream')
+parser.add_argument('--no-dedupe', action='store_true', help='skip cross-chunk duplicate removal in --stream')
+parser.add_argument('--rules', help='JSON pre-screen rules (default: prescreen_rules.RULES)')
+parser.add_argument('--no-prescreen', action='store_true',
+                    help='send every scorable row to the model and drop the rest, without rule hits')
+args = parser.parse_args()
 
 # ------------------------------
-# Step 1: Sample Dataset Creation
+# Step 1: Load the Trained Model
 # ------------------------------
 
-# Load the data
-data = pd.read_csv('anomaly.csv')
-
-# Print column names to verify what's actually in the file
-# print("Available columns:", data.columns.tolist())
-
-# Clean the data
-# Remove duplicates
-data = data.drop_duplicates()
-
-# Handle missing values - using the EXACT column names from your data
-transaction_amount_col = 'Transaction Amount'
-land_area_col = 'Land Area (sq.m)'
-market_value_col = 'Market Value'
-transaction_date_col = 'Transaction Date'
-parcel_id_col = 'Parcel ID'
-
-data = data.fillna({
-    transaction_amount_col: data[transaction_amount_col].median(),
-    land_area_col: data[land_area_col].median(),
-    market_value_col: data[market_value_col].median()
-})
-
-# Convert date columns to datetime - specifying dayfirst=True to fix the warning
-if not pd.api.types.is_datetime64_dtype(data[transaction_date_col]):
-    data[transaction_date_col] = pd.to_datetime(data[transaction_date_col], dayfirst=True, errors='coerce')
-
-# Remove rows with invalid dates
-data = data.dropna(subset=[transaction_date_col])
-
-# Ensure numeric columns are correct type
-numeric_cols = [transaction_amount_col, land_area_col, market_value_col]
-for col in numeric_cols:
-    data[col] = pd.to_numeric(data[col], errors='coerce')
-
-# Remove rows with zero or negative values in critical columns
-data = data[(data[transaction_amount_col] > 0) & (data[land_area_col] > 0)]
+# The model is fitted once by train_anomaly.py and persisted as an artifact,
+# so this report only scores the transactions instead of refitting on every run
+try:
+    artifact = load_anomaly_artifact()
+except FileNotFoundError:
+    raise SystemExit("No anomaly model artifact found. Train one with `python train_anomaly.py`.")
+model = artifact.model
+# Rules that decide the obvious rows before the model (see prescreen_rules.py)
+rules = None if args.no_prescreen else (load_rules(args.rules) if args.rules else RULES)
+# Neighbourhood features come from the geo index version the model was trained with, if any
+geo = geo_index_for(artifact)
+
+if args.stream:
+    # Chunked pipeline for exports too large to load at once (see anomaly_stream.py)
+    args.output = args.output or ('anomaly_scored.parquet' if HAVE_PYARROW else 'anomaly_scored.csv')
+    summary = score_stream(model, artifact.features, args.input, args.output,
+                           chunksize=args.chunksize, dedupe_rows=not args.no_dedupe, geo=geo, rules=rules)
+    print(f"\nScored with anomaly model {artifact.version}")
+    print(f"Read {summary['rows']} rows: {summary['duplicates']} duplicates, {summary['dropped']} dropped, "
+          f"{summary['scored']} scored")
+    if summary['out_of_order']:
+        print(f"Warning: {summary['out_of_order']} rows were older than an earlier chunk's last transaction "
+              f"on the same parcel; their days_since_prev was clipped to 0")
+    if rules is not None:
+        print(f"Pre-screen: {summary['prescreen'][ANOMALY]} flagged and {summary['prescreen'][INELIGIBLE]} "
+              f"ineligible by rules, {summary['model_rows']} sent to the model")
+    if summary['scored']:
+        print(f"Found {summary['anomalies']} anomalies ({summary['anomalies'] / summary['scored']:.1%})")
+        print(f"Results written to {args.output}")
+    else:
+        print(f"No rows left to score; {args.output} was not created")
+    raise SystemExit
 
-# Now create feature engineering columns
-data['price_per_sqm'] = data[transaction_amount_col] / data[land_area_col]
-
-# Ratio of transaction amount to market value
-data['price_ratio'] = data[transaction_amount_col] / data[market_value_col]
+# ------------------------------
+# Step 2: Load and Clean the Data
+# ------------------------------
 
-# Days since previous transaction on same parcel
-if parcel_id_col in data.columns:
-    data = data.sort_values([parcel_id_col, transaction_date_col])
-    data['prev_date'] = data.groupby(parcel_id_col)[transaction_date_col].shift(1)
-    data['days_since_prev'] = (data[transaction_date_col] - data['prev_date']).dt.days.fillna(0)
+# Cleaning and feature engineering are shared with train_anomaly.py (see anomaly_pipeline.py)
+data = load_transactions(args.input, keep_unscorable=rules is not None)
+if geo is not None:
+    data = geo.add_features(data)
 
 # ------------------------------
 # Step 3: Anomaly Detection
 # ------------------------------
 
-if 'price_per_sqm' in data.columns and 'price_ratio' in data.columns:
-    # Select features for anomaly detection - create a copy to avoid the SettingWithCopyWarning
-    features = data[['price_per_sqm', 'price_ratio']].copy()
-    if 'days_since_prev' in data.columns:
-        features['days_since_prev'] = data['days_since_prev']
-
-    # Isolation Forest for anomaly detection
-    model = IsolationForest(contamination=0.2, random_state=42)
-    data['anomaly_score'] = model.fit_predict(features)
+if rules is None:
+    features = feature_matrix(data, artifact.features)
+    data['anomaly_score'] = model.predict(features)
 
     # Mark anomalies
     data['is_anomaly'] = data['anomaly_score'] == -1
+else:
+    # Rules flag or set aside the obvious rows; only the rest reach the model
+    data = prescreen_and_score(model, artifact.features, data, rules)
+    outcomes, hits = summarize(data)
 
-    # ------------------------------
-    # Step 4: Results
-    # ------------------------------
+# ------------------------------
+# Step 4: Results
+# ------------------------------
 
-    cols_to_display = [parcel_id_col, transaction_date_col, 'price_per_sqm', 'price_ratio']
-    if 'days_since_prev' in data.columns:
-        cols_to_display.append('days_since_prev')
-    cols_to_display.extend(['anomaly_score', 'is_anomaly'])
-    
-    # Display summary of anomalies
-    anomaly_count = data['is_anomaly'].sum()
-    total_count = len(data)
-    print(f"\nFound {anomaly_count} anomalies out of {total_count} transactions ({anomaly_count/total_count:.1%})")
-    
-    # Display anomalies
-    print("\nTop suspicious transactions:")
-    print(data[data['is_anomaly'] == True][cols_to_display].head(10))
-else:
-    print("Could not create required features for anomaly detection")
+cols_to_display = [parcel_id_col, transaction_date_col, 'price_per_sqm', 'price_ratio', 'days_since_prev',
+                   'anomaly_score', 'is_anomaly'] + (['prescreen_reasons'] if rules is not None else [])
+
+# Display summary of anomalies
+anomaly_count = data['is_anomaly'].sum()
+total_count = len(data)
+print(f"\nScored with anomaly model {artifact.version}")
+print(f"\nFound {anomaly_count} anomalies out of {total_count} transactions ({anomaly_count/total_count:.1%})")
+if rules is not None:
+    print(f"Pre-screen: {outcomes[ANOMALY]} flagged and {outcomes[INELIGIBLE]} ineligible by rules, "
+          f"{outcomes[MODEL]} sent to the model")
+    print("Rule hits: " + (', '.join(f"{name} {count}" for name, count in hits.items()) or 'none'))
+
+# Display anomalies
+print("\nTop suspicious transactions:")
+print(data[data['is_anomaly'] == True][cols_to_display].head(10))
+
+if args.output:
+    write_table(data.sort_index(), args.output)
+    print(f"\nResults written to {args.output}")
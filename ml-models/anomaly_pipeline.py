@@ -0,0 +1,103 @@
+"""Cleaning and feature engineering for land transaction records.
+
+Shared by the offline report (anomaly_detect.py) and the training pipeline
+(train_anomaly.py), so the model is always fitted on the same features the
+report and the service score.
+"""
+
+import warnings
+
+import pandas as pd
+
+from columnar_cache import read_transactions
+from feature_encoding import ANOMALY_FEATURES
+
+# Suppress specific pandas warnings
+warnings.filterwarnings('ignore', category=UserWarning, module='pandas')
+if hasattr(pd.errors, 'SettingWithCopyWarning'):  # removed in pandas 3.0
+    warnings.filterwarnings('ignore', category=pd.errors.SettingWithCopyWarning)
+
+# Column names used in anomaly.csv
+transaction_amount_col = 'Transaction Amount'
+land_area_col = 'Land Area (sq.m)'
+market_value_col = 'Market Value'
+transaction_date_col = 'Transaction Date'
+parcel_id_col = 'Parcel ID'
+
+numeric_cols = [transaction_amount_col, land_area_col, market_value_col]
+
+
+def clean_transactions(data, medians=None, drop_duplicates=True, drop_unscorable=True):
+    """Deduplicate, fill gaps, parse dates and drop rows that can't be scored.
+
+    The streaming pipeline (anomaly_stream.py) dedupes across chunks itself and
+    passes in medians estimated over the whole file. The rule pre-screen
+    (prescreen_rules.py) keeps the rows with no positive amount or area, to
+    report them rather than drop them silently: pass drop_unscorable=False.
+    """
+    # Remove duplicates
+    if drop_duplicates:
+        data = data.drop_duplicates()
+
+    # Handle missing values with the column medians
+    if medians is None:
+        medians = {col: data[col].median() for col in numeric_cols}
+    data = data.fillna(medians)
+
+    # Convert date columns to datetime - specifying dayfirst=True to fix the warning
+    if not pd.api.types.is_datetime64_dtype(data[transaction_date_col]):
+        data[transaction_date_col] = pd.to_datetime(data[transaction_date_col], dayfirst=True, errors='coerce')
+
+    # Remove rows with invalid dates
+    data = data.dropna(subset=[transaction_date_col])
+
+    # Ensure numeric columns are correct type
+    for col in numeric_cols:
+        data[col] = pd.to_numeric(data[col], errors='coerce')
+
+    # Remove rows with zero or negative values in critical columns
+    return data[scorable_mask(data)] if drop_unscorable else data
+
+
+def scorable_mask(data):
+    """Rows with a positive amount and area, the only ones the model is fitted on"""
+    return ((data[transaction_amount_col] > 0) & (data[land_area_col] > 0)).to_numpy()
+
+
+def add_price_features(data):
+    """price_per_sqm and price_ratio, which only depend on the row itself"""
+    data['price_per_sqm'] = data[transaction_amount_col] / data[land_area_col]
+
+    # Ratio of transaction amount to market value
+    data['price_ratio'] = data[transaction_amount_col] / data[market_value_col]
+    return data
+
+
+def add_features(data):
+    """Add the model features (see feature_encoding.ANOMALY_FEATURES)"""
+    data = add_price_features(data)
+
+    # Days since previous transaction on same parcel
+    data = data.sort_values([parcel_id_col, transaction_date_col])
+    data['prev_date'] = data.groupby(parcel_id_col)[transaction_date_col].shift(1)
+    data['days_since_prev'] = (data[transaction_date_col] - data['prev_date']).dt.days.fillna(0)
+    return data
+
+
+def load_transactions(path='anomaly.csv', keep_unscorable=False):
+    """Read (via the Parquet cache), clean and featurize a transaction file.
+
+    With keep_unscorable the rows clean_transactions would drop are appended
+    with price features only (days_since_prev is NaN), so days_since_prev on
+    the other rows is the same as in training.
+    """
+    data = clean_transactions(read_transactions(path), drop_unscorable=not keep_unscorable)
+    if not keep_unscorable:
+        return add_features(data)
+    scorable = scorable_mask(data)
+    return pd.concat([add_features(data[scorable]), add_price_features(data[~scorable].copy())])
+
+
+def feature_matrix(data, features=ANOMALY_FEATURES):
+    """The model input columns, in training order"""
+    return data[list(features)].copy()
@@ -0,0 +1,213 @@
+"""Chunked, bounded-memory version of the anomaly_detect.py batch pipeline.
+
+The input (CSV with explicit dtypes, Parquet or Arrow IPC) is read twice in chunks:
+
+1. Column medians for fillna are estimated with QuantileSketch (log-bucket
+   histograms, ~1% relative error) instead of holding every value.
+2. Each chunk is deduplicated against HashedKeySet, cleaned, featurized and
+   scored with a pre-fitted model artifact, then appended to the output file
+   (Parquet row groups, Arrow IPC batches or CSV, by file extension).
+
+days_since_prev is computed within the chunk and carried across chunks through
+a parcel -> last-seen-date map. This is exact when each parcel's
+transactions appear in date order across chunks, as in a chronological
+registry export.
+
+Memory is bounded by the chunk size plus per-key state: 8 bytes per distinct
+row for deduplication (skip it with dedupe=False) and one date per parcel.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from anomaly_pipeline import (add_price_features, clean_transactions, numeric_cols, parcel_id_col,
+                              scorable_mask, transaction_date_col)
+from columnar_cache import TRANSACTION_DTYPES, TableWriter, iter_chunks
+from feature_encoding import predict_rows
+from prescreen_rules import MODEL, OUTCOMES, prescreen_and_score
+
+class QuantileSketch:
+    """Streaming quantile estimate with bounded relative error (DDSketch-style).
+
+    Positive values are counted in logarithmic buckets of width log(gamma), so
+    any quantile is returned within relative_accuracy of a true sample value
+    while memory grows only with the log of the value range.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._positive = {}
+        self._negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _add_buckets(self, buckets, values):
+        keys, counts = np.unique(np.ceil(np.log(values) / self._log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + count
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.zeros += int(np.count_nonzero(values == 0))
+        if (values > 0).any():
+            self._add_buckets(self._positive, values[values > 0])
+        if (values < 0).any():
+            self._add_buckets(self._negative, -values[values < 0])
+
+    def _bucket_value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > rank:
+                return -self._bucket_value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > rank:
+                return self._bucket_value(key)
+        return self._bucket_value(max(self._positive))
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+class HashedKeySet:
+    """Set of 64-bit row hashes, kept as a few sorted NumPy runs (8 bytes per key)"""
+
+    def __init__(self):
+        self._runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    def _contains(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self._runs:
+            pos = np.searchsorted(run, keys)
+            pos[pos == len(run)] = 0
+            found |= run[pos] == keys
+        return found
+
+    def add_new(self, keys):
+        """Add keys and return a mask of the ones not seen before (first occurrence wins)"""
+        unique, first = np.unique(keys, return_index=True)
+        new = ~self._contains(unique)
+        mask = np.zeros(len(keys), dtype=bool)
+        mask[first[new]] = True
+        if new.any():
+            self._runs.append(unique[new])
+            # Merge runs of similar size, keeping O(log n) runs to search
+            while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+                last = self._runs.pop()
+                self._runs[-1] = np.sort(np.concatenate([self._runs[-1], last]))
+        return mask
+
+
+def read_chunks(path, chunksize):
+    return iter_chunks(path, chunksize, dtypes=TRANSACTION_DTYPES)
+
+
+def dedupe(chunk, seen):
+    keys = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    return chunk[seen.add_new(keys)]
+
+
+def estimate_medians(path, chunksize, dedupe_rows=True):
+    """First pass: approximate fillna medians over the deduplicated file"""
+    sketches = {col: QuantileSketch() for col in numeric_cols}
+    seen = HashedKeySet()
+    for chunk in read_chunks(path, chunksize):
+        if dedupe_rows:
+            chunk = dedupe(chunk, seen)
+        for col, sketch in sketches.items():
+            sketch.update(chunk[col].to_numpy(dtype=np.float64, na_value=np.nan))
+    return {col: sketch.median() for col, sketch in sketches.items()}
+
+
+def add_stream_features(chunk, last_seen):
+    """anomaly_pipeline.add_features for one chunk, carrying each parcel's last date across chunks.
+
+    Returns the featurized chunk (in its original row order) and how many rows
+    were older than an earlier chunk's last date for the same parcel.
+    """
+    chunk = add_price_features(chunk)
+    chunk = chunk.sort_values([parcel_id_col, transaction_date_col], kind='stable')
+    prev = chunk.groupby(parcel_id_col)[transaction_date_col].shift(1)
+    carried = pd.to_datetime(chunk[parcel_id_col].map(last_seen).astype(object)).astype(prev.dtype)
+    prev = prev.fillna(carried)
+    days = (chunk[transaction_date_col] - prev).dt.days.fillna(0)
+    out_of_order = int((days < 0).sum())
+    chunk['days_since_prev'] = days.clip(lower=0)
+
+    for parcel, day in chunk.groupby(parcel_id_col)[transaction_date_col].max().items():
+        if parcel not in last_seen or day > last_seen[parcel]:
+            last_seen[parcel] = day
+    return chunk.sort_index(), out_of_order
+
+
+def score_stream(model, features, input_path, output_path, chunksize=100_000, dedupe_rows=True, geo=None,
+                 rules=None):
+    """Score a transaction file chunk by chunk with a fitted model and write the results to output_path.
+
+    geo is the GeoIndex the model was trained with, if it uses neighbourhood
+    features. With pre-screen rules (prescreen_rules.py), rows without a
+    positive amount or area are kept and reported instead of dropped, and
+    only the rows no rule decides are passed to the model.
+    """
+    medians = estimate_medians(input_path, chunksize, dedupe_rows)
+
+    seen = HashedKeySet()
+    last_seen = {}
+    summary = {'rows': 0, 'duplicates': 0, 'dropped': 0, 'scored': 0, 'anomalies': 0, 'out_of_order': 0,
+               'medians': medians, 'model_rows': 0, 'prescreen': dict.fromkeys(OUTCOMES, 0)}
+
+    with TableWriter(output_path) as writer:
+        for chunk in read_chunks(input_path, chunksize):
+            summary['rows'] += len(chunk)
+            if dedupe_rows:
+                deduped = dedupe(chunk, seen)
+                summary['duplicates'] += len(chunk) - len(deduped)
+                chunk = deduped
+            cleaned = clean_transactions(chunk, medians=medians, drop_duplicates=False,
+                                         drop_unscorable=rules is None)
+            summary['dropped'] += len(chunk) - len(cleaned)
+            if cleaned.empty:
+                continue
+
+            # Rows kept only for the pre-screen get price features but no place in the parcel history
+            scorable = scorable_mask(cleaned)
+            scored, out_of_order = add_stream_features(cleaned[scorable].copy(), last_seen)
+            if not scorable.all():
+                scored = pd.concat([scored, add_price_features(cleaned[~scorable].copy())]).sort_index()
+            summary['out_of_order'] += out_of_order
+            if geo is not None:
+                scored = geo.add_features(scored)
+            if rules is None:
+                scored['anomaly_score'] = predict_rows(model, scored[features].to_numpy(dtype=np.float64))
+                scored['is_anomaly'] = scored['anomaly_score'] == -1
+                summary['model_rows'] += len(scored)
+            else:
+                scored = prescreen_and_score(model, features, scored, rules)
+                for outcome, count in scored['prescreen'].value_counts().items():
+                    summary['prescreen'][outcome] += int(count)
+                summary['model_rows'] += int((scored['prescreen'] == MODEL).sum())
+            summary['scored'] += len(scored)
+            summary['anomalies'] += int(scored['is_anomaly'].sum())
+
+            writer.write(scored)
+    return summary
@@ -1,116 +1,243 @@
-import pandas as pd
-import numpy as np
 import joblib
+import json
 import os
-import pickle
+from collections import namedtuple
 from flask import Flask, request, render_template, jsonify
 
+from feature_encoding import ValuationEncoder, predict_rows
+from forest_engine import CompiledForest
+from jobs import JobStore, JobWorkers, jobs_blueprint
+from metrics import counter, error_response, instrument, stage
+from model_artifact import LAND_MODEL_DIR, VALUATION_SURFACE_DIR, load_estimator, load_land_artifact
+from model_registry import ModelRegistry, admin_blueprint
+from prediction_cache import PredictionCache, canonical_inputs, parse_inputs
+from valuation_surface import ValuationSurface
+
 app = Flask(__name__)
+# Per-stage latency, request counts and GET /metrics (see metrics.py)
+instrument(app, 'land')
+
+# Inference engine: 'compiled' walks the memory-mapped node tables of the model
+# artifact, 'sklearn' unpickles the fitted estimator stored next to them
+MODEL_ENGINE = os.getenv('LAND_MODEL_ENGINE', 'compiled')
+if MODEL_ENGINE not in ('compiled', 'sklearn'):
+    raise ValueError(f"Unknown LAND_MODEL_ENGINE {MODEL_ENGINE!r} (expected 'compiled' or 'sklearn')")
+# The compiled engine is faster for small batches only; larger ones always run on scikit-learn
+COMPILED_MAX_ROWS = int(os.getenv('COMPILED_MAX_ROWS', '1000'))
+
+# The active model and everything derived from it, swapped as one unit on reload;
+# batch_model is the scikit-learn estimator used for batches above COMPILED_MAX_ROWS
+LandModel = namedtuple('LandModel', ['version', 'model', 'encoder', 'locations', 'property_types', 'feature_columns',
+                                     'batch_model'])
+
+
+def load_land_model(version=None):
+    """Load an artifact version into a LandModel bundle"""
+    artifact = load_land_artifact(version=version)
+    estimator = load_estimator(artifact)
+    model = artifact.forest if MODEL_ENGINE == 'compiled' else estimator
+    encoder = ValuationEncoder(artifact.feature_columns, artifact.locations, artifact.property_types)
+    engine = 'compiled' if isinstance(model, CompiledForest) else 'sklearn'
+    print(f"Loaded land model artifact {artifact.version} ({engine} engine)")
+    return LandModel(artifact.version, model, encoder, artifact.locations, artifact.property_types,
+                     artifact.feature_columns, estimator)
+
+
+def load_legacy_model():
+    """Legacy pickle written by older versions of land_valuation.py"""
+    print("Model artifact not found, loading legacy land_model.pkl...")
+    model_data = joblib.load('land_model.pkl')
+    estimator = model = model_data['model']
+    if MODEL_ENGINE == 'compiled':
+        model = CompiledForest.from_estimator(model)
+    encoder = ValuationEncoder(model_data['feature_columns'], model_data['locations'], model_data['property_types'])
+    return LandModel(f"legacy-{os.path.getmtime('land_model.pkl'):.0f}", model, encoder, model_data['locations'],
+                     model_data['property_types'], model_data['feature_columns'], estimator)
+
+
+# Single-parcel valuations, keyed on rounded inputs and the model version (PREDICTION_CACHE=0 disables it)
+prediction_cache = PredictionCache() if os.getenv('PREDICTION_CACHE', '1') != '0' else None
+
+
+def on_model_swap(bundle):
+    if prediction_cache is not None:
+        prediction_cache.set_version(bundle.version)
 
-# Load the trained model and preprocessing info
+
+# Load the trained model and preprocessing info; new artifact versions are picked up while running
+try:
+    registry = ModelRegistry(LAND_MODEL_DIR, load_land_model, on_swap=on_model_swap)
+    app.register_blueprint(admin_blueprint(registry))
+except FileNotFoundError:
+    if not os.path.exists('land_model.pkl'):
+        raise RuntimeError("No land model artifact found. Train one with `python land_valuation.py`.")
+    registry = None
+    legacy_model = load_legacy_model()
+on_model_swap(registry.current if registry is not None else legacy_model)
+
+# Precomputed valuations for /quote (see valuation_surface.py), hot-reloaded like the model; a
+# surface is only used while the model version it was built from is active
 try:
-    if os.path.exists('land_model.pkl'):
-        # Try different loading approaches
-        try:
-            # First try joblib
-            model_data = joblib.load('land_model.pkl')
-            # Test if it's a dictionary with expected keys
-            if not isinstance(model_data, dict) or 'model' not in model_data:
-                # If it's just the model itself, adapt
-                print("Model format is different than expected, adapting...")
-                model = model_data  # The loaded object is the model itself
-                # Load metadata separately if possible
-                original_data = pd.read_csv("land_data.csv")
-                locations = list(original_data['Location'].unique())
-                property_types = list(original_data['Property_Type'].unique())
-            else:
-                # It's as expected
-                model = model_data['model']
-                locations = model_data['locations']
-                property_types = model_data['property_types']
-                feature_columns = model_data['feature_columns']
-        except:
-            # If joblib fails, try pickle
-            with open('land_model.pkl', 'rb') as f:
-                model_data = pickle.load(f)
-            model = model_data['model']
-            locations = model_data['locations']
-            property_types = model_data['property_types']
-            feature_columns = model_data['feature_columns']
-    else:
-        # If model doesn't exist, run the training script
-        print("Model not found. Training model...")
-        import subprocess
-        subprocess.run(['python', 'land_valuation.py'])
-        model_data = joblib.load('land_model.pkl')
-        model = model_data['model']
-        locations = model_data['locations']
-        property_types = model_data['property_types']
-        feature_columns = model_data['feature_columns']
-except Exception as e:
-    print(f"Error loading model: {str(e)}")
-    raise
+    surface_registry = ModelRegistry(VALUATION_SURFACE_DIR, lambda version: ValuationSurface.load(version=version))
+except FileNotFoundError:
+    surface_registry = None
+quotes_total = counter('ml_quotes_total', 'Fast quotes by where the price came from', ['source'])
+
+# Bulk revaluation of uploaded files: POST /jobs, then poll and download (see jobs.py)
+job_store = JobStore()
+app.register_blueprint(jobs_blueprint(job_store, 'land', JobWorkers(job_store, ['land'])))
+
+
+def active_model():
+    """The LandModel this request should use from start to finish"""
+    if registry is None:
+        return legacy_model
+    registry.ensure_watching()
+    return registry.current
+
+
+def active_surface(bundle):
+    """The valuation surface built from this bundle's model version, if one is loaded"""
+    if surface_registry is None:
+        return None
+    surface_registry.ensure_watching()
+    surface = surface_registry.current
+    return surface if surface.model_version == bundle.version else None
+
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '100000'))
+
+# ML_JSON_ONLY=1 answers every route with JSON and never renders a template
+JSON_ONLY = os.getenv('ML_JSON_ONLY', '0') == '1'
+
+
+def parse_batch_records(req):
+    """Read a list of records from a JSON array or an NDJSON body"""
+    if req.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        body = req.get_data(as_text=True)
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    records = req.get_json(silent=True)
+    if isinstance(records, dict):
+        records = records.get('records')
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON array of records")
+    return records
+
+
+def value_parcel(bundle, location, property_type, area_sqft, proximity_to_highway, land_quality):
+    """Predicted price of one parcel"""
+    # Encode straight into a feature row laid out like the training columns
+    with stage('encode'):
+        features = bundle.encoder.encode_one(location, property_type, area_sqft, proximity_to_highway, land_quality)
+    with stage('predict'):
+        return float(predict_rows(bundle.model, features)[0])
+
 
 @app.route('/')
 def home():
-    return render_template('index.html', locations=locations, property_types=property_types)
+    bundle = active_model()
+    if JSON_ONLY:
+        return jsonify({"locations": list(bundle.locations), "property_types": list(bundle.property_types)})
+    with stage('render'):
+        return render_template('index.html', locations=bundle.locations, property_types=bundle.property_types)
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    # Get input values from form
-    location = request.form.get('location')
-    area_sqft = float(request.form.get('area_sqft'))
-    property_type = request.form.get('property_type')
-    proximity_to_highway = float(request.form.get('proximity_to_highway'))
-    land_quality = int(request.form.get('land_quality'))
-    
-    # Create a dataframe with the input data
-    input_data = {
-        'Area_SqFt': [area_sqft],
-        'Proximity_to_Highway_km': [proximity_to_highway],
-        'Land_Quality_Rating': [land_quality],
-        'Location': [location],
-        'Property_Type': [property_type]
-    }
-    
-    # Create dataframe and perform one-hot encoding exactly as in training
-    input_df = pd.DataFrame(input_data)
-    input_df = pd.get_dummies(input_df, columns=['Location', 'Property_Type'], drop_first=True)
-    
-    # Get the expected features
-    if 'feature_columns' in locals() or 'feature_columns' in globals():
-        expected_columns = feature_columns  
-    else:
-        # Fallback to load from training data
-        training_data = pd.read_csv("land_data.csv")
-        training_df = pd.get_dummies(training_data, columns=['Location', 'Property_Type'], drop_first=True)
-        expected_columns = ['Area_SqFt', 'Proximity_to_Highway_km', 'Land_Quality_Rating'] + [
-            col for col in training_df.columns if col.startswith('Location_') or col.startswith('Property_Type_')
-        ]
-    
-    # Ensure all expected columns are present (with 0 for missing ones)
-    for col in expected_columns:
-        if col not in input_df.columns:
-            input_df[col] = 0
-    
-    # Remove any extra columns not seen during training
-    input_df = input_df[expected_columns]
-    
-    # Make prediction
-    prediction = model.predict(input_df)[0]
+    bundle = active_model()
+
+    try:
+        with stage('parse'):
+            # Get input values from the form, or from a JSON body with the same field names
+            data = request.get_json(silent=True) if request.is_json else request.form
+            if not data:
+                return error_response("Invalid input format: expected form fields or a JSON object", 'missing_body')
+            inputs = parse_inputs(data.get('location'), data.get('property_type'), data.get('area_sqft'),
+                                  data.get('proximity_to_highway'), data.get('land_quality'))
+            location, property_type, area_sqft, proximity_to_highway, land_quality = inputs
+
+        # Make prediction; only the cache key is rounded, the model sees the values as sent
+        if prediction_cache is not None:
+            prediction = prediction_cache.get_or_compute(canonical_inputs(*inputs),
+                                                         lambda: value_parcel(bundle, *inputs),
+                                                         version=bundle.version)
+        else:
+            prediction = value_parcel(bundle, *inputs)
+    except (ValueError, TypeError) as e:
+        return error_response("Invalid input format: " + str(e), type(e).__name__)
     
     # Format prediction as currency
     formatted_prediction = f"₹{prediction:,.2f}"
+
+    if JSON_ONLY or request.is_json:
+        return jsonify({"prediction": float(prediction), "formatted": formatted_prediction,
+                        "model_version": bundle.version})
     
-    return render_template('index.html', 
-                          prediction=formatted_prediction,
-                          locations=locations,
-                          property_types=property_types,
-                          selected_location=location,
-                          area_sqft=area_sqft,
-                          selected_property_type=property_type,
-                          proximity_to_highway=proximity_to_highway,
-                          land_quality=land_quality)
+    with stage('render'):
+        return render_template('index.html', 
+                              prediction=formatted_prediction,
+                              locations=bundle.locations,
+                              property_types=bundle.property_types,
+                              selected_location=location,
+                              area_sqft=area_sqft,
+                              selected_property_type=property_type,
+                              proximity_to_highway=proximity_to_highway,
+                              land_quality=land_quality)
+
+@app.route('/quote', methods=['GET', 'POST'])
+def quote():
+    """Instant valuation from the precomputed surface, falling back to the model outside its grid"""
+    bundle = active_model()
+    try:
+        with stage('parse'):
+            data = request.args if request.method == 'GET' else (
+                request.get_json(silent=True) if request.is_json else request.form)
+            if not data:
+                return error_response("Invalid input format: expected query parameters, form fields or a JSON object",
+                                      'missing_body')
+            inputs = parse_inputs(data.get('location'), data.get('property_type'), data.get('area_sqft'),
+                                  data.get('proximity_to_highway'), data.get('land_quality'))
+
+        surface = active_surface(bundle)
+        prediction = None
+        if surface is not None:
+            with stage('lookup'):
+                prediction = surface.quote(*inputs)
+        source = 'surface' if prediction is not None else 'model'
+        if prediction is None:
+            prediction = value_parcel(bundle, *inputs)
+    except (ValueError, TypeError) as e:
+        return error_response("Invalid input format: " + str(e), type(e).__name__)
+
+    quotes_total.inc(source)
+    return jsonify({"prediction": float(prediction), "formatted": f"₹{prediction:,.2f}",
+                    "model_version": bundle.version, "source": source,
+                    "surface_version": surface.version if surface is not None else None})
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Value many parcels with a single model call"""
+    bundle = active_model()
+    try:
+        with stage('parse'):
+            records = parse_batch_records(request)
+        if len(records) > MAX_BATCH_SIZE:
+            return error_response(f"Batch too large (max {MAX_BATCH_SIZE} records)", 'batch_too_large', 413)
+        if not records:
+            return jsonify({"predictions": [], "count": 0})
+        with stage('encode'):
+            X = bundle.encoder.encode_many(records)
+    except ValueError as e:
+        return error_response("Invalid input format: " + str(e), 'ValueError')
+
+    with stage('predict'):
+        model = bundle.model if len(X) <= COMPILED_MAX_ROWS else bundle.batch_model
+        predictions = predict_rows(model, X)
+    return jsonify({"predictions": predictions.tolist(), "count": len(records)})
+
+@app.route('/cache/stats')
+def cache_stats():
+    if prediction_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(prediction_cache.stats(), enabled=True))
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
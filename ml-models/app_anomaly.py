@@ -1,79 +1,80 @@
-from flask import Flask, request, jsonify
-from sklearn.ensemble import IsolationForest
-import pandas as pd
+from flask import Flask, request, jsonify, render_template
 from datetime import datetime
+import os
+
+import numpy as np
+
+from feature_encoding import ANOMALY_FEATURES, encode_anomaly_row, predict_rows
+from geo_index import geo_index_for
+from jobs import JobStore, JobWorkers, jobs_blueprint
+from metrics import counter, error_response, instrument, stage, stage_laps
+from model_artifact import ANOMALY_MODEL_DIR, load_anomaly_artifact
+from model_registry import ModelRegistry, admin_blueprint
+from parcel_index import ParcelHistoryIndex, TransactionLog
 
 app = Flask(__name__)
+# Per-stage latency, request counts and GET /metrics (see metrics.py)
+instrument(app, 'anomaly')
+anomalies_flagged = counter('ml_anomalies_flagged_total', 'Transactions scored as anomalous', ['model_version'])
+
+
+# Geo index per loaded model version, for models trained with `train_anomaly.py --geo`
+geo_indexes = {}
+
+
+def load_anomaly_model(version=None):
+    """Load an anomaly artifact version, refusing one trained on other features"""
+    artifact = load_anomaly_artifact(version=version)
+    geo = geo_index_for(artifact)
+    expected = ANOMALY_FEATURES + (geo.feature_names if geo else [])
+    if artifact.features != expected:
+        raise RuntimeError(f"Anomaly model {artifact.version} expects features {artifact.features}, "
+                           f"but this service computes {expected}")
+    geo_indexes[artifact.version] = geo
+    print(f"Loaded anomaly model artifact {artifact.version}" + (f" with geo index {geo.version}" if geo else ""))
+    return artifact
+
 
-# Historical data for anomaly detection (you should replace this with real data)
-historical_data = pd.DataFrame({
-    "price_per_sqm": [3000, 3200, 3100, 2900, 3050, 4500, 10000],
-    "price_ratio": [0.9, 1.0, 1.1, 0.95, 1.2, 1.0, 1.8],
-    "days_since_prev": [365, 180, 400, 220, 300, 60, 10]
-})
+# Load the model fitted by train_anomaly.py on the transaction history;
+# versions published later by train_anomaly.py are picked up while running
+try:
+    registry = ModelRegistry(ANOMALY_MODEL_DIR, load_anomaly_model)
+except FileNotFoundError:
+    raise RuntimeError("No anomaly model artifact found. Train one with `python train_anomaly.py`.")
+app.register_blueprint(admin_blueprint(registry))
 
-# Train the model on startup
-model = IsolationForest(contamination=0.2, random_state=42)
-model.fit(historical_data)
+# Bulk scoring of uploaded transaction files: POST /jobs, then poll and download (see jobs.py)
+job_store = JobStore()
+app.register_blueprint(jobs_blueprint(job_store, 'anomaly', JobWorkers(job_store, ['anomaly'])))
+
+# Transaction dates per parcel, so days_since_prev is derived here rather than
+# typed in by the caller. Checks only read it; recorded transactions come in
+# through POST /transactions and the shared TransactionLog (see parcel_index.py).
+HISTORY_PATH = os.getenv('ANOMALY_HISTORY', 'anomaly.csv')
+# Seconds between reads of the log, so other workers' recorded transactions show up
+HISTORY_SYNC_INTERVAL = float(os.getenv('HISTORY_SYNC_INTERVAL', '1'))
+# POST /transactions is refused unless this is set and sent as X-Ingest-Token
+INGEST_TOKEN = os.getenv('HISTORY_INGEST_TOKEN')
+parcel_history = ParcelHistoryIndex.from_file(HISTORY_PATH) if os.path.exists(HISTORY_PATH) else ParcelHistoryIndex()
+transaction_log = TransactionLog()
+parcel_history.sync(transaction_log)
+print(f"Indexed {parcel_history.n_transactions} transactions on {len(parcel_history)} parcels")
+
+# ML_JSON_ONLY=1 answers every route with JSON and never renders a template
+JSON_ONLY = os.getenv('ML_JSON_ONLY', '0') == '1'
 
 @app.route("/", methods=["GET", "POST"])
 def check_fraud():
+    registry.ensure_watching()
     if request.method == "GET":
         # Return a simple form without predefined values
-        return """
-        <html>
-        <head>
-            <title>Land Transaction Anomaly Check</title>
-            <style>
-                body { font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; }
-                .form-group { margin-bottom: 15px; }
-                label { display: block; margin-bottom: 5px; font-weight: bold; }
-                input { width: 100%; padding: 8px; box-sizing: border-box; }
-                button { background-color: #4CAF50; color: white; padding: 10px 15px; border: none; cursor: pointer; }
-                button:hover { background-color: #45a049; }
-            </style>
-        </head>
-        <body>
-            <h1>Land Transaction Anomaly Detection</h1>
-            <p>Enter transaction details to check for potential anomalies:</p>
-            
-            <form method="post" action="/">
-                <div class="form-group">
-                    <label for="parcel_id">Parcel ID:</label>
-                    <input type="text" id="parcel_id" name="parcel_id" placeholder="e.g., P123456" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="transaction_date">Transaction Date:</label>
-                    <input type="date" id="transaction_date" name="transaction_date" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="sale_price">Sale Price (₹):</label>
-                    <input type="number" id="sale_price" name="sale_price" placeholder="e.g., 350000" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="market_value">Market Value (₹):</label>
-                    <input type="number" id="market_value" name="market_value" placeholder="e.g., 320000" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="land_area">Land Area (sq.m):</label>
-                    <input type="number" id="land_area" name="land_area" placeholder="e.g., 100" step="0.01" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="days_since_prev">Days Since Previous Transaction:</label>
-                    <input type="number" id="days_since_prev" name="days_since_prev" placeholder="e.g., 180" value="0">
-                </div>
-                
-                <button type="submit">Check Transaction</button>
-            </form>
-        </body>
-        </html>
-        """
+        if JSON_ONLY:
+            return jsonify({"fields": ["parcel_id", "transaction_date", "sale_price", "market_value", "land_area",
+                                       "latitude", "longitude"]})
+        with stage('render'):
+            return render_template("anomaly_form.html")
     else:  # POST request
+        lap = stage_laps()
         # Fix the data handling to properly handle forms
         if request.is_json:
             data = request.json
@@ -87,110 +88,136 @@ def check_fraud():
             sale_price = data.get("sale_price")
             market_value = data.get("market_value")
             land_area = data.get("land_area")
-            days_since_prev = data.get("days_since_prev", "0")
 
             # Convert to appropriate types with validation
+            if not parcel_id:
+                return error_response("Parcel ID is required", 'missing_field')
+            parcel_id = str(parcel_id).strip()
+
             if not transaction_date:
-                return jsonify({"error": "Transaction date is required"}), 400
+                return error_response("Transaction date is required", 'missing_field')
             
             transaction_date = datetime.strptime(transaction_date, "%Y-%m-%d")
             
             try:
                 sale_price = float(sale_price)
                 if sale_price <= 0:
-                    return jsonify({"error": "Sale price must be positive"}), 400
+                    return error_response("Sale price must be positive", 'non_positive')
             except (ValueError, TypeError):
-                return jsonify({"error": "Invalid sale price"}), 400
+                return error_response("Invalid sale price", 'invalid_number')
                 
             try:
                 market_value = float(market_value)
                 if market_value <= 0:
-                    return jsonify({"error": "Market value must be positive"}), 400
+                    return error_response("Market value must be positive", 'non_positive')
             except (ValueError, TypeError):
-                return jsonify({"error": "Invalid market value"}), 400
+                return error_response("Invalid market value", 'invalid_number')
                 
             try:
                 land_area = float(land_area)
                 if land_area <= 0:
-                    return jsonify({"error": "Land area must be positive"}), 400
+                    return error_response("Land area must be positive", 'non_positive')
             except (ValueError, TypeError):
-                return jsonify({"error": "Invalid land area"}), 400
-                
+                return error_response("Invalid land area", 'invalid_number')
+
+            # Optional; without them the parcel's indexed location is used
+            latitude = data.get("latitude")
+            longitude = data.get("longitude")
             try:
-                days_since_prev = float(days_since_prev)
+                latitude = float(latitude) if latitude not in (None, "") else None
+                longitude = float(longitude) if longitude not in (None, "") else None
             except (ValueError, TypeError):
-                days_since_prev = 0
+                return error_response("Invalid coordinates", 'invalid_number')
+            lap('parse')
+
+            # Look up the parcel's previous transaction instead of trusting the client
+            parcel_history.sync(transaction_log, max_age=HISTORY_SYNC_INTERVAL)
+            days_since_prev = float(parcel_history.days_since_prev(parcel_id, transaction_date))
+            lap('history')
 
             # Calculate features
             price_per_sqm = sale_price / land_area
             price_ratio = sale_price / market_value
 
             # Predict using the trained model
-            feature_df = pd.DataFrame([[price_per_sqm, price_ratio, days_since_prev]],
-                                      columns=["price_per_sqm", "price_ratio", "days_since_prev"])
-            prediction = model.predict(feature_df)[0]
-            is_anomaly = prediction == -1
+            features = encode_anomaly_row(price_per_sqm, price_ratio, days_since_prev)
+            active = registry.current
+            geo = geo_indexes.get(active.version)
+            if geo is not None:
+                if latitude is None or longitude is None:
+                    latitude, longitude = geo.parcel_location(parcel_id)
+                features = np.hstack([features, geo.features([latitude], [longitude], [price_per_sqm], [parcel_id])])
+            lap('encode')
+            prediction = predict_rows(active.model, features)[0]
+            is_anomaly = bool(prediction == -1)
+            lap('predict')
+            if is_anomaly:
+                anomalies_flagged.inc(active.version)
 
             # For API requests
-            if request.is_json:
-                return jsonify({
-                    "risk_level": "High Risk" if is_anomaly else "Low Risk",
+            risk_level = "High Risk" if is_anomaly else "Low Risk"
+            if JSON_ONLY or request.is_json:
+                response = {
+                    "risk_level": risk_level,
                     "parcel_id": parcel_id,
                     "price_per_sqm": round(price_per_sqm, 2),
                     "price_ratio": round(price_ratio, 2),
                     "days_since_prev": days_since_prev,
-                    "is_anomaly": is_anomaly
-                })
+                    "is_anomaly": is_anomaly,
+                    "model_version": active.version
+                }
+                if geo is not None:
+                    response.update((name, round(float(value), 2))
+                                    for name, value in zip(geo.feature_names, features[0, len(ANOMALY_FEATURES):]))
+                return jsonify(response)
             # For form submissions, return HTML response
-            else:
-                risk_color = "#ffdddd" if is_anomaly else "#ddffdd"
-                risk_level = "High Risk" if is_anomaly else "Low Risk"
-                
-                return f"""
-                <html>
-                <head>
-                    <title>Anomaly Detection Result</title>
-                    <style>
-                        body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; }}
-                        .result {{ background-color: {risk_color}; padding: 20px; border-radius: 5px; margin-bottom: 20px; }}
-                        .back-button {{ background-color: #4CAF50; color: white; padding: 10px 15px; 
-                                      border: none; text-decoration: none; display: inline-block; }}
-                        table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
-                        th, td {{ padding: 8px; text-align: left; border-bottom: 1px solid #ddd; }}
-                        th {{ background-color: #f2f2f2; }}
-                    </style>
-                </head>
-                <body>
-                    <h1>Transaction Analysis Result</h1>
-                    
-                    <div class="result">
-                        <h2>Risk Assessment: {risk_level}</h2>
-                        <p>This transaction has been flagged as {"suspicious" if is_anomaly else "normal"}.</p>
-                    </div>
-                    
-                    <h3>Transaction Details:</h3>
-                    <table>
-                        <tr><th>Parcel ID</th><td>{parcel_id}</td></tr>
-                        <tr><th>Transaction Date</th><td>{transaction_date.strftime('%Y-%m-%d')}</td></tr>
-                        <tr><th>Sale Price</th><td>₹{sale_price:,.2f}</td></tr>
-                        <tr><th>Market Value</th><td>₹{market_value:,.2f}</td></tr>
-                        <tr><th>Land Area</th><td>{land_area:,.2f} sq.m</td></tr>
-                        <tr><th>Price per sq.m</th><td>₹{price_per_sqm:,.2f}</td></tr>
-                        <tr><th>Price to Market Ratio</th><td>{price_ratio:.2f}</td></tr>
-                        <tr><th>Days Since Previous</th><td>{int(days_since_prev)}</td></tr>
-                    </table>
-                    
-                    <p><a href="/" class="back-button">Check Another Transaction</a></p>
-                </body>
-                </html>
-                """
+            with stage('render'):
+                return render_template("anomaly_result.html", risk_level=risk_level, is_anomaly=is_anomaly,
+                                       parcel_id=parcel_id, transaction_date=transaction_date,
+                                       sale_price=sale_price, market_value=market_value, land_area=land_area,
+                                       price_per_sqm=price_per_sqm, price_ratio=price_ratio,
+                                       days_since_prev=days_since_prev)
 
         except ValueError as e:
-            return jsonify({"error": "Invalid input format: " + str(e)}), 400
+            return error_response("Invalid input format: " + str(e), 'ValueError')
         except ZeroDivisionError:
-            return jsonify({"error": "Cannot divide by zero"}), 400
+            return error_response("Cannot divide by zero", 'ZeroDivisionError')
         except Exception as e:
-            return jsonify({"error": "Unexpected error: " + str(e)}), 500
+            return error_response("Unexpected error: " + str(e), type(e).__name__, 500)
+
+@app.route("/transactions", methods=["POST"])
+def record_transactions():
+    """Add registered transactions to the parcel history: a JSON object or a list of them"""
+    if not INGEST_TOKEN:
+        return error_response("Recording transactions is disabled; set HISTORY_INGEST_TOKEN", 'disabled', 403)
+    if request.headers.get('X-Ingest-Token') != INGEST_TOKEN:
+        return error_response("Invalid or missing X-Ingest-Token", 'unauthorized', 401)
+    records = request.get_json(silent=True)
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list) or not records:
+        return error_response("Expected a JSON object or a non-empty array of objects", 'missing_body')
+
+    transactions = []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            return error_response(f"Record {i}: expected an object", 'ValueError')
+        parcel_id = str(record.get("parcel_id") or "").strip()
+        registration_no = str(record.get("registration_no") or "").strip()
+        if not parcel_id or not registration_no:
+            return error_response(f"Record {i}: parcel_id and registration_no are required", 'missing_field')
+        try:
+            transaction_date = datetime.strptime(str(record.get("transaction_date")), "%Y-%m-%d")
+        except ValueError:
+            return error_response(f"Record {i}: transaction_date must be YYYY-MM-DD", 'ValueError')
+        transactions.append((registration_no, parcel_id, transaction_date))
+
+    # Already in the index (e.g. from the history file) or in the log counts as a duplicate
+    added = sum(not parcel_history.known(key) and transaction_log.append(key, parcel_id, day)
+                for key, parcel_id, day in transactions)
+    parcel_history.sync(transaction_log)
+    return jsonify({"added": added, "duplicates": len(transactions) - added})
+
 
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
\ No newline at end of file
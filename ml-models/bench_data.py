@@ -0,0 +1,155 @@
+"""Synthetic land_data.csv / anomaly.csv files of any size for benchmark.py.
+
+    python bench_data.py land --rows 1000000 --output land_1m.parquet
+    python bench_data.py transactions --rows 10000000 --output tx_10m.parquet
+
+Rows are bootstrapped from the real files and then perturbed, so the columns,
+dtypes, categories and value ranges match what the pipelines expect:
+
+- land: a random real row, with area, highway distance and quality jittered and
+  the price scaled by the new area.
+- transactions: about 8 transactions per parcel, as in anomaly.csv. Each
+  synthetic parcel keeps one template row's area, land use, tenure and
+  location. Amounts are market value times a sale/market ratio drawn from the
+  real file, which keeps its zero-amount gifts and its over- and under-priced
+  sales. Dates are day-first strings between 2015 and 2024.
+
+Output is the same for a given --rows and --seed. It is written in chunks of
+CHUNK_ROWS, so memory stays bounded at 10^7 rows. ensure_dataset() caches
+generated files under bench_data/.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import (HAVE_PYARROW, LAND_DATA_DTYPES, TRANSACTION_DTYPES, TableWriter, coerce_numeric,
+                            csv_dtypes)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.getenv('BENCH_DATA_DIR', os.path.join(BASE_DIR, 'bench_data'))
+CHUNK_ROWS = 1_000_000
+TX_PER_PARCEL = 8
+
+DATE_RANGE = (np.datetime64('2015-01-01'), np.datetime64('2025-01-01'))
+
+
+def _load(name, dtypes):
+    return coerce_numeric(pd.read_csv(os.path.join(BASE_DIR, name), dtype=csv_dtypes(dtypes)), dtypes)
+
+
+def _rng(seed, *key):
+    """Independent stream per (seed, key), so a chunk's rows don't depend on which chunks came before"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+
+def land_chunk(template, start, rows, seed):
+    """Rows [start, start + rows) of a synthetic land_data.csv"""
+    rng = _rng(seed, 1, start)
+    base = template.iloc[rng.integers(len(template), size=rows)].reset_index(drop=True)
+    area = np.round(base['Area_SqFt'].to_numpy() * rng.lognormal(0, 0.2, rows), -1).clip(min=100)
+    proximity = np.round(base['Proximity_to_Highway_km'].to_numpy() + rng.normal(0, 0.3, rows), 1).clip(min=0.1)
+    quality = base['Land_Quality_Rating'].to_numpy() + rng.choice([-1, 0, 0, 0, 0, 0, 0, 0, 0, 1], rows)
+    price = base['Price_INR'].to_numpy() * area / base['Area_SqFt'].to_numpy() * rng.lognormal(0, 0.1, rows)
+    return pd.DataFrame({
+        'Location': base['Location'],
+        'Area_SqFt': area,
+        'Property_Type': base['Property_Type'],
+        'Proximity_to_Highway_km': proximity,
+        'Land_Quality_Rating': quality.clip(1, 5).astype('int64'),
+        'Price_INR': np.round(price, -3),
+    }).astype(LAND_DATA_DTYPES)
+
+
+class TransactionGenerator:
+    """Chunks of a synthetic anomaly.csv whose parcels stay consistent across chunks"""
+
+    def __init__(self, template, rows, seed):
+        self.template = template.reset_index(drop=True)
+        self.seed = seed
+        self.n_parcels = max(1, rows // TX_PER_PARCEL)
+        rng = _rng(seed, 0)
+        # Per-parcel template row and market value drift
+        self.parcel_template = rng.integers(len(self.template), size=self.n_parcels)
+        self.parcel_value = rng.lognormal(0, 0.3, self.n_parcels)
+        amount = self.template['Transaction Amount'].to_numpy()
+        market = self.template['Market Value'].to_numpy()
+        self.ratios = np.divide(amount, market, out=np.zeros_like(amount), where=market > 0)
+        # Formatting a few thousand distinct days once is much cheaper than strftime per row
+        days = pd.date_range(DATE_RANGE[0], DATE_RANGE[1], inclusive='left')
+        self.day_labels = days.strftime('%d-%m-%Y').to_numpy(dtype=object)
+        self.day_years = days.year.to_numpy()
+
+    def chunk(self, start, rows):
+        """Rows [start, start + rows)"""
+        rng = _rng(self.seed, 1, start)
+        t = self.template
+        parcel = rng.integers(self.n_parcels, size=rows)
+        base = self.parcel_template[parcel]
+        row = rng.integers(len(t), size=rows)  # owners, transaction type, encumbrances
+
+        market = np.round(t['Market Value'].to_numpy()[base] * self.parcel_value[parcel], -3)
+        amount = np.round(market * self.ratios[rng.integers(len(self.ratios), size=rows)], -3)
+        day = rng.integers(len(self.day_labels), size=rows)
+        serial = pd.Series(np.arange(start, start + rows)).astype(str).str.zfill(8)
+        return pd.DataFrame({
+            'Parcel ID': 'P-' + pd.Series(parcel).astype(str),
+            'Owner Name': t['Owner Name'].to_numpy()[row],
+            'Transaction Date': self.day_labels[day],
+            'Transaction Type': t['Transaction Type'].to_numpy()[row],
+            'Transaction Amount': amount,
+            'Market Value': market,
+            'Land Area (sq.m)': t['Land Area (sq.m)'].to_numpy()[base],
+            'Land Use': t['Land Use'].to_numpy()[base],
+            'Tenure Type': t['Tenure Type'].to_numpy()[base],
+            'Registration No': 'REG-' + pd.Series(self.day_years[day]).astype(str) + '-' + serial,
+            'Encumbrances': t['Encumbrances'].to_numpy()[row],
+            'Previous Owner': t['Previous Owner'].to_numpy()[rng.integers(len(t), size=rows)],
+            'Latitude': t['Latitude'].to_numpy()[base],
+            'Longitude': t['Longitude'].to_numpy()[base],
+        }).astype(TRANSACTION_DTYPES)
+
+
+def generate(kind, rows, path, seed=0):
+    """Write `rows` synthetic rows of `kind` ('land' or 'transactions') to path (.parquet / .arrow / .csv)"""
+    if kind == 'land':
+        template = _load('land_data.csv', LAND_DATA_DTYPES)
+        make_chunk = lambda start, n: land_chunk(template, start, n, seed)  # noqa: E731
+    elif kind == 'transactions':
+        make_chunk = TransactionGenerator(_load('anomaly.csv', TRANSACTION_DTYPES), rows, seed).chunk
+    else:
+        raise ValueError(f"Unknown dataset kind {kind!r} (expected 'land' or 'transactions')")
+
+    tmp = f'{path}.tmp{os.path.splitext(path)[1]}'
+    with TableWriter(tmp) as writer:
+        for start in range(0, rows, CHUNK_ROWS):
+            writer.write(make_chunk(start, min(CHUNK_ROWS, rows - start)))
+    os.replace(tmp, path)
+    return path
+
+
+def ensure_dataset(kind, rows, seed=0, directory=DATA_DIR):
+    """Path of a cached synthetic dataset, generating it first if needed"""
+    os.makedirs(directory, exist_ok=True)
+    ext = '.parquet' if HAVE_PYARROW else '.csv'
+    path = os.path.join(directory, f'{kind}_{rows}_s{seed}{ext}')
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        generate(kind, rows, path, seed)
+        print(f"Generated {rows:,} {kind} rows in {time.perf_counter() - start:.1f}s -> {path}")
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('kind', choices=['land', 'transactions'])
+    parser.add_argument('--rows', type=lambda v: int(float(v)), required=True, help='e.g. 1000000 or 1e6')
+    parser.add_argument('--output', required=True, help='.parquet, .arrow or .csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    generate(args.kind, args.rows, args.output, args.seed)
+    print(f"Wrote {args.rows:,} {args.kind} rows to {args.output} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,392 @@
+"""Reproducible benchmarks for training, encoding, inference and request handling.
+
+    python benchmark.py                                   # every case at 10^3, 10^4, 10^5 rows
+    python benchmark.py --cases land-predict,anomaly-score --sizes 1e3,1e5,1e7
+    python benchmark.py --compare benchmark_results/<old>.json benchmark_results/<new>.json
+
+Inputs are synthetic files in the land_data.csv / anomaly.csv schemas (see
+bench_data.py), generated once per size and cached. Every (case, size) runs
+in a fresh subprocess, so peak RSS belongs to that case alone and no case
+warms caches for the next.
+
+Batch cases time the whole step over all rows --repeat times, after one
+warm-up run; p50/p99 are over those runs. Per-request cases time each call,
+over up to --max-calls rows. rows_per_s is rows per second of median run
+time for batch cases, and calls per second for per-request cases. Request
+cases go through the Flask test client, without a network; use loadtest.py
+to measure over HTTP.
+
+Inference uses the published artifacts in artifacts/, as the services do.
+Results are written to benchmark_results/<commit>.json with the commit,
+library versions and CPU count, so runs can be compared across commits.
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmark_results')
+
+# kind: 'batch' times one call over all rows, 'request' times one call per row.
+# max_rows: sizes above this are skipped unless --force (e.g. a 100-tree fit on 10^7 rows)
+Case = namedtuple('Case', ['name', 'dataset', 'kind', 'max_rows', 'description'])
+
+CASES = [
+    Case('land-train', 'land', 'batch', 10**6, 'get_dummies + RandomForestRegressor fit, as land_valuation.py'),
+    Case('land-encode-dummies', 'land', 'batch', 10**7, 'pd.get_dummies + column selection over all rows'),
+    Case('land-encode-numpy', 'land', 'batch', 10**7, 'ValuationEncoder.encode_frame over all rows'),
+    Case('land-encode-row-dummies', 'land', 'request', 10**7, 'one-row DataFrame + get_dummies, as /predict used to'),
+    Case('land-encode-row-numpy', 'land', 'request', 10**7, 'ValuationEncoder.encode_one, as /predict does'),
+    Case('land-predict', 'land', 'batch', 10**7, 'compiled forest predict over all rows'),
+    Case('land-predict-sklearn', 'land', 'batch', 10**7, 'RandomForestRegressor.predict over all rows'),
+    Case('anomaly-features', 'transactions', 'batch', 10**7, 'clean_transactions + add_features'),
+    Case('anomaly-train', 'transactions', 'batch', 10**6, 'IsolationForest fit, as train_anomaly.py'),
+    Case('anomaly-score', 'transactions', 'batch', 10**7, 'IsolationForest predict on the feature matrix'),
+    Case('request-predict', 'land', 'request', 10**7, 'POST /predict (JSON) through app.py'),
+    Case('request-anomaly', 'transactions', 'request', 10**7, 'POST / (JSON) through app_anomaly.py'),
+]
+CASES_BY_NAME = {case.name: case for case in CASES}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where resource is unavailable"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+# ------------------------------
+# Case setup (runs in the child)
+# ------------------------------
+# Each setup function returns (fn, args); fn(*args) is one timed call. For a
+# request case, args is a list and fn is called once per element.
+
+def _land_records(data):
+    return [{'location': r.Location, 'property_type': r.Property_Type, 'area_sqft': r.Area_SqFt,
+             'proximity_to_highway': r.Proximity_to_Highway_km, 'land_quality': int(r.Land_Quality_Rating)}
+            for r in data.itertuples()]
+
+
+def _land_artifact():
+    from model_artifact import load_land_artifact
+    return load_land_artifact()
+
+
+def setup_land_train(data, opts):
+    import pandas as pd
+    from sklearn.ensemble import RandomForestRegressor
+    from feature_encoding import CATEGORICAL_FEATURES, training_feature_columns
+
+    def train(data):
+        dummies = pd.get_dummies(data, columns=CATEGORICAL_FEATURES, drop_first=True)
+        X = dummies[training_feature_columns(dummies.columns)]
+        RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=opts.n_jobs).fit(X, dummies['Price_INR'])
+    return train, (data,)
+
+
+def setup_land_encode_dummies(data, opts):
+    import pandas as pd
+    from feature_encoding import CATEGORICAL_FEATURES, training_feature_columns
+
+    def encode(data):
+        dummies = pd.get_dummies(data, columns=CATEGORICAL_FEATURES, drop_first=True)
+        return dummies[training_feature_columns(dummies.columns)].to_numpy(dtype=np.float64)
+    return encode, (data,)
+
+
+def setup_land_encode_numpy(data, opts):
+    from feature_encoding import ValuationEncoder
+    artifact = _land_artifact()
+    encoder = ValuationEncoder(artifact.feature_columns, artifact.locations, artifact.property_types)
+    return encoder.encode_frame, (data,)
+
+
+def setup_land_encode_row_dummies(data, opts):
+    import pandas as pd
+    from feature_encoding import CATEGORICAL_FEATURES
+    feature_columns = _land_artifact().feature_columns
+
+    def encode(record):
+        frame = pd.DataFrame({'Area_SqFt': [record['area_sqft']],
+                              'Proximity_to_Highway_km': [record['proximity_to_highway']],
+                              'Land_Quality_Rating': [record['land_quality']],
+                              'Location': [record['location']], 'Property_Type': [record['property_type']]})
+        frame = pd.get_dummies(frame, columns=CATEGORICAL_FEATURES, drop_first=True)
+        return frame.reindex(columns=feature_columns, fill_value=0)
+    return encode, _land_records(data)
+
+
+def setup_land_encode_row_numpy(data, opts):
+    from feature_encoding import ValuationEncoder
+    artifact = _land_artifact()
+    encoder = ValuationEncoder(artifact.feature_columns, artifact.locations, artifact.property_types)
+
+    def encode(record):
+        return encoder.encode_one(record['location'], record['property_type'], record['area_sqft'],
+                                  record['proximity_to_highway'], record['land_quality'])
+    return encode, _land_records(data)
+
+
+def setup_land_predict(data, opts, engine='compiled'):
+    from feature_encoding import ValuationEncoder, predict_rows
+    from model_artifact import load_estimator
+    artifact = _land_artifact()
+    encoder = ValuationEncoder(artifact.feature_columns, artifact.locations, artifact.property_types)
+    model = artifact.forest if engine == 'compiled' else load_estimator(artifact)
+    return functools.partial(predict_rows, model), (encoder.encode_frame(data),)
+
+
+def setup_anomaly_features(data, opts):
+    from anomaly_pipeline import add_features, clean_transactions
+    # Cleaning mutates its input, so each run gets a fresh copy (the copy is timed too)
+    return lambda data: add_features(clean_transactions(data.copy())), (data,)
+
+
+def setup_anomaly_train(data, opts):
+    from anomaly_pipeline import add_features, clean_transactions, feature_matrix
+    from sklearn.ensemble import IsolationForest
+    features = feature_matrix(add_features(clean_transactions(data)))
+    model = IsolationForest(n_estimators=100, contamination=0.2, random_state=42, n_jobs=opts.n_jobs)
+    return model.fit, (features,)
+
+
+def setup_anomaly_score(data, opts):
+    from anomaly_pipeline import add_features, clean_transactions, feature_matrix
+    from feature_encoding import predict_rows
+    from model_artifact import load_anomaly_artifact
+    artifact = load_anomaly_artifact()
+    features = feature_matrix(add_features(clean_transactions(data)))[artifact.features].to_numpy()
+    return functools.partial(predict_rows, artifact.model), (features,)
+
+
+def _post_json(flask_app, path):
+    client = flask_app.test_client()
+
+    def post(payload):
+        response = client.post(path, json=payload)
+        if response.status_code >= 400:
+            raise RuntimeError(f"POST {path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return post
+
+
+def setup_request_predict(data, opts):
+    os.environ.setdefault('PREDICTION_CACHE', '0')  # time the model, not cache hits on repeated inputs
+    import app
+    return _post_json(app.app, '/predict'), _land_records(data)
+
+
+def setup_request_anomaly(data, opts):
+    import app_anomaly
+    # The service takes ISO dates; the files are day-first
+    records = [{'parcel_id': r[0], 'transaction_date': '-'.join(reversed(r[1].split('-'))),
+                'sale_price': r[2], 'market_value': r[3],
+                'land_area': r[4]}
+               for r in data[['Parcel ID', 'Transaction Date', 'Transaction Amount', 'Market Value',
+                              'Land Area (sq.m)']].itertuples(index=False)
+               if r[2] > 0 and r[4] > 0]
+    return _post_json(app_anomaly.app, '/'), records
+
+
+SETUP = {
+    'land-train': setup_land_train,
+    'land-encode-dummies': setup_land_encode_dummies,
+    'land-encode-numpy': setup_land_encode_numpy,
+    'land-encode-row-dummies': setup_land_encode_row_dummies,
+    'land-encode-row-numpy': setup_land_encode_row_numpy,
+    'land-predict': setup_land_predict,
+    'land-predict-sklearn': lambda data, opts: setup_land_predict(data, opts, engine='sklearn'),
+    'anomaly-features': setup_anomaly_features,
+    'anomaly-train': setup_anomaly_train,
+    'anomaly-score': setup_anomaly_score,
+    'request-predict': setup_request_predict,
+    'request-anomaly': setup_request_anomaly,
+}
+
+
+def run_case(name, rows, opts):
+    """Run one case in this process and return its result dict"""
+    from bench_data import ensure_dataset
+    from columnar_cache import read_table
+
+    case = CASES_BY_NAME[name]
+    data = read_table(ensure_dataset(case.dataset, rows, seed=opts.seed))
+    if case.kind == 'request':
+        data = data.head(opts.max_calls)
+    fn, args = SETUP[name](data, opts)
+    rss_before = peak_rss_mb()
+
+    if case.kind == 'batch':
+        fn(*args)  # warm-up
+        samples = []
+        for _ in range(opts.repeat):
+            start = time.perf_counter()
+            fn(*args)
+            samples.append(time.perf_counter() - start)
+        rows_per_s = rows / float(np.median(samples))
+    else:
+        for item in args[:opts.warmup]:
+            fn(item)
+        samples = np.empty(len(args))
+        for i, item in enumerate(args):
+            start = time.perf_counter()
+            fn(item)
+            samples[i] = time.perf_counter() - start
+        rows_per_s = len(args) / float(np.sum(samples))
+
+    ms = np.array(samples) * 1e3
+    return {
+        'case': name, 'rows': rows, 'kind': case.kind, 'samples': len(samples),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4), 'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'rows_per_s': round(rows_per_s, 1),
+        'rss_before_mb': rss_before, 'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+# ------------------------------
+# Driver (runs in the parent)
+# ------------------------------
+
+def environment():
+    import pandas as pd
+    import sklearn
+
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=BASE_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        'commit': git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--', '.')),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_in_subprocess(name, rows, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--sizes', str(rows),
+               '--repeat', str(args.repeat), '--warmup', str(args.warmup), '--max-calls', str(args.max_calls),
+               '--seed', str(args.seed), '--n-jobs', str(args.n_jobs)]
+    proc = subprocess.run(command, cwd=BASE_DIR, capture_output=True, text=True, timeout=args.timeout)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'case': name, 'rows': rows, 'error': lines[-1] if lines else f'exit {proc.returncode}'}
+    # The result is the last stdout line; anything before it is the apps' startup logging
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def print_row(result):
+    if 'skipped' in result or 'error' in result:
+        print(f"{result['case']:<24} {result['rows']:>10,}  {result.get('skipped') or 'ERROR: ' + result['error']}")
+        return
+    print(f"{result['case']:<24} {result['rows']:>10,} {result['p50_ms']:>11.3f} {result['p99_ms']:>11.3f} "
+          f"{result['rows_per_s']:>14,.0f} {result['peak_rss_mb'] or 0:>9.0f}")
+
+
+def compare(old_path, new_path):
+    """Print p50 / throughput / RSS ratios of new over old for every (case, rows) in both files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    before = {(r['case'], r['rows']): r for r in old['results'] if 'p50_ms' in r}
+    print(f"{old['environment']['commit']} -> {new['environment']['commit']}")
+    print(f"{'case':<24} {'rows':>10} {'p50 old':>10} {'p50 new':>10} {'speedup':>8} {'rss':>6}")
+    for r in new['results']:
+        base = before.get((r['case'], r['rows']))
+        if base is None or 'p50_ms' not in r:
+            continue
+        speedup = base['p50_ms'] / r['p50_ms'] if r['p50_ms'] else float('inf')
+        rss = (r['peak_rss_mb'] / base['peak_rss_mb']) if base.get('peak_rss_mb') and r.get('peak_rss_mb') else 1.0
+        print(f"{r['case']:<24} {r['rows']:>10,} {base['p50_ms']:>10.3f} {r['p50_ms']:>10.3f} "
+              f"{speedup:>7.2f}x {rss:>5.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', default='all', help='comma-separated case names, or "all"; see --list')
+    parser.add_argument('--sizes', default='1e3,1e4,1e5', help='comma-separated row counts (10^3-10^7)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per batch case')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed calls before a request case')
+    parser.add_argument('--max-calls', type=int, default=2000, help='rows timed per request case')
+    parser.add_argument('--n-jobs', type=int, default=1, help='n_jobs for the training cases')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic data seed')
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds per case')
+    parser.add_argument('--force', action='store_true', help="run sizes above a case's max_rows")
+    parser.add_argument('--output', help='results file (default: benchmark_results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files and exit')
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+
+    if args.child:
+        print(json.dumps(run_case(args.child, sizes[0], args)))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.list:
+        for case in CASES:
+            print(f"{case.name:<24} {case.kind:<8} {case.description}")
+        return
+
+    names = [case.name for case in CASES] if args.cases == 'all' else args.cases.split(',')
+    unknown = [name for name in names if name not in CASES_BY_NAME]
+    if unknown:
+        raise SystemExit(f"Unknown cases: {', '.join(unknown)} (see --list)")
+
+    # Generate every dataset up front so no case's timeout includes it
+    from bench_data import ensure_dataset
+    for dataset in sorted({CASES_BY_NAME[name].dataset for name in names}):
+        for rows in sizes:
+            ensure_dataset(dataset, rows, seed=args.seed)
+
+    env = environment()
+    print(f"commit {env['commit']}{' (dirty)' if env['dirty'] else ''}, {env['cpu_count']} CPUs, "
+          f"python {env['python']}, numpy {env['numpy']}, pandas {env['pandas']}, sklearn {env['sklearn']}")
+    print(f"{'case':<24} {'rows':>10} {'p50 ms':>11} {'p99 ms':>11} {'rows/s':>14} {'peak MB':>9}")
+    results = []
+    for name in names:
+        for rows in sizes:
+            if rows > CASES_BY_NAME[name].max_rows and not args.force:
+                result = {'case': name, 'rows': rows,
+                          'skipped': f"skipped (above {CASES_BY_NAME[name].max_rows:,} rows; --force to run)"}
+            else:
+                try:
+                    result = run_in_subprocess(name, rows, args)
+                except subprocess.TimeoutExpired:
+                    result = {'case': name, 'rows': rows, 'error': f'timed out after {args.timeout:.0f}s'}
+            results.append(result)
+            print_row(result)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{env['commit'] or 'unknown'}{'-dirty' if env['dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': env, 'settings': {k: v for k, v in vars(args).items() if k != 'child'},
+                   'results': results}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""Response cache for the land registration assistant.
+
+A prompt is looked up in two steps:
+
+1. Exact match on the normalized prompt (lower-cased, punctuation and extra
+   whitespace removed).
+2. Nearest neighbour over TF-IDF vectors of the cached prompts (hashed words
+   without stop words, IDF from the cached prompts themselves). A match needs
+   cosine similarity >= threshold; word order is ignored, so "land mutation
+   process" matches "the process for land mutation".
+
+The stop list is scikit-learn's English list without negations and
+prepositions, which change what a question asks ("with a survey" vs
+"without a survey"). A similar prompt also only matches if it has the same
+negation words as the question, so "is a survey needed" never gets the
+answer to "is a survey not needed".
+
+Entries are evicted least-recently-used beyond max_entries and expire ttl
+seconds after they were stored. They are persisted in SQLite, so the cache
+survives restarts. A hit is replayed as a stream of chunk objects shaped like
+Groq's (chunk.choices[0].delta.content), so callers consume cached and live
+answers the same way.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, HashingVectorizer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.getenv('CHAT_CACHE_PATH', os.path.join(BASE_DIR, 'chat_cache.sqlite3'))
+CACHE_MAX_ENTRIES = int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '5000'))
+CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', str(7 * 24 * 3600)))
+CACHE_THRESHOLD = float(os.getenv('CHAT_CACHE_THRESHOLD', '0.85'))
+
+N_FEATURES = 2 ** 18
+
+NEGATIONS = frozenset(['no', 'not', 'nor', 'never', 'none', 'nothing', 'nobody', 'nowhere', 'neither',
+                       'without', 'cannot', 'except'])
+PREPOSITIONS = frozenset(['about', 'above', 'across', 'after', 'against', 'along', 'among', 'around', 'before',
+                          'behind', 'below', 'beside', 'besides', 'between', 'beyond', 'by', 'during', 'for',
+                          'from', 'in', 'inside', 'into', 'of', 'off', 'on', 'onto', 'out', 'over', 'since',
+                          'through', 'throughout', 'to', 'toward', 'towards', 'under', 'until', 'up', 'upon',
+                          'via', 'with', 'within'])
+STOP_WORDS = sorted(ENGLISH_STOP_WORDS - NEGATIONS - PREPOSITIONS)
+
+_CONTRACTED_NOT = re.compile(r"n['’]t\b")
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+_PIECES = re.compile(r'\S+\s*|\s+')
+
+
+def normalize(prompt):
+    """Lower-case, spell out n't, drop punctuation and collapse whitespace"""
+    text = _CONTRACTED_NOT.sub(' not', prompt.lower())
+    return _WHITESPACE.sub(' ', _PUNCTUATION.sub(' ', text)).strip()
+
+
+def negations(normalized):
+    """Negation words in a normalized prompt"""
+    return NEGATIONS.intersection(normalized.split())
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def replay(answer):
+    """A cached answer as Groq-style stream chunks, one word at a time"""
+    for piece in _PIECES.findall(answer):
+        yield _chunk(piece)
+
+
+async def areplay(answer):
+    for chunk in replay(answer):
+        yield chunk
+
+
+class ResponseCache:
+    """LRU + TTL cache of complete answers, keyed on (model, normalized prompt)"""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, threshold=CACHE_THRESHOLD):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.counters = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0}
+
+        self._vectorizer = HashingVectorizer(n_features=N_FEATURES, stop_words=STOP_WORDS, alternate_sign=False,
+                                             norm=None)
+        # key -> [model, answer, created, term counts]; ordered least- to most-recently used
+        self._entries = OrderedDict()
+        self._doc_freq = np.zeros(N_FEATURES, dtype=np.int32)
+        self._matrix = None  # TF rows of the cached prompts, rebuilt lazily after changes
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, prompt TEXT, '
+                             'answer TEXT, created REAL, last_used REAL)')
+            self._db.commit()
+            self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        self._db.execute('DELETE FROM responses WHERE created < ?', (cutoff,))
+        rows = self._db.execute('SELECT key, model, answer, created FROM responses ORDER BY last_used').fetchall()
+        for key, model, answer, created in rows[-self.max_entries:]:
+            self._insert(key, model, answer, created)
+        self._db.execute('DELETE FROM responses WHERE key NOT IN '
+                         '(SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)', (self.max_entries,))
+        self._db.commit()
+
+    @staticmethod
+    def _key(model, normalized):
+        return f'{model}\n{normalized}'
+
+    def _vector(self, normalized):
+        return self._vectorizer.transform([normalized])
+
+    def _insert(self, key, model, answer, created):
+        counts = self._vector(key.split('\n', 1)[1])
+        self._entries[key] = [model, answer, created, counts]
+        self._doc_freq[counts.indices] += 1
+        self._matrix = None
+
+    def _remove(self, key):
+        model, answer, created, counts = self._entries.pop(key)
+        self._doc_freq[counts.indices] -= 1
+        self._matrix = None
+        if self._db is not None:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def _tfidf(self, counts):
+        idf = np.log((1 + len(self._entries)) / (1 + self._doc_freq[counts.indices])) + 1
+        weighted = counts.copy()
+        weighted.data = weighted.data * idf
+        norm = np.sqrt((weighted.data ** 2).sum())
+        return weighted / norm if norm else weighted
+
+    def _nearest(self, model, normalized):
+        """Most similar cached prompt for this model, as (key, cosine similarity)"""
+        query = self._vector(normalized)
+        if query.nnz == 0:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            counts = sparse.vstack([self._entries[key][3] for key in self._matrix_keys]).tocsr()
+            idf = np.log((1 + len(self._entries)) / (1 + self._doc_freq)) + 1
+            matrix = counts @ sparse.diags(idf)
+            norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+            norms[norms == 0] = 1
+            self._matrix = sparse.diags(1 / norms) @ matrix
+        scores = (self._matrix @ self._tfidf(query).T).toarray().ravel()
+        negated = negations(normalized)
+        for i in np.argsort(-scores):
+            key = self._matrix_keys[i]
+            if scores[i] < self.threshold:
+                break
+            if self._entries.get(key, [None])[0] == model and negations(key.split('\n', 1)[1]) == negated:
+                return key, float(scores[i])
+        return None, 0.0
+
+    def get(self, prompt, model):
+        """Cached answer for a prompt, or None"""
+        normalized = normalize(prompt)
+        now = time.time()
+        with self._lock:
+            key = self._key(model, normalized)
+            hit = 'exact_hits' if key in self._entries else None
+            if hit is None and self._entries:
+                key, _ = self._nearest(model, normalized)
+                hit = 'similar_hits' if key is not None else None
+            if hit is not None and now - self._entries[key][2] > self.ttl:
+                self._remove(key)
+                self.counters['expired'] += 1
+                hit = None
+            if hit is None:
+                self.counters['misses'] += 1
+                if self._db is not None:
+                    self._db.commit()
+                return None
+
+            self.counters[hit] += 1
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                self._db.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+                self._db.commit()
+            return self._entries[key][1]
+
+    async def aget(self, prompt, model):
+        """get() in a worker thread, keeping SQLite and index rebuilds off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, prompt, model)
+
+    def put(self, prompt, model, answer):
+        """Store a complete answer"""
+        if not answer:
+            return
+        normalized = normalize(prompt)
+        if not normalized:
+            return
+        key = self._key(model, normalized)
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._insert(key, model, answer, now)
+            self.counters['stores'] += 1
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                                 (key, model, prompt, answer, now, now))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+            if self._db is not None:
+                self._db.commit()
+
+    def record(self, prompt, model, stream):
+        """Pass a live stream through, caching the answer once it has completed"""
+        parts = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self.put(prompt, model, ''.join(parts))
+
+    async def arecord(self, prompt, model, stream):
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        await asyncio.get_running_loop().run_in_executor(None, self.put, prompt, model, ''.join(parts))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['exact_hits'] + self.counters['similar_hits'] + self.counters['misses']
+            hits = lookups - self.counters['misses']
+            return dict(self.counters, entries=len(self._entries), lookups=lookups,
+                        hit_rate=round(hits / lookups, 4) if lookups else 0.0)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,216 @@
+"""Async streaming service for the land registration assistant (chatbot.py).
+
+    python chat_server.py                # http://127.0.0.1:5002
+
+GET /chat?q=... or POST /chat ({"prompt": ...}) answers with Server-Sent
+Events: one `data: {"token": ...}` event per streamed chunk, then `event: done`
+(or `event: error`). Tokens are forwarded as soon as Groq sends them.
+
+Every request goes through one AsyncGroq client backed by a pooled httpx
+connection, so upstream TLS connections are kept alive and reused. At most
+CHAT_MAX_CONCURRENCY completions stream at once; requests that wait longer
+than CHAT_QUEUE_TIMEOUT seconds for a slot get a 503.
+
+Each browser gets a session cookie; earlier turns of its conversation are
+sent with every prompt within a token budget (chat_sessions.py), and
+POST /chat/reset starts over.
+
+Prompts are grounded in passages from the retrieval index (retrieval.py) when
+one has been built; questions it covers well go to CHAT_SMALL_MODEL.
+
+Repeated first questions are replayed from the response cache (chat_cache.py)
+without taking a slot upstream; GET /cache/stats reports its hit/miss counters.
+
+Set GROQ_BASE_URL to point the client at another OpenAI-compatible server,
+e.g. fake_llm_server.py for local testing:
+
+    python fake_llm_server.py &
+    GROQ_BASE_URL=http://127.0.0.1:8081 GROQ_API_KEY=test python chat_server.py
+"""
+
+import asyncio
+import json
+import os
+import uuid
+
+import httpx
+from aiohttp import web
+from dotenv import load_dotenv
+from groq import AsyncGroq
+
+from chat_cache import areplay
+from chatbot import DEFAULT_MODEL, build_messages, ground, response_cache, sessions
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MAX_CONCURRENCY = int(os.getenv('CHAT_MAX_CONCURRENCY', '64'))
+QUEUE_TIMEOUT = float(os.getenv('CHAT_QUEUE_TIMEOUT', '30'))
+POOL_SIZE = int(os.getenv('CHAT_POOL_SIZE', str(MAX_CONCURRENCY)))
+MAX_PROMPT_CHARS = int(os.getenv('CHAT_MAX_PROMPT_CHARS', '4000'))
+CHAT_MODEL = os.getenv('CHAT_MODEL', DEFAULT_MODEL)
+
+SESSION_COOKIE = 'chat_session'
+
+SSE_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',  # don't let a reverse proxy buffer the stream
+}
+
+# Keys into the aiohttp application state
+CLIENT = web.AppKey('client', AsyncGroq)
+SLOTS = web.AppKey('slots', asyncio.Semaphore)
+
+
+def sse_event(data, event=None):
+    """Encode one Server-Sent Event"""
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'.encode()
+
+
+async def open_client(app):
+    """One pooled client per process, closed on shutdown"""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+    app[CLIENT] = AsyncGroq(api_key=os.getenv('GROQ_API_KEY'), http_client=http_client)
+    app[SLOTS] = asyncio.Semaphore(MAX_CONCURRENCY)
+    yield
+    await app[CLIENT].close()
+
+
+async def read_prompt(request):
+    if request.method == 'GET':
+        return request.query.get('q', '')
+    if request.content_type == 'application/json':
+        try:
+            payload = await request.json()
+        except ValueError:
+            return ''
+        return payload.get('prompt', '') if isinstance(payload, dict) else ''
+    form = await request.post()
+    return form.get('prompt', '')
+
+
+def sse_response(session_id):
+    response = web.StreamResponse(headers=SSE_HEADERS)
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite='Lax')
+    return response
+
+
+async def chat(request):
+    prompt = (await read_prompt(request)).strip()
+    if not prompt:
+        return web.json_response({'error': 'prompt is required'}, status=400)
+    if len(prompt) > MAX_PROMPT_CHARS:
+        return web.json_response({'error': f'prompt is longer than {MAX_PROMPT_CHARS} characters'}, status=400)
+
+    # The conversation is identified by a cookie; its earlier turns go into the prompt
+    session_id = request.cookies.get(SESSION_COOKIE) or uuid.uuid4().hex
+    history = sessions.history(session_id)
+
+    # Cache hits (first turns only) are replayed without waiting for an upstream slot
+    use_cache = response_cache is not None and not history
+    cached = await response_cache.aget(prompt, CHAT_MODEL) if use_cache else None
+    if cached is not None:
+        response = sse_response(session_id)
+        await response.prepare(request)
+        await forward(sessions.arecord(session_id, prompt, areplay(cached)), response)
+        return response
+
+    slots = request.app[SLOTS]
+    try:
+        await asyncio.wait_for(slots.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return web.json_response({'error': 'the assistant is busy, try again shortly'}, status=503)
+
+    try:
+        response = sse_response(session_id)
+        await response.prepare(request)
+        await stream_completion(request.app[CLIENT], prompt, history, session_id, use_cache, response)
+        return response
+    finally:
+        slots.release()
+
+
+async def stream_completion(client, prompt, history, session_id, use_cache, response):
+    """Forward a streamed completion to the browser chunk by chunk"""
+    stream = None
+    try:
+        # BM25 search and passage decoding are synchronous; keep them off the event loop
+        passages, model, params = await asyncio.get_running_loop().run_in_executor(None, ground, prompt, CHAT_MODEL)
+        stream = await client.chat.completions.create(
+            messages=build_messages(prompt, history, passages),
+            model=model,
+            stream=True,
+            **params,
+        )
+        chunks = response_cache.arecord(prompt, CHAT_MODEL, stream) if use_cache else stream
+        await forward(sessions.arecord(session_id, prompt, chunks), response)
+    except Exception as e:
+        await send_error(response, e)
+    finally:
+        if stream is not None:
+            await stream.close()
+
+
+async def forward(chunks, response):
+    """Write each chunk's content as an SSE event, then `done`"""
+    try:
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                await response.write(sse_event({'token': chunk.choices[0].delta.content}))
+        await response.write(sse_event({}, event='done'))
+    except ConnectionResetError:
+        pass  # the browser went away; the caller closes the upstream stream
+
+
+async def send_error(response, error):
+    try:
+        await response.write(sse_event({'error': f'An error occurred: {error}'}, event='error'))
+    except ConnectionResetError:
+        pass
+
+
+async def index(request):
+    return web.FileResponse(os.path.join(BASE_DIR, 'templates', 'chat.html'))
+
+
+async def health(request):
+    return web.json_response({'status': 'ok', 'saturated': request.app[SLOTS].locked(),
+                              'max_concurrency': MAX_CONCURRENCY})
+
+
+async def reset_session(request):
+    sessions.reset(request.cookies.get(SESSION_COOKIE))
+    return web.json_response({'status': 'ok'})
+
+
+async def session_stats(request):
+    return web.json_response(sessions.stats())
+
+
+async def cache_stats(request):
+    if response_cache is None:
+        return web.json_response({'enabled': False})
+    return web.json_response(dict(response_cache.stats(), enabled=True))
+
+
+def create_app():
+    app = web.Application()
+    app.cleanup_ctx.append(open_client)
+    app.router.add_get('/', index)
+    app.router.add_get('/chat', chat)
+    app.router.add_post('/chat', chat)
+    app.router.add_get('/health', health)
+    app.router.add_post('/chat/reset', reset_session)
+    app.router.add_get('/sessions/stats', session_stats)
+    app.router.add_get('/cache/stats', cache_stats)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=os.getenv('CHAT_HOST', '127.0.0.1'), port=int(os.getenv('CHAT_PORT', '5002')))
@@ -0,0 +1,162 @@
+"""Per-session conversation memory for the land registration assistant.
+
+Each session keeps its recent turns verbatim plus a running summary of older
+ones. The history sent with a prompt is capped at history_tokens. When a new
+turn pushes it over the cap, the oldest turns are folded into the summary
+one at a time (their first sentences, extractively, so no extra completion
+is needed). The summary is itself capped at a third of the budget, dropping
+its oldest lines. Prompt size is therefore bounded however long a
+conversation runs.
+
+Sessions are kept least-recently-used in a SessionStore with at most
+max_sessions entries, and expire after ttl seconds idle. Memory is therefore
+bounded by max_sessions * history_tokens (about 4 characters per token).
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+HISTORY_TOKENS = int(os.getenv('CHAT_HISTORY_TOKENS', '1500'))
+MAX_SESSIONS = int(os.getenv('CHAT_MAX_SESSIONS', '10000'))
+SESSION_TTL = float(os.getenv('CHAT_SESSION_TTL', '3600'))
+
+# Longest answer kept verbatim in the history, in tokens
+MAX_ANSWER_TOKENS = 300
+
+_SENTENCE = re.compile(r'(?<=[.!?])\s|\n')
+
+
+def estimate_tokens(text):
+    """Rough token count for English text (~4 characters per token), without a tokenizer"""
+    return max(1, (len(text) + 3) // 4)
+
+
+def _clip(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rsplit(' ', 1)[0] + ' ...'
+
+
+def _first_sentence(text, max_chars):
+    sentence = _SENTENCE.split(text.strip(), 1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rsplit(' ', 1)[0] + ' ...'
+
+
+class Session:
+    """Summary lines and recent (user, assistant, tokens) turns of one conversation"""
+
+    __slots__ = ('summary', 'summary_tokens', 'turns', 'turn_tokens', 'last_used')
+
+    def __init__(self):
+        self.summary = deque()
+        self.summary_tokens = 0
+        self.turns = deque()
+        self.turn_tokens = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def tokens(self):
+        return self.summary_tokens + self.turn_tokens
+
+    def add_turn(self, user, assistant, history_tokens):
+        assistant = _clip(assistant, MAX_ANSWER_TOKENS)
+        tokens = estimate_tokens(user) + estimate_tokens(assistant)
+        self.turns.append((user, assistant, tokens))
+        self.turn_tokens += tokens
+
+        summary_budget = history_tokens // 3
+        while self.tokens > history_tokens and self.turns:
+            old_user, old_assistant, old_tokens = self.turns.popleft()
+            self.turn_tokens -= old_tokens
+            line = f"- Asked: {_first_sentence(old_user, 200)} Answered: {_first_sentence(old_assistant, 240)}"
+            self.summary.append(line)
+            self.summary_tokens += estimate_tokens(line)
+            while self.summary_tokens > summary_budget and self.summary:
+                self.summary_tokens -= estimate_tokens(self.summary.popleft())
+
+    def messages(self):
+        """History as chat-completions messages, oldest first"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system",
+                             "content": "Summary of the earlier conversation:\n" + "\n".join(self.summary)})
+        for user, assistant, _ in self.turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        return messages
+
+
+class SessionStore:
+    """Bounded LRU of Sessions keyed by session ID"""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL, history_tokens=HISTORY_TOKENS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.counters = {'created': 0, 'evicted': 0, 'expired': 0}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is not None and time.monotonic() - session.last_used > self.ttl:
+            del self._sessions[session_id]
+            self.counters['expired'] += 1
+            session = None
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def history(self, session_id):
+        """Messages to send before the new prompt ([] for a new or unknown session)"""
+        if session_id is None:
+            return []
+        with self._lock:
+            session = self._get(session_id)
+            return session.messages() if session is not None else []
+
+    def add_turn(self, session_id, user, assistant):
+        if session_id is None or not assistant:
+            return
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session()
+                self.counters['created'] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.counters['evicted'] += 1
+            session.add_turn(user, assistant, self.history_tokens)
+            session.last_used = time.monotonic()
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def record(self, session_id, prompt, stream):
+        """Pass a stream through, adding the turn to the session once it has completed"""
+        parts = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self.add_turn(session_id, prompt, ''.join(parts))
+
+    async def arecord(self, session_id, prompt, stream):
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self.add_turn(session_id, prompt, ''.join(parts))
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, sessions=len(self._sessions),
+                        history_tokens=sum(s.tokens for s in self._sessions.values()))
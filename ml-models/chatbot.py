@@ -3,43 +3,98 @@ import time
 from groq import Groq
 from dotenv import load_dotenv
 
+from chat_cache import ResponseCache, replay
+from chat_sessions import SessionStore
+from retrieval import BM25Index
+
 # Load environment variables
 load_dotenv()
 
-# Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Model and generation settings, shared with the async service (chat_server.py)
+DEFAULT_MODEL = "llama3-70b-8192"
+GENERATION_PARAMS = {"temperature": 0.5, "max_tokens": 1024}
 
-def get_chatgroq_response(prompt, model="llama3-70b-8192"):
-    """Get response from Groq API"""
-    try:
-        messages = [
-            {
-                "role": "system",
-                "content": """You are a specialized assistant focused STRICTLY on land registration documents and processes.
+SYSTEM_PROMPT = """You are a specialized assistant focused STRICTLY on land registration documents and processes.
                 You ONLY help people understand and prepare documents for land registration.
                 Explain land registration processes in simple language and provide step-by-step guidance.
                 Be empathetic and helpful, but REFUSE to answer any questions not directly related to land registration,
                 land ownership documentation, or the specific paperwork required for land transactions.
                 If asked about anything else, politely redirect the conversation back to land registration topics.
                 Your purpose is exclusively to provide accessible information about land rights and registration documents."""
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-        
+
+# Questions the registration documents cover well are answered by a smaller model with a lower token cap
+SMALL_MODEL = os.getenv("CHAT_SMALL_MODEL", "llama3-8b-8192")
+GROUNDED_PARAMS = dict(GENERATION_PARAMS, max_tokens=int(os.getenv("CHAT_GROUNDED_MAX_TOKENS", "512")))
+RETRIEVAL_K = int(os.getenv("CHAT_RETRIEVAL_K", "3"))
+CONFIDENT_COVERAGE = float(os.getenv("CHAT_RETRIEVAL_CONFIDENCE", "0.8"))
+
+# Built once; every request only appends its own user message
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Groq client, created on first use so importing this module needs no API key
+client = None
+
+# Repeated questions are answered from chat_cache.py instead of a new completion (CHAT_CACHE=0 disables it)
+response_cache = ResponseCache() if os.getenv("CHAT_CACHE", "1") != "0" else None
+
+# Conversation memory per session ID, within a token budget (see chat_sessions.py)
+sessions = SessionStore()
+
+# BM25 index over the registration documents (python retrieval.py build), if one has been built
+try:
+    retriever = BM25Index.load()
+except FileNotFoundError:
+    retriever = None
+
+def build_messages(prompt, history=(), passages=()):
+    """System prompt + earlier turns + retrieved passages + the user's message, in chat-completions format"""
+    messages = [SYSTEM_MESSAGE, *history]
+    if passages:
+        excerpts = "\n\n".join(f"[{p.source}] {p.text}" for p in passages)
+        messages.append({"role": "system",
+                         "content": f"Relevant excerpts from land registration documents:\n\n{excerpts}\n\n"
+                                    "Base your answer on these excerpts where they apply."})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def ground(prompt, model=DEFAULT_MODEL):
+    """Passages for a prompt, and the model and generation params to answer it with"""
+    if retriever is None:
+        return [], model, GENERATION_PARAMS
+    result = retriever.search(prompt, RETRIEVAL_K)
+    if result.passages and result.coverage >= CONFIDENT_COVERAGE:
+        return result.passages, SMALL_MODEL, GROUNDED_PARAMS
+    return result.passages, model, GENERATION_PARAMS
+
+def get_chatgroq_response(prompt, model=DEFAULT_MODEL, session_id=None):
+    """Get response from Groq API, continuing the conversation of session_id if given"""
+    global client
+    try:
+        history = sessions.history(session_id)
+
+        # A cached answer only fits the first turn of a conversation
+        use_cache = response_cache is not None and not history
+        if use_cache:
+            cached = response_cache.get(prompt, model)
+            if cached is not None:
+                return sessions.record(session_id, prompt, replay(cached))
+
+        if client is None:
+            client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
         # Stream the response
+        passages, answer_model, params = ground(prompt, model)
         completion = client.chat.completions.create(
-            messages=messages,
-            model=model,
-            temperature=0.5,
-            max_tokens=1024,
+            messages=build_messages(prompt, history, passages),
+            model=answer_model,
             stream=True,
+            **params,
         )
         
-        # For streaming, we return the generator directly
-        return completion
+        # For streaming, we return the generator directly; the cache and the session keep the answer once it has finished
+        if use_cache:
+            completion = response_cache.record(prompt, model, completion)
+        return sessions.record(session_id, prompt, completion)
     except Exception as e:
         return f"An error occurred: {str(e)}"
 
@@ -68,7 +123,8 @@ def show_welcome_message():
     print("3. What is the process for land mutation?")
     print("4. How much does land registration cost?")
     print("5. How can I check if my land is already registered?")
-    print("\nType 'exit', 'quit', or 'bye' to END the conversation.")
+    print("\nType 'new' to start a new conversation.")
+    print("Type 'exit', 'quit', or 'bye' to END the conversation.")
     print("\n" + "-" * 80)
 
 def main():
@@ -79,6 +135,9 @@ def main():
     print("\nAssistant: ", end="")
     print_with_delay(initial_message)
     
+    # One conversation per run of the CLI
+    session_id = "cli"
+
     # Main chat loop
     while True:
         user_input = input("\nYou: ")
@@ -87,12 +146,17 @@ def main():
         if user_input.lower() in ["exit", "quit", "bye"]:
             print("\nAssistant: Thank you for using the Land Registration Assistant. Goodbye!")
             break
+
+        if user_input.lower() == "new":
+            sessions.reset(session_id)
+            print("\nAssistant: Let's start over. What would you like to know about land registration?")
+            continue
         
         # Get and display response
         print("\nAssistant: ", end="")
         
         # Get streaming response
-        completion = get_chatgroq_response(user_input)
+        completion = get_chatgroq_response(user_input, session_id=session_id)
         
         # Handle different types of responses
         if isinstance(completion, str):
@@ -0,0 +1,252 @@
+"""Parquet cache of the cleaned, typed training datasets.
+
+The first read of anomaly.csv or land_data.csv parses the CSV once, applies the
+types the pipelines expect (dates parsed day-first, numerics coerced) and
+stores the result as Parquet under .cache/. Later reads load only the requested
+columns from that file. A cache entry is keyed on the source file's mtime and
+size, with its SHA-256 as the tie-breaker, so touching a file does not force a
+re-parse but editing it does.
+
+pyarrow is optional: without it every read falls back to parsing the CSV.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv('DATA_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+
+COLUMNAR_EXTENSIONS = ('.parquet', '.arrow', '.feather')
+
+# Column types of anomaly.csv. CSVs are parsed with csv_dtypes (numeric columns
+# as text) and then coerce_numeric, so one malformed cell becomes NaN instead
+# of failing the whole read.
+TRANSACTION_DTYPES = {
+    'Parcel ID': 'string',
+    'Owner Name': 'string',
+    'Transaction Date': 'string',
+    'Transaction Type': 'string',
+    'Transaction Amount': 'float64',
+    'Market Value': 'float64',
+    'Land Area (sq.m)': 'float64',
+    'Land Use': 'string',
+    'Tenure Type': 'string',
+    'Registration No': 'string',
+    'Encumbrances': 'string',
+    'Previous Owner': 'string',
+    'Latitude': 'float64',
+    'Longitude': 'float64',
+}
+
+LAND_DATA_DTYPES = {
+    'Location': 'string',
+    'Area_SqFt': 'float64',
+    'Property_Type': 'string',
+    'Proximity_to_Highway_km': 'float64',
+    'Land_Quality_Rating': 'int64',
+    'Price_INR': 'float64',
+}
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+
+def is_columnar(path):
+    return path.lower().endswith(COLUMNAR_EXTENSIONS)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def csv_dtypes(dtypes, columns=None):
+    """read_csv dtypes for a CSV with these column types: text columns as given, numeric ones as str"""
+    if dtypes is None:
+        return None
+    names = dtypes if columns is None else [col for col in columns if col in dtypes]
+    return {col: dtypes[col] if dtypes[col] == 'string' else str for col in names}
+
+
+def coerce_numeric(data, dtypes):
+    """Coerce the numeric columns of a frame read with csv_dtypes; malformed cells become NaN"""
+    if dtypes is None:
+        return data
+    for col, dtype in dtypes.items():
+        if dtype != 'string' and col in data.columns:
+            values = pd.to_numeric(data[col], errors='coerce')
+            if pd.api.types.is_integer_dtype(dtype):
+                fractional = values.notna() & (values % 1 != 0)
+                if fractional.any():
+                    row = fractional.idxmax()
+                    raise ValueError(f"{col} must hold whole numbers, got {float(values[row])} in row {row}")
+            # An integer column with gaps stays float64, as read_csv would infer it
+            data[col] = values.astype(dtype if values.notna().all() else 'float64')
+    return data
+
+
+def type_transactions(data):
+    """Parse the transaction date and coerce the numeric columns of anomaly.csv (where present)"""
+    if 'Transaction Date' in data.columns:
+        data['Transaction Date'] = pd.to_datetime(data['Transaction Date'], dayfirst=True, errors='coerce')
+    return coerce_numeric(data, TRANSACTION_DTYPES)
+
+
+def type_land_data(data):
+    """Coerce the numeric columns of land_data.csv (where present)"""
+    return coerce_numeric(data, LAND_DATA_DTYPES)
+
+
+def _cached_parquet(source, typer, dtypes):
+    """Path of an up-to-date Parquet copy of source, (re)building it when the source changed"""
+    stat = os.stat(source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    source_id = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:8]
+    meta_path = os.path.join(CACHE_DIR, f'{stem}-{source_id}.meta.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        meta = {}
+
+    cached = os.path.join(CACHE_DIR, meta.get('cache_file', ''))
+    if meta.get('source') == os.path.abspath(source) and os.path.isfile(cached):
+        if meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('size') == stat.st_size:
+            return cached
+        digest = _sha256(source)
+        if digest == meta.get('sha256'):
+            meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            _write_json(meta_path, meta)
+            return cached
+    else:
+        digest = _sha256(source)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data = typer(pd.read_csv(source, dtype=csv_dtypes(dtypes)))
+    cache_file = f'{stem}-{digest[:16]}.parquet'
+    tmp = os.path.join(CACHE_DIR, f'.{cache_file}.tmp-{os.getpid()}')
+    data.to_parquet(tmp, index=False)
+    os.replace(tmp, os.path.join(CACHE_DIR, cache_file))
+    if meta.get('cache_file') and meta['cache_file'] != cache_file:
+        try:
+            os.remove(os.path.join(CACHE_DIR, meta['cache_file']))
+        except FileNotFoundError:
+            pass
+    _write_json(meta_path, {'source': os.path.abspath(source), 'mtime_ns': stat.st_mtime_ns,
+                            'size': stat.st_size, 'sha256': digest, 'cache_file': cache_file})
+    return os.path.join(CACHE_DIR, cache_file)
+
+
+def _write_json(path, payload):
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+def _read(path, columns, typer, dtypes, use_cache):
+    if is_columnar(path):
+        return read_table(path, columns)
+    if use_cache and HAVE_PYARROW:
+        return pd.read_parquet(_cached_parquet(path, typer, dtypes), columns=columns)
+    usecols = None if columns is None else list(columns)
+    return typer(pd.read_csv(path, usecols=usecols, dtype=csv_dtypes(dtypes, usecols)))
+
+
+def read_transactions(path='anomaly.csv', columns=None, use_cache=True):
+    """Typed transaction records, from the Parquet cache when possible"""
+    return _read(path, columns, type_transactions, TRANSACTION_DTYPES, use_cache)
+
+
+def read_land_data(path='land_data.csv', columns=None, use_cache=True):
+    """Typed land valuation training data, from the Parquet cache when possible"""
+    return _read(path, columns, type_land_data, LAND_DATA_DTYPES, use_cache)
+
+
+def read_table(path, columns=None):
+    """Read a Parquet / Arrow IPC / CSV file, selecting columns where the format allows it"""
+    lower = path.lower()
+    if lower.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if lower.endswith(('.arrow', '.feather')):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_chunks(path, chunksize, dtypes=None, columns=None):
+    """Yield a file as DataFrames of about chunksize rows (Parquet row batches, Arrow IPC batches or CSV chunks)"""
+    lower = path.lower()
+    if lower.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif lower.endswith(('.arrow', '.feather')):
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                yield (batch.select(columns) if columns else batch).to_pandas()
+    else:
+        for chunk in pd.read_csv(path, dtype=csv_dtypes(dtypes, columns), usecols=columns, chunksize=chunksize):
+            yield coerce_numeric(chunk, dtypes)
+
+
+def write_table(data, path):
+    """Write a frame as Parquet, Arrow IPC or CSV depending on the file extension"""
+    lower = path.lower()
+    if lower.endswith('.parquet'):
+        data.to_parquet(path, index=False)
+    elif lower.endswith(('.arrow', '.feather')):
+        data.reset_index(drop=True).to_feather(path)
+    else:
+        data.to_csv(path, index=False, date_format='%Y-%m-%d')
+
+
+class TableWriter:
+    """Append frames to one output file: Parquet row groups, Arrow IPC batches or CSV"""
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+        self._schema = None
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, data):
+        lower = self.path.lower()
+        if not is_columnar(lower):
+            data.to_csv(self.path, mode='a', header=not os.path.exists(self.path), index=False,
+                        date_format='%Y-%m-%d')
+            return
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            if lower.endswith('.parquet'):
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+        self._writer.write_table(table.cast(self._schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,593 @@
+"""Score LandRegistry ownership transfers for anomalies as they happen on chain.
+
+    python event_scorer.py tail --contract 0x5FbDB2315678afecb367f032d93F642f64180aa3
+    python event_scorer.py replay events.jsonl
+    python event_scorer.py simulate --input anomaly.csv --output events.jsonl
+
+`tail` polls a JSON-RPC node (default: a local Hardhat node at
+http://127.0.0.1:8545) with eth_getLogs for the contract's LandRegistered,
+PaymentConfirmed and OwnershipTransferred events. `replay` reads the same
+logs from a JSONL file: one eth_getLogs entry per line, with its block's
+blockTimestamp. `tail --record FILE` writes such a file, and `simulate`
+builds one from a transaction CSV.
+
+Each parcel keeps its registered area and valuation, the payments confirmed
+since its last transfer, and the day of that transfer. An
+OwnershipTransferred event is one transaction, with those payments as its
+amount:
+
+    price_per_sqm   = amount (converted to INR at --inr-per-eth) / area
+    price_ratio     = amount / valuation (both in wei)
+    days_since_prev = calendar days (UTC) since the parcel's previous scored transfer
+
+These match anomaly_pipeline. As in clean_transactions, transfers without a
+payment are skipped, and they don't count as a previous transaction. The
+contract only accepts one payment per land, so later transfers of the same
+land are skipped unless it is paid again.
+
+The transfers of one poll (or --batch-size replayed logs) are scored as one
+micro-batch with a single predict call. A transfer is therefore published
+within --poll-interval plus one fetch and predict of the block that included
+it, and the run prints the observed p50/p99. Flagged transfers are appended
+to --output as JSON lines and/or POSTed to --webhook. The artifact is
+reloaded when a new version is published (see model_registry.py).
+
+Progress and per-parcel state are checkpointed to --checkpoint, written only
+after a batch's results are delivered, so a restart resumes where the last
+run stopped instead of re-scanning the chain. Delivery is at-least-once: a
+crash between publishing and checkpointing re-sends that batch. Use each
+record's `id` (transaction hash:log index) to drop duplicates.
+
+landId is an indexed string, so logs only carry its keccak256 hash. Parcels
+are reported by that hash; hash the IDs you know with `keccak256` to match them.
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+import requests
+
+from feature_encoding import ANOMALY_FEATURES, predict_rows
+from model_artifact import ANOMALY_MODEL_DIR, load_anomaly_artifact
+from model_registry import ModelRegistry
+
+INR_PER_ETH = float(os.getenv('EVENT_INR_PER_ETH', '300000'))
+WEI_PER_ETH = 10**18
+
+# ------------------------------
+# Keccak-256 (Ethereum's, not NIST SHA3-256), for event topics and landId hashes
+# ------------------------------
+
+_MASK = (1 << 64) - 1
+_ROUND_CONSTANTS = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+_ROTATIONS = [[0, 36, 3, 41, 18], [1, 44, 10, 45, 2], [62, 6, 43, 15, 61], [28, 55, 25, 21, 56],
+              [27, 20, 39, 8, 14]]
+
+
+def _rotl(value, shift):
+    return ((value << shift) | (value >> (64 - shift))) & _MASK if shift else value
+
+
+def _keccak_f(lanes):
+    for rc in _ROUND_CONSTANTS:
+        c = [lanes[x] ^ lanes[x + 5] ^ lanes[x + 10] ^ lanes[x + 15] ^ lanes[x + 20] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ _rotl(c[(x + 1) % 5], 1) for x in range(5)]
+        lanes = [lanes[i] ^ d[i % 5] for i in range(25)]
+        b = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                b[y + 5 * ((2 * x + 3 * y) % 5)] = _rotl(lanes[x + 5 * y], _ROTATIONS[x][y])
+        lanes = [b[i] ^ (~b[(i + 1) % 5 + i - i % 5] & _MASK & b[(i + 2) % 5 + i - i % 5]) for i in range(25)]
+        lanes[0] ^= rc
+    return lanes
+
+
+def keccak256(data):
+    """Keccak-256 digest of bytes (or a str, UTF-8 encoded)"""
+    if isinstance(data, str):
+        data = data.encode()
+    rate = 136
+    padded = bytearray(data) + b'\x01' + bytes(-(len(data) + 1) % rate)
+    padded[-1] |= 0x80
+    lanes = [0] * 25
+    for start in range(0, len(padded), rate):
+        block = padded[start:start + rate]
+        for i in range(rate // 8):
+            lanes[i] ^= int.from_bytes(block[8 * i:8 * i + 8], 'little')
+        lanes = _keccak_f(lanes)
+    return b''.join(lane.to_bytes(8, 'little') for lane in lanes[:4])
+
+
+# ------------------------------
+# LandRegistry events
+# ------------------------------
+
+EVENT_SIGNATURES = {
+    'LandRegistered': 'LandRegistered(string,address,address,string,string,uint256,string,uint256,uint256)',
+    'PaymentConfirmed': 'PaymentConfirmed(string,address,uint256)',
+    'OwnershipTransferred': 'OwnershipTransferred(string,address,address)',
+}
+TOPICS = {name: '0x' + keccak256(signature).hex() for name, signature in EVENT_SIGNATURES.items()}
+EVENT_BY_TOPIC = {topic: name for name, topic in TOPICS.items()}
+
+Event = namedtuple('Event', ['name', 'parcel', 'block', 'log_index', 'tx_hash', 'timestamp', 'fields'])
+
+
+def _words(data):
+    raw = bytes.fromhex(data[2:] if data.startswith('0x') else data)
+    return [int.from_bytes(raw[i:i + 32], 'big') for i in range(0, len(raw), 32)]
+
+
+def _address(topic):
+    return '0x' + topic[-40:]
+
+
+def decode_log(log):
+    """An eth_getLogs entry -> Event, or None if it isn't a LandRegistry event"""
+    topics = log.get('topics') or []
+    name = EVENT_BY_TOPIC.get(topics[0].lower()) if topics else None
+    if name is None:
+        return None
+    words = _words(log.get('data', '0x'))
+    if name == 'LandRegistered':
+        # Head words: ownerName, ownerEmail (offsets), area, locationHash (offset), valuation, registeredAt.
+        # The strings (owner name and e-mail) are deliberately not decoded.
+        fields = {'owner': _address(topics[2]), 'area': words[2], 'valuation': words[4]}
+    elif name == 'PaymentConfirmed':
+        fields = {'owner': _address(topics[2]), 'amount': words[0]}
+    else:
+        fields = {'old_owner': _address(topics[2]), 'new_owner': _address(topics[3])}
+    timestamp = log.get('blockTimestamp')
+    return Event(name, topics[1].lower(), int(log['blockNumber'], 16), int(log['logIndex'], 16),
+                 log.get('transactionHash'), int(timestamp, 16) if timestamp is not None else None, fields)
+
+
+def _utc_day(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date().toordinal()
+
+
+# ------------------------------
+# Incremental features and micro-batch scoring
+# ------------------------------
+
+def load_scoring_model(version=None):
+    """Load an anomaly artifact version, refusing one trained on features the event stream doesn't provide.
+
+    Used as the registry loader, so a hot reload to such a version is rejected
+    and the current model stays active.
+    """
+    artifact = load_anomaly_artifact(version=version)
+    if artifact.features != ANOMALY_FEATURES:
+        raise RuntimeError(f"Anomaly model {artifact.version} expects features {artifact.features}, "
+                           f"but the event scorer computes {ANOMALY_FEATURES}")
+    return artifact
+
+
+class TransferScorer:
+    """Per-parcel state folded from events, and scoring of OwnershipTransferred events in micro-batches"""
+
+    def __init__(self, registry, inr_per_eth=INR_PER_ETH, emit_all=False):
+        self.registry = registry
+        self.inr_per_eth = inr_per_eth
+        self.emit_all = emit_all
+        # landId hash -> [area, valuation_wei, paid_wei since the last transfer, day of the last scored transfer]
+        self.parcels = {}
+        self.stats = {'events': 0, 'transfers': 0, 'scored': 0, 'flagged': 0, 'skipped_unpaid': 0,
+                      'skipped_unregistered': 0}
+        self._staged = ({}, {})
+
+    def process(self, events):
+        """Score a batch of events (in chain order) and return the records to publish.
+
+        The batch's state changes are staged on copies of the parcels it
+        touches; commit() applies them once the records are delivered, so a
+        batch that fails to publish leaves the state as it was.
+        """
+        parcels = {}  # staged copies of the parcels this batch touches (None: not registered)
+        stats = dict.fromkeys(self.stats, 0)
+        self._staged = (parcels, stats)
+        pending = []  # (event, features) of the transfers in this batch
+        for event in events:
+            stats['events'] += 1
+            if event.parcel not in parcels:
+                state = self.parcels.get(event.parcel)
+                parcels[event.parcel] = list(state) if state is not None else None
+            state = parcels[event.parcel]
+            if event.name == 'LandRegistered':
+                parcels[event.parcel] = [event.fields['area'], event.fields['valuation'], 0, None]
+                continue
+            if state is None:
+                if event.name == 'OwnershipTransferred':
+                    stats['transfers'] += 1
+                    stats['skipped_unregistered'] += 1
+                continue
+            if event.name == 'PaymentConfirmed':
+                state[2] += event.fields['amount']
+                continue
+
+            stats['transfers'] += 1
+            area, valuation, paid, last_day = state
+            if paid <= 0 or area <= 0 or valuation <= 0:
+                stats['skipped_unpaid'] += 1
+                continue
+            day = _utc_day(event.timestamp)
+            price_per_sqm = paid / WEI_PER_ETH * self.inr_per_eth / area
+            price_ratio = paid / valuation
+            days_since_prev = max(day - last_day, 0) if last_day is not None else 0
+            pending.append((event, paid, valuation, [price_per_sqm, price_ratio, float(days_since_prev)]))
+            state[2], state[3] = 0, day
+
+        if not pending:
+            return []
+        self.registry.ensure_watching()
+        active = self.registry.current
+        X = np.array([features for *_, features in pending], dtype=np.float64)
+        predictions = predict_rows(active.model, X)
+        detected_at = time.time()
+
+        records = []
+        for (event, paid, valuation, features), prediction in zip(pending, predictions):
+            is_anomaly = bool(prediction == -1)
+            stats['scored'] += 1
+            stats['flagged'] += is_anomaly
+            if not (is_anomaly or self.emit_all):
+                continue
+            records.append({
+                'id': f'{event.tx_hash}:{event.log_index}',
+                'parcel': event.parcel,
+                'block': event.block,
+                'block_time': datetime.fromtimestamp(event.timestamp, tz=timezone.utc).isoformat(),
+                'old_owner': event.fields['old_owner'],
+                'new_owner': event.fields['new_owner'],
+                'amount_wei': str(paid),
+                'valuation_wei': str(valuation),
+                **dict(zip(ANOMALY_FEATURES, features)),
+                'is_anomaly': is_anomaly,
+                'model_version': active.version,
+                'latency_s': round(detected_at - event.timestamp, 3),
+            })
+        return records
+
+    def commit(self):
+        """Apply the state changes of the last process() call"""
+        parcels, stats = self._staged
+        self.parcels.update((parcel, state) for parcel, state in parcels.items() if state is not None)
+        for name, count in stats.items():
+            self.stats[name] += count
+        self._staged = ({}, {})
+
+    def state(self):
+        return {'parcels': {parcel: [str(area), str(valuation), str(paid), day]
+                            for parcel, (area, valuation, paid, day) in self.parcels.items()},
+                'stats': self.stats}
+
+    def restore(self, state):
+        self.parcels = {parcel: [int(area), int(valuation), int(paid), day]
+                        for parcel, (area, valuation, paid, day) in state['parcels'].items()}
+        self.stats.update(state['stats'])
+
+
+# ------------------------------
+# Event sources
+# ------------------------------
+
+class RpcSource:
+    """Contract logs from a JSON-RPC node, in block ranges up to the confirmed head"""
+
+    def __init__(self, url, contract, confirmations=0, max_blocks=2000, record=None):
+        self.url = url
+        self.contract = contract.lower()
+        self.confirmations = confirmations
+        self.max_blocks = max_blocks
+        self.record = open(record, 'a') if record else None
+        self.session = requests.Session()
+        self._ids = 0
+
+    def call(self, *calls):
+        """One JSON-RPC batch of (method, params) calls; results in call order"""
+        payload = []
+        for method, params in calls:
+            self._ids += 1
+            payload.append({'jsonrpc': '2.0', 'id': self._ids, 'method': method, 'params': params})
+        response = self.session.post(self.url, json=payload, timeout=30)
+        response.raise_for_status()
+        replies = {reply['id']: reply for reply in response.json()}
+        results = []
+        for request in payload:
+            reply = replies[request['id']]
+            if 'error' in reply:
+                raise RuntimeError(f"{request['method']} failed: {reply['error']}")
+            results.append(reply['result'])
+        return results
+
+    def fetch(self, next_block):
+        """(events, next block to fetch) for the confirmed blocks from next_block on"""
+        head = int(self.call(('eth_blockNumber', []))[0], 16) - self.confirmations
+        if head < next_block:
+            return [], next_block
+        to_block = min(head, next_block + self.max_blocks - 1)
+        logs = self.call(('eth_getLogs', [{'address': self.contract, 'fromBlock': hex(next_block),
+                                           'toBlock': hex(to_block),
+                                           'topics': [list(TOPICS.values())]}]))[0]
+        # Hardhat doesn't put block timestamps in logs; fetch each block once
+        missing = sorted({log['blockNumber'] for log in logs if 'blockTimestamp' not in log})
+        if missing:
+            blocks = self.call(*[('eth_getBlockByNumber', [number, False]) for number in missing])
+            times = {number: block['timestamp'] for number, block in zip(missing, blocks)}
+            for log in logs:
+                log.setdefault('blockTimestamp', times.get(log['blockNumber']))
+        logs = [log for log in logs if not log.get('removed')]
+        logs.sort(key=lambda log: (int(log['blockNumber'], 16), int(log['logIndex'], 16)))
+        if self.record:
+            self.record.writelines(json.dumps(log) + '\n' for log in logs)
+            self.record.flush()
+        return [event for event in map(decode_log, logs) if event is not None], to_block + 1
+
+    def close(self):
+        self.session.close()
+        if self.record:
+            self.record.close()
+            self.record = None
+
+
+def replay_batches(path, start_line, batch_size):
+    """(events, next line) micro-batches from a recorded log, resuming after start_line lines"""
+    with open(path) as f:
+        lines = f.readlines()
+    for start in range(start_line, len(lines), batch_size):
+        chunk = [json.loads(line) for line in lines[start:start + batch_size] if line.strip()]
+        yield [event for event in map(decode_log, chunk) if event is not None], min(start + batch_size, len(lines))
+
+
+# ------------------------------
+# Publishing and checkpoints
+# ------------------------------
+
+class Publisher:
+    """Deliver records to a JSONL file and/or a webhook; raises if the webhook keeps failing"""
+
+    def __init__(self, output=None, webhook=None, retries=5):
+        self.output = output
+        self.webhook = webhook
+        self.retries = retries
+        self.session = requests.Session() if webhook else None
+
+    def publish(self, records):
+        if not records:
+            return
+        if self.output:
+            with open(self.output, 'a') as f:
+                f.writelines(json.dumps(record) + '\n' for record in records)
+        if self.webhook:
+            for attempt in range(self.retries):
+                try:
+                    self.session.post(self.webhook, json={'transfers': records}, timeout=10).raise_for_status()
+                    return
+                except requests.RequestException as e:
+                    print(f"Webhook delivery failed ({e}); retrying")
+                    time.sleep(min(2 ** attempt, 30))
+            raise RuntimeError(f"Could not deliver {len(records)} records to {self.webhook}")
+
+
+def load_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['source'] != source:
+        raise SystemExit(f"Checkpoint {path} is for {checkpoint['source']}, not {source}; "
+                         f"use another --checkpoint or delete it")
+    return checkpoint
+
+
+def save_checkpoint(path, source, cursor, scorer):
+    if not path:
+        return
+    with open(path + '.tmp', 'w') as f:
+        json.dump(dict(scorer.state(), source=source, cursor=cursor, saved_at=time.time()), f)
+    os.replace(path + '.tmp', path)
+
+
+def summarize(stats, latencies):
+    line = (f"{stats['events']} events, {stats['transfers']} transfers: {stats['scored']} scored, "
+            f"{stats['flagged']} flagged, {stats['skipped_unpaid']} unpaid, "
+            f"{stats['skipped_unregistered']} unregistered")
+    if latencies:
+        p50, p99 = np.percentile(latencies, [50, 99])
+        line += f"; publish latency p50 {p50:.2f}s p99 {p99:.2f}s"
+    return line
+
+
+def run(batches, source, cursor, scorer, publisher, checkpoint, checkpoint_interval, measure_latency):
+    """Score and publish each (events, cursor) batch, checkpointing as they are delivered.
+
+    A batch's state is only committed, and its cursor only advanced, after it
+    is published. If scoring or publishing raises, nothing more is saved and
+    the last checkpoint (state and cursor of delivered batches only) stands.
+    """
+    latencies = []
+    last_saved = time.monotonic()
+    last_report = time.monotonic()
+    try:
+        for events, next_cursor in batches:
+            records = scorer.process(events)
+            publisher.publish(records)
+            scorer.commit()
+            cursor = next_cursor
+            if measure_latency:
+                latencies.extend(record['latency_s'] for record in records)
+            if time.monotonic() - last_saved >= checkpoint_interval:
+                save_checkpoint(checkpoint, source, cursor, scorer)
+                last_saved = time.monotonic()
+            if time.monotonic() - last_report >= 60:
+                print(summarize(scorer.stats, latencies[-10_000:]))
+                last_report = time.monotonic()
+    except KeyboardInterrupt:
+        print("Stopping")
+    save_checkpoint(checkpoint, source, cursor, scorer)
+    print(summarize(scorer.stats, latencies))
+
+
+def poll_forever(source, next_block, poll_interval):
+    while True:
+        start = time.monotonic()
+        try:
+            events, next_block = source.fetch(next_block)
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Could not fetch logs from {source.url}: {e}")
+            events = []
+        yield events, next_block
+        time.sleep(max(0.0, poll_interval - (time.monotonic() - start)))
+
+
+# ------------------------------
+# Simulated event log
+# ------------------------------
+
+def simulate(input_path, output_path, contract, inr_per_eth=INR_PER_ETH):
+    """Write a replayable event log with one register per parcel and a payment + transfer per transaction.
+
+    Each transaction gets its own block at noon UTC of its date, so replaying
+    the log scores the same transactions, with the same features, as
+    anomaly_detect.py on the input, except that price_ratio always uses the
+    parcel's first market value, because the contract fixes the valuation at
+    registration. Unlike the contract, the log may pay for a parcel more than
+    once.
+    """
+    import pandas as pd
+
+    from anomaly_pipeline import (land_area_col, market_value_col, parcel_id_col, transaction_amount_col,
+                                  transaction_date_col)
+    from columnar_cache import read_transactions
+
+    data = read_transactions(input_path).drop_duplicates()
+    data[transaction_date_col] = pd.to_datetime(data[transaction_date_col], dayfirst=True, errors='coerce')
+    data = data.dropna(subset=[transaction_date_col, land_area_col, market_value_col])
+    data = data.sort_values([transaction_date_col, parcel_id_col], kind='stable')
+
+    def wei(inr):
+        return int(round(float(inr) / inr_per_eth * WEI_PER_ETH))
+
+    def word(value):
+        return value.to_bytes(32, 'big').hex()
+
+    def log(block, index, name, parcel_id, timestamp, topics, words):
+        return {'address': contract, 'blockNumber': hex(block), 'logIndex': hex(index),
+                'transactionHash': '0x' + keccak256(f'{block}:{index}').hex(), 'blockTimestamp': hex(timestamp),
+                'topics': [TOPICS[name], '0x' + keccak256(parcel_id).hex(), *topics],
+                'data': '0x' + ''.join(words)}
+
+    owner, admin, buyer = ('0x' + word(n) for n in (1, 2, 3))
+    registered = set()
+    rows = zip(data[parcel_id_col].astype(str), data[transaction_date_col], data[land_area_col],
+               data[market_value_col], data[transaction_amount_col])
+    with open(output_path, 'w') as f:
+        for block, (parcel_id, day, area, market_value, amount) in enumerate(rows, start=1):
+            timestamp = int(day.timestamp()) + 12 * 3600
+            logs = []
+            if parcel_id not in registered:
+                registered.add(parcel_id)
+                # Offsets of the three (empty) strings, then area, valuation and registeredAt
+                words = [word(192), word(224), word(int(round(area))), word(256), word(wei(market_value)),
+                         word(timestamp), word(0), word(0), word(0)]
+                logs.append(log(block, len(logs), 'LandRegistered', parcel_id, timestamp, [owner, admin], words))
+            if amount > 0:
+                logs.append(log(block, len(logs), 'PaymentConfirmed', parcel_id, timestamp, [owner],
+                                [word(wei(amount))]))
+            logs.append(log(block, len(logs), 'OwnershipTransferred', parcel_id, timestamp, [owner, buyer], []))
+            f.writelines(json.dumps(entry) + '\n' for entry in logs)
+    return len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_scoring_options(command):
+        command.add_argument('--output', default='flagged_transfers.jsonl', help='JSONL file of flagged transfers '
+                                                                                "('' to disable)")
+        command.add_argument('--webhook', help='POST each batch of flagged transfers here as JSON')
+        command.add_argument('--emit-all', action='store_true', help='publish every scored transfer, not only flagged')
+        command.add_argument('--checkpoint', default='event_scorer.checkpoint.json', help="('' to disable)")
+        command.add_argument('--checkpoint-interval', type=float, default=5.0, help='seconds between checkpoints')
+        command.add_argument('--inr-per-eth', type=float, default=INR_PER_ETH,
+                             help='conversion for price_per_sqm (default: EVENT_INR_PER_ETH or 300000)')
+
+    tail = commands.add_parser('tail', help='follow a JSON-RPC node')
+    tail.add_argument('--rpc-url', default=os.getenv('CHAIN_RPC_URL', 'http://127.0.0.1:8545'))
+    tail.add_argument('--contract', default=os.getenv('LAND_REGISTRY_ADDRESS'), help='LandRegistry address')
+    tail.add_argument('--from-block', type=int, default=0, help='first block when there is no checkpoint')
+    tail.add_argument('--confirmations', type=int, default=0, help='blocks to wait for before scoring (reorgs)')
+    tail.add_argument('--poll-interval', type=float, default=1.0, help='seconds')
+    tail.add_argument('--max-blocks', type=int, default=2000, help='blocks per eth_getLogs call')
+    tail.add_argument('--record', help='also append the raw logs to this file, for replay')
+    add_scoring_options(tail)
+
+    replay = commands.add_parser('replay', help='score a recorded event log')
+    replay.add_argument('events', help='JSONL of eth_getLogs entries with blockTimestamp')
+    replay.add_argument('--batch-size', type=int, default=1000, help='logs per micro-batch')
+    add_scoring_options(replay)
+
+    sim = commands.add_parser('simulate', help='turn a transaction CSV into a replayable event log')
+    sim.add_argument('--input', default='anomaly.csv')
+    sim.add_argument('--output', default='events.jsonl')
+    sim.add_argument('--contract', default='0x' + '00' * 19 + '01')
+    sim.add_argument('--inr-per-eth', type=float, default=INR_PER_ETH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        count = simulate(args.input, args.output, args.contract, args.inr_per_eth)
+        print(f"Wrote events for {count} transactions to {args.output}")
+        return
+
+    try:
+        registry = ModelRegistry(ANOMALY_MODEL_DIR, load_scoring_model)
+    except FileNotFoundError:
+        raise SystemExit("No anomaly model artifact found. Train one with `python train_anomaly.py`.")
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    scorer = TransferScorer(registry, args.inr_per_eth, emit_all=args.emit_all)
+    publisher = Publisher(args.output or None, args.webhook)
+
+    if args.command == 'tail':
+        if not args.contract:
+            raise SystemExit("Pass --contract (or set LAND_REGISTRY_ADDRESS) to the deployed LandRegistry address")
+        source_id = f'rpc:{args.contract.lower()}'
+        checkpoint = load_checkpoint(args.checkpoint, source_id)
+        cursor = checkpoint['cursor'] if checkpoint else args.from_block
+        source = RpcSource(args.rpc_url, args.contract, args.confirmations, args.max_blocks, args.record)
+        batches = poll_forever(source, cursor, args.poll_interval)
+        print(f"Tailing {args.contract} on {args.rpc_url} from block {cursor}")
+    else:
+        source = None
+        source_id = f'file:{os.path.abspath(args.events)}'
+        checkpoint = load_checkpoint(args.checkpoint, source_id)
+        cursor = checkpoint['cursor'] if checkpoint else 0
+        batches = replay_batches(args.events, cursor, args.batch_size)
+        print(f"Replaying {args.events} from line {cursor}")
+    if checkpoint:
+        scorer.restore(checkpoint)
+        print(f"Resumed from {args.checkpoint}: {len(scorer.parcels)} parcels")
+
+    try:
+        run(batches, source_id, cursor, scorer, publisher, args.checkpoint, args.checkpoint_interval,
+            measure_latency=args.command == 'tail')
+    finally:
+        if source is not None:
+            source.close()
+
+
+if __name__ == '__main__':
+    main()
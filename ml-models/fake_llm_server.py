@@ -0,0 +1,104 @@
+"""Local stand-in for the Groq chat-completions API, for testing chat_server.py.
+
+    python fake_llm_server.py --port 8081 --tokens 40 --delay 0.02
+    GROQ_BASE_URL=http://127.0.0.1:8081 GROQ_API_KEY=test python chat_server.py
+
+POST /openai/v1/chat/completions streams an OpenAI-style chunk per word of a
+canned answer, --delay seconds apart. GET /stats reports how many requests
+and distinct TCP connections it has seen and the peak number of concurrent
+streams, which shows whether the client reuses its pooled connections, and
+the largest prompt (all message contents, in characters) it was sent.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from aiohttp import web
+
+ANSWER = ("To register land you usually need the sale deed, proof of identity and address of both parties, "
+          "the latest property tax receipt, an encumbrance certificate and the mutation records. "
+          "Visit the sub-registrar office with two witnesses to complete the registration.")
+
+STATS = web.AppKey('stats', dict)
+OPTIONS = web.AppKey('options', argparse.Namespace)
+
+
+def completion_chunk(completion_id, model, content=None, finish_reason=None):
+    delta = {} if content is None else {'role': 'assistant', 'content': content}
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+    }
+
+
+def answer_tokens(n_tokens):
+    words = ANSWER.split(' ')
+    return [words[i % len(words)] + ' ' for i in range(n_tokens)]
+
+
+async def completions(request):
+    options, stats = request.app[OPTIONS], request.app[STATS]
+    payload = await request.json()
+    model = payload.get('model', 'fake')
+    completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+
+    stats['requests'] += 1
+    stats['max_prompt_chars'] = max(stats['max_prompt_chars'],
+                                    sum(len(m.get('content') or '') for m in payload.get('messages', [])))
+    stats['connections'].add(request.transport.get_extra_info('peername'))
+    stats['active'] += 1
+    stats['peak_active'] = max(stats['peak_active'], stats['active'])
+    try:
+        await asyncio.sleep(options.first_token_delay)
+        tokens = answer_tokens(options.tokens)
+        if not payload.get('stream'):
+            return web.json_response({
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                             'finish_reason': 'stop'}],
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for token in tokens:
+            await response.write(f'data: {json.dumps(completion_chunk(completion_id, model, token))}\n\n'.encode())
+            await asyncio.sleep(options.delay)
+        final = completion_chunk(completion_id, model, finish_reason='stop')
+        await response.write(f'data: {json.dumps(final)}\n\ndata: [DONE]\n\n'.encode())
+        await response.write_eof()
+        return response
+    finally:
+        stats['active'] -= 1
+
+
+async def stats_view(request):
+    stats = request.app[STATS]
+    return web.json_response({'requests': stats['requests'], 'connections': len(stats['connections']),
+                              'active': stats['active'], 'peak_active': stats['peak_active'],
+                              'max_prompt_chars': stats['max_prompt_chars']})
+
+
+def create_app(options):
+    app = web.Application()
+    app[OPTIONS] = options
+    app[STATS] = {'requests': 0, 'connections': set(), 'active': 0, 'peak_active': 0, 'max_prompt_chars': 0}
+    app.router.add_post('/openai/v1/chat/completions', completions)
+    app.router.add_get('/stats', stats_view)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake streaming chat-completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--tokens', type=int, default=40, help='chunks per answer')
+    parser.add_argument('--delay', type=float, default=0.02, help='seconds between chunks')
+    parser.add_argument('--first-token-delay', type=float, default=0.2, help='seconds before the first chunk')
+    args = parser.parse_args()
+    web.run_app(create_app(args), host=args.host, port=args.port)
@@ -0,0 +1,178 @@
+"""Feature encoding shared by the valuation (app.py) and anomaly (app_anomaly.py) services.
+
+Records are encoded straight into contiguous float64 NumPy rows laid out exactly
+like the training DataFrames, so no pandas objects are built on the request path.
+Run this file directly to check parity against the DataFrame encoding.
+"""
+
+import warnings
+
+import numpy as np
+
+# (request field, training column) for the numeric valuation inputs
+NUMERIC_FEATURES = [
+    ('area_sqft', 'Area_SqFt'),
+    ('proximity_to_highway', 'Proximity_to_Highway_km'),
+    ('land_quality', 'Land_Quality_Rating'),
+]
+CATEGORICAL_FEATURES = ['Location', 'Property_Type']
+
+ANOMALY_FEATURES = ['price_per_sqm', 'price_ratio', 'days_since_prev']
+
+
+def predict_rows(model, X):
+    """model.predict on NumPy rows laid out like the DataFrame the model was fitted on.
+
+    The feature-name check is redundant then, so its warning is silenced for
+    this call only.
+    """
+    if getattr(model, 'feature_names_in_', None) is None:
+        return model.predict(X)
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        return model.predict(X)
+
+
+def training_feature_columns(columns):
+    """Feature order used by land_valuation.py, given the columns after get_dummies"""
+    return [col for _, col in NUMERIC_FEATURES] + [
+        col for col in columns if col.startswith('Location_') or col.startswith('Property_Type_')
+    ]
+
+
+class ValuationEncoder:
+    """One-hot encoder for valuation records, built once from the model's feature_columns"""
+
+    def __init__(self, feature_columns, locations, property_types):
+        self.feature_columns = list(feature_columns)
+        self.n_features = len(self.feature_columns)
+        self.numeric_index = [self.feature_columns.index(col) for _, col in NUMERIC_FEATURES]
+        # Categories dropped by get_dummies(drop_first=True) have no column and
+        # map to -1, i.e. they stay all-zero exactly as in training.
+        self.location_index = {loc: self._column('Location', loc) for loc in locations}
+        self.property_type_index = {pt: self._column('Property_Type', pt) for pt in property_types}
+
+    def _column(self, prefix, value):
+        name = f'{prefix}_{value}'
+        return self.feature_columns.index(name) if name in self.feature_columns else -1
+
+    def _category_columns(self, location, property_type):
+        try:
+            loc_col = self.location_index[location]
+        except KeyError:
+            raise ValueError(f"unknown location {location!r}")
+        try:
+            pt_col = self.property_type_index[property_type]
+        except KeyError:
+            raise ValueError(f"unknown property type {property_type!r}")
+        return loc_col, pt_col
+
+    def encode_one(self, location, property_type, area_sqft, proximity_to_highway, land_quality):
+        """Encode a single validated record into a (1, n_features) float64 row"""
+        loc_col, pt_col = self._category_columns(location, property_type)
+        row = np.zeros((1, self.n_features), dtype=np.float64)
+        area_idx, proximity_idx, quality_idx = self.numeric_index
+        row[0, area_idx] = area_sqft
+        row[0, proximity_idx] = proximity_to_highway
+        row[0, quality_idx] = land_quality
+        if loc_col >= 0:
+            row[0, loc_col] = 1.0
+        if pt_col >= 0:
+            row[0, pt_col] = 1.0
+        return row
+
+    def encode_many(self, records):
+        """Encode a list of request dicts into a preallocated (n, n_features) matrix"""
+        n = len(records)
+        loc_cols = np.empty(n, dtype=np.intp)
+        pt_cols = np.empty(n, dtype=np.intp)
+        numeric = np.empty((n, len(NUMERIC_FEATURES)), dtype=np.float64)
+
+        for i, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise ValueError(f"Record {i}: expected an object")
+            try:
+                loc_cols[i], pt_cols[i] = self._category_columns(record.get('location'),
+                                                                 record.get('property_type'))
+                numeric[i] = [float(record[key]) for key, _ in NUMERIC_FEATURES]
+            except ValueError as e:
+                raise ValueError(f"Record {i}: {e}")
+            except (KeyError, TypeError):
+                raise ValueError(f"Record {i}: area_sqft, proximity_to_highway and land_quality must be numbers")
+        non_finite = np.flatnonzero(~np.isfinite(numeric).all(axis=1))
+        if len(non_finite):
+            raise ValueError(f"Record {non_finite[0]}: area_sqft, proximity_to_highway and land_quality "
+                             f"must be finite numbers")
+        fractional = np.flatnonzero(numeric[:, 2] % 1 != 0)
+        if len(fractional):
+            raise ValueError(f"Record {fractional[0]}: land_quality must be a whole number")
+        return self._assemble(numeric, loc_cols, pt_cols)
+
+    def encode_frame(self, data):
+        """Encode a DataFrame with the land_data.csv columns (Location, Area_SqFt, ...) in bulk"""
+        columns = {}
+        for prefix, index in (('Location', self.location_index), ('Property_Type', self.property_type_index)):
+            mapped = data[prefix].map(index)
+            unknown = mapped.isna()
+            if unknown.any():
+                values = sorted(map(str, data[prefix][unknown].unique()))
+                raise ValueError(f"unknown {prefix} values: {', '.join(values[:10])}")
+            columns[prefix] = mapped.to_numpy(dtype=np.intp)
+        numeric = data[[col for _, col in NUMERIC_FEATURES]].to_numpy(dtype=np.float64)
+        return self._assemble(numeric, columns['Location'], columns['Property_Type'])
+
+    def _assemble(self, numeric, loc_cols, pt_cols):
+        n = len(numeric)
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+        X[:, self.numeric_index] = numeric
+        rows = np.arange(n)
+        for cols in (loc_cols, pt_cols):
+            hit = cols >= 0
+            X[rows[hit], cols[hit]] = 1.0
+        return X
+
+
+def encode_anomaly_row(price_per_sqm, price_ratio, days_since_prev):
+    """Encode one transaction's anomaly features into a (1, 3) float64 row"""
+    return np.array([[price_per_sqm, price_ratio, days_since_prev]], dtype=np.float64)
+
+
+if __name__ == '__main__':
+    # Parity check: the NumPy encoders must produce the same matrices (and hence
+    # bit-identical predictions) as the DataFrame path used in training.
+    import pandas as pd
+
+    data = pd.read_csv('land_data.csv')
+    dummies = pd.get_dummies(data, columns=CATEGORICAL_FEATURES, drop_first=True)
+    feature_columns = training_feature_columns(dummies.columns)
+    expected = dummies[feature_columns].to_numpy(dtype=np.float64)
+
+    encoder = ValuationEncoder(feature_columns, data['Location'].unique(), data['Property_Type'].unique())
+    records = [
+        {'location': r.Location, 'property_type': r.Property_Type, 'area_sqft': r.Area_SqFt,
+         'proximity_to_highway': r.Proximity_to_Highway_km, 'land_quality': r.Land_Quality_Rating}
+        for r in data.itertuples()
+    ]
+    many = encoder.encode_many(records)
+    one = np.vstack([encoder.encode_one(**record) for record in records])
+    frame = encoder.encode_frame(data)
+    assert many.flags['C_CONTIGUOUS'] and one.flags['C_CONTIGUOUS']
+    assert np.array_equal(many, expected), "encode_many differs from get_dummies"
+    assert np.array_equal(frame, expected), "encode_frame differs from get_dummies"
+    assert np.array_equal(one, expected), "encode_one differs from get_dummies"
+
+    try:
+        from model_artifact import load_estimator, load_land_artifact
+        model = load_estimator(load_land_artifact())
+    except (ImportError, OSError):
+        model = None
+    if model is not None:
+        assert np.array_equal(predict_rows(model, one), model.predict(dummies[feature_columns])), \
+            "valuation predictions differ"
+
+    anomaly_frame = pd.DataFrame([[3000.0, 0.9, 365.0], [10000.0, 1.8, 10.0]], columns=ANOMALY_FEATURES)
+    anomaly_rows = np.vstack([encode_anomaly_row(*row) for row in anomaly_frame.itertuples(index=False)])
+    assert np.array_equal(anomaly_rows, anomaly_frame.to_numpy(dtype=np.float64)), "anomaly rows differ"
+
+    print(f"Encoding parity OK ({len(records)} valuation records"
+          f"{', predictions identical' if model is not None else ''})")
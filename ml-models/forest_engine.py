@@ -0,0 +1,183 @@
+"""Compiled inference engine for the land valuation forest.
+
+export_forest() flattens a fitted scikit-learn tree ensemble into flat node
+tables (feature, threshold, left, right, value) with every tree stored back to
+back in breadth-first order, and CompiledForest walks all trees for a whole
+batch at once with NumPy gathers. Run this file directly to check it against scikit-learn and time both.
+"""
+
+import numpy as np
+
+FOREST_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+# Rows traversed together by CompiledForest.predict
+CHUNK_ROWS = 4096
+
+
+def _float32_thresholds(threshold):
+    """Round float64 split thresholds down to float32.
+
+    scikit-learn compares float32 features against float64 thresholds. For a
+    float32 x, x <= t holds exactly when x <= the largest float32 not above t,
+    so the rounded-down table gives identical splits at half the size.
+    """
+    rounded = threshold.astype(np.float32)
+    too_high = rounded.astype(np.float64) > threshold
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def _export_tree(tree, offset):
+    """Renumber one tree breadth-first so the two children of every split are adjacent"""
+    feature = np.zeros(tree.node_count, dtype=np.intp)
+    # Leaves test feature 0 against +inf and point back at themselves, so a
+    # fixed number of traversal steps leaves every row parked on its leaf.
+    threshold = np.full(tree.node_count, np.inf, dtype=np.float64)
+    left = np.empty(tree.node_count, dtype=np.intp)
+    value = np.empty(tree.node_count, dtype=np.float64)
+
+    order = [0]
+    new_ids = {0: 0}
+    for old in order:
+        new = new_ids[old]
+        value[new] = tree.value[old, 0, 0]
+        if tree.children_left[old] < 0:
+            left[new] = offset + new
+            continue
+        feature[new] = tree.feature[old]
+        threshold[new] = tree.threshold[old]
+        first_child = len(new_ids)
+        new_ids[tree.children_left[old]] = first_child
+        new_ids[tree.children_right[old]] = first_child + 1
+        order.extend((tree.children_left[old], tree.children_right[old]))
+        left[new] = offset + first_child
+    right = np.where(np.isinf(threshold), left, left + 1)
+    return feature, _float32_thresholds(threshold), left, right, value
+
+
+def can_compile(model):
+    """Whether predictions are the plain mean of the trees' leaf values, as CompiledForest computes them.
+
+    Boosted ensembles also have tree estimators_, but scale and sum them, so
+    they are served with their own predict instead.
+    """
+    from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+    return isinstance(model, (RandomForestRegressor, ExtraTreesRegressor))
+
+
+def export_forest(model):
+    """Flatten a fitted RandomForestRegressor or ExtraTreesRegressor into node tables"""
+    tables = []
+    roots = []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        if tree.n_outputs != 1:
+            raise ValueError("Only single-output tree ensembles can be compiled")
+        tables.append(_export_tree(tree, offset))
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    feature, threshold, left, right, value = (np.concatenate(column) for column in zip(*tables))
+    return {
+        'feature': feature,
+        'threshold': threshold,
+        'left': left,
+        'right': right,
+        'value': value,
+        'roots': np.array(roots, dtype=np.intp),
+        'max_depth': np.int32(max_depth),
+        'n_features': np.int32(model.n_features_in_),
+    }
+
+
+class CompiledForest:
+    """Batched pure-NumPy traversal over exported forest node tables"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def from_estimator(cls, model):
+        return cls(**export_forest(model))
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def predict(self, X):
+        """Average leaf value over all trees, matching RandomForestRegressor.predict.
+
+        X must be finite: a NaN always takes the left child here, whereas
+        scikit-learn follows each node's missing-value direction, so callers
+        reject NaN inputs before predicting.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected a 2-D array with {self.n_features} features")
+        if len(X) <= CHUNK_ROWS:
+            return self._predict_chunk(X)
+        # Bound the rows x trees cursor arrays, so a large batch stays cache-sized
+        out = np.empty(len(X))
+        for start in range(0, len(X), CHUNK_ROWS):
+            out[start:start + CHUNK_ROWS] = self._predict_chunk(X[start:start + CHUNK_ROWS])
+        return out
+
+    def _predict_chunk(self, X):
+        n_rows = X.shape[0]
+        # Feature-major copy, so the value for (row, feature) sits at feature * n_rows + row
+        columns = np.ascontiguousarray(X.T).ravel()
+        feature_base = self.feature * n_rows
+
+        # One (row, tree) cursor per element, walked one level per step; the
+        # right child of every split sits at left + 1.
+        rows = np.repeat(np.arange(n_rows, dtype=np.intp), self.n_trees)
+        nodes = np.tile(self.roots, n_rows)
+        for _ in range(self.max_depth):
+            x = columns.take(feature_base.take(nodes) + rows)
+            nodes = self.left.take(nodes) + (x > self.threshold.take(nodes))
+        return self.value.take(nodes).reshape(n_rows, self.n_trees).mean(axis=1)
+
+if __name__ == '__main__':
+    import time
+    import warnings
+
+    from model_artifact import load_estimator, load_land_artifact
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+    artifact = load_land_artifact()
+    model = load_estimator(artifact)
+    forest = artifact.forest
+    print(f"Compiled {forest.n_trees} trees, {len(forest.value)} nodes, max depth {forest.max_depth}")
+
+    rng = np.random.default_rng(0)
+    n_features = forest.n_features
+    for batch in (1, 10, 100, 1000, 20000):
+        X = np.zeros((batch, n_features))
+        X[:, 0] = rng.uniform(800, 7500, batch)
+        X[:, 1] = rng.uniform(0, 10, batch)
+        X[:, 2] = rng.integers(1, 6, batch)
+        X[np.arange(batch), rng.integers(3, n_features, batch)] = 1.0
+
+        expected = model.predict(X)
+        assert np.allclose(forest.predict(X), expected, rtol=1e-9), "compiled forest disagrees with sklearn"
+
+        timings = {}
+        for name, predict in (('sklearn', model.predict), ('compiled', forest.predict)):
+            repeats = max(3, 2000 // batch)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                predict(X)
+            timings[name] = (time.perf_counter() - start) / repeats * 1000
+        print(f"batch={batch:5d}  sklearn {timings['sklearn']:8.3f} ms  compiled {timings['compiled']:8.3f} ms"
+              f"  ({timings['sklearn'] / timings['compiled']:.1f}x)")
@@ -0,0 +1,308 @@
+"""Spatial index over parcel coordinates for neighbourhood and amenity features.
+
+    python geo_index.py fetch-amenities --data anomaly.csv --output amenities.csv   # one Overpass call
+    python geo_index.py build --data anomaly.csv --amenities amenities.csv
+    python geo_index.py bench
+
+The index is built once, from the cleaned transactions and, optionally, an
+offline amenity file (columns amenity, lat, lon). It is published under
+artifacts/geo_index/ and holds:
+
+- one point per parcel: its coordinates and its median price_per_sqm;
+- one set of points per amenity type.
+
+Points are stored as 3-D unit vectors in scipy KD-trees. Straight-line
+distance between unit vectors ranks neighbours the same as great-circle
+distance, and converts back to km exactly. A whole frame is answered in one
+vectorized query, and a single request takes well under a millisecond.
+
+The features (GeoIndex.feature_names) are:
+
+    neighbourhood_price_per_sqm  median over the k nearest *other* parcels within max_km
+    price_vs_neighbourhood       price_per_sqm / neighbourhood_price_per_sqm
+    nearest_<amenity>_km         great-circle distance to the closest amenity of each type
+
+A transaction's own parcel is left out of its neighbourhood, at training and
+at scoring time, so a parcel's own price can't make it look normal. Missing
+coordinates, or no neighbour within max_km, fall back to the medians
+recorded at build time.
+
+fetch-amenities replaces the per-row Overpass lookups that are commented out
+in land_valuation.py. It asks for every parcel location at once, with one
+`around` clause each, and writes the result for offline use.
+
+Train an anomaly model on these features with `python train_anomaly.py --geo`.
+The artifact records the geo index version it was fitted with, and
+anomaly_detect.py, score.py and app_anomaly.py (which then accepts latitude /
+longitude fields) load that same version.
+"""
+
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_artifact import GEO_INDEX_DIR, read_manifest, write_version
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_K = 10
+DEFAULT_MAX_KM = 25.0
+DEFAULT_AMENITIES = ['hospital', 'school', 'place_of_worship']
+OVERPASS_URL = os.getenv('OVERPASS_URL', 'https://overpass-api.de/api/interpreter')
+
+NEIGHBOURHOOD_FEATURES = ['neighbourhood_price_per_sqm', 'price_vs_neighbourhood']
+
+
+def _unit_vectors(lat, lon):
+    """Points on the unit sphere, where straight-line (chord) distance orders the same as great-circle distance"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+def _km_to_chord(km):
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def _kd_tree(coords_deg):
+    from scipy.spatial import cKDTree
+    coords_deg = np.asarray(coords_deg, dtype=np.float64).reshape(-1, 2)
+    return cKDTree(_unit_vectors(coords_deg[:, 0], coords_deg[:, 1]))
+
+
+class GeoIndex:
+    """Parcel price medians and amenity locations, searchable by coordinates"""
+
+    def __init__(self, parcel_ids, parcel_coords, parcel_price, amenities, k=DEFAULT_K, max_km=DEFAULT_MAX_KM,
+                 fill=None, version=None):
+        self.version = version
+        self.k = k
+        self.max_km = max_km
+        self.parcel_ids = np.asarray(parcel_ids)
+        self.parcel_coords = np.asarray(parcel_coords, dtype=np.float64)
+        self.parcel_price = np.asarray(parcel_price, dtype=np.float64)
+        self._parcel_row = {parcel: i for i, parcel in enumerate(self.parcel_ids.tolist())}
+        self._parcels = _kd_tree(parcel_coords)
+        # Misses (no parcel within max_km) come back as index len(self); they map to NaN
+        self._price_or_nan = np.append(self.parcel_price, np.nan)
+        self.amenity_types = sorted(amenities)
+        self.amenity_coords = {kind: np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+                               for kind, coords in amenities.items()}
+        self._amenities = {kind: _kd_tree(coords) for kind, coords in self.amenity_coords.items() if len(coords)}
+        self.fill = fill or {}
+        self.feature_names = NEIGHBOURHOOD_FEATURES + [f'nearest_{kind}_km' for kind in self.amenity_types]
+
+    @classmethod
+    def build(cls, data, amenities=None, k=DEFAULT_K, max_km=DEFAULT_MAX_KM,
+              parcel_col='Parcel ID', lat_col='Latitude', lon_col='Longitude'):
+        """Index from featurized transactions (with price_per_sqm) and an optional amenity frame"""
+        located = data.dropna(subset=[lat_col, lon_col, 'price_per_sqm'])
+        parcels = located.groupby(located[parcel_col].astype(str)).agg(
+            lat=(lat_col, 'first'), lon=(lon_col, 'first'), price=('price_per_sqm', 'median'))
+        points = {}
+        if amenities is not None:
+            amenities = amenities.dropna(subset=['lat', 'lon'])
+            points = {str(kind): group[['lat', 'lon']].to_numpy(dtype=np.float64)
+                      for kind, group in amenities.groupby('amenity')}
+        index = cls(parcels.index.to_numpy(dtype=str), parcels[['lat', 'lon']].to_numpy(dtype=np.float64),
+                    parcels['price'].to_numpy(), points, k=k, max_km=max_km)
+
+        # Fallbacks for rows the index can't place
+        index.fill = {'neighbourhood_price_per_sqm': float(parcels['price'].median())}
+        distances = index.amenity_distances(parcels['lat'].to_numpy(), parcels['lon'].to_numpy())
+        for kind, values in distances.items():
+            index.fill[f'nearest_{kind}_km'] = float(np.nanmedian(values)) if np.isfinite(values).any() else max_km
+        return index
+
+    def __len__(self):
+        return len(self.parcel_ids)
+
+    def parcel_location(self, parcel_id):
+        """(lat, lon) the index holds for a parcel, or (nan, nan) if it isn't indexed"""
+        row = self._parcel_row.get(str(parcel_id))
+        return tuple(self.parcel_coords[row]) if row is not None else (np.nan, np.nan)
+
+    def neighbourhood_price(self, lat, lon, parcel_ids=None):
+        """Median price_per_sqm of the k nearest other parcels within max_km (NaN where there are none)"""
+        points = _unit_vectors(lat, lon)
+        result = np.full(len(points), np.nan)
+        located = np.isfinite(points).all(axis=1)
+        if not located.any() or not len(self):
+            return result
+        # One extra neighbour in case the parcel itself comes back; a list k keeps the result 2-D
+        _, ind = self._parcels.query(points[located], k=list(range(1, self.k + 2)),
+                                     distance_upper_bound=_km_to_chord(self.max_km))
+        keep = ind < len(self)
+        if parcel_ids is not None:
+            own = np.array([self._parcel_row.get(str(p), -1) for p in np.asarray(parcel_ids)[located]])
+            keep &= ind != own[:, None]
+        keep &= np.cumsum(keep, axis=1) <= self.k
+
+        # Median of the kept prices: NaN sorts last, so the first `count` entries of each row are the valid ones
+        prices = np.sort(np.where(keep, self._price_or_nan[ind], np.nan), axis=1)
+        count = keep.sum(axis=1)
+        rows = np.arange(len(prices))
+        lower = prices[rows, np.maximum(count - 1, 0) // 2]
+        upper = prices[rows, count // 2]
+        result[located] = np.where(count > 0, (lower + upper) / 2, np.nan)
+        return result
+
+    def amenity_distances(self, lat, lon):
+        """{amenity type: km to the nearest one} (NaN where coordinates are missing)"""
+        points = _unit_vectors(lat, lon)
+        located = np.isfinite(points).all(axis=1)
+        distances = {}
+        for kind in self.amenity_types:
+            values = np.full(len(points), np.nan)
+            tree = self._amenities.get(kind)
+            if tree is not None and located.any():
+                values[located] = _chord_to_km(tree.query(points[located], k=1)[0])
+            distances[kind] = values
+        return distances
+
+    def features(self, lat, lon, price_per_sqm, parcel_ids=None):
+        """(n, len(feature_names)) float64 matrix, with missing values filled"""
+        neighbourhood = self.neighbourhood_price(lat, lon, parcel_ids)
+        neighbourhood = np.where(np.isnan(neighbourhood), self.fill.get('neighbourhood_price_per_sqm', np.nan),
+                                 neighbourhood)
+        columns = [neighbourhood, np.asarray(price_per_sqm, dtype=np.float64) / neighbourhood]
+        for kind, values in self.amenity_distances(lat, lon).items():
+            columns.append(np.where(np.isnan(values), self.fill.get(f'nearest_{kind}_km', self.max_km), values))
+        return np.column_stack(columns)
+
+    def add_features(self, data, parcel_col='Parcel ID', lat_col='Latitude', lon_col='Longitude'):
+        """Add the feature_names columns to a featurized transaction frame"""
+        values = self.features(data[lat_col].to_numpy(dtype=np.float64), data[lon_col].to_numpy(dtype=np.float64),
+                               data['price_per_sqm'].to_numpy(), data[parcel_col].astype(str).to_numpy())
+        for i, name in enumerate(self.feature_names):
+            data[name] = values[:, i]
+        return data
+
+    def save(self, source=None, root=GEO_INDEX_DIR):
+        """Publish as a new artifact version"""
+        def write_files(path):
+            np.save(os.path.join(path, 'parcel_ids.npy'), self.parcel_ids.astype(str))
+            np.save(os.path.join(path, 'parcel_coords.npy'), self.parcel_coords)
+            np.save(os.path.join(path, 'parcel_price.npy'), self.parcel_price)
+            for kind, coords in self.amenity_coords.items():
+                np.save(os.path.join(path, f'amenity_{kind}.npy'), coords)
+
+        manifest = {
+            'kind': 'geo_index',
+            'k': self.k,
+            'max_km': self.max_km,
+            'amenity_types': self.amenity_types,
+            'feature_names': self.feature_names,
+            'fill': self.fill,
+            'n_parcels': len(self),
+            'n_amenities': {kind: len(coords) for kind, coords in self.amenity_coords.items()},
+            'source': source,
+        }
+        return write_version(root, manifest, write_files)
+
+    @classmethod
+    def load(cls, root=GEO_INDEX_DIR, version=None):
+        version, path, manifest = read_manifest(root, version)
+
+        def array(name):
+            return np.load(os.path.join(path, f'{name}.npy'))
+
+        amenities = {kind: array(f'amenity_{kind}') for kind in manifest['amenity_types']}
+        return cls(array('parcel_ids'), array('parcel_coords'), array('parcel_price'), amenities,
+                   k=manifest['k'], max_km=manifest['max_km'], fill=manifest['fill'], version=version)
+
+
+def geo_index_for(artifact):
+    """The GeoIndex an anomaly artifact was trained with, or None if it uses no geo features"""
+    version = artifact.manifest.get('geo_index')
+    return GeoIndex.load(version=version) if version else None
+
+
+def fetch_amenities(points, types=DEFAULT_AMENITIES, radius_km=5.0, batch=100):
+    """Amenities of the given types around each (lat, lon), in one Overpass request per `batch` points"""
+    import requests
+
+    pattern = '|'.join(types)
+    frames = []
+    for start in range(0, len(points), batch):
+        around = ''.join(f'node["amenity"~"^({pattern})$"](around:{radius_km * 1000:.0f},{lat},{lon});'
+                         for lat, lon in points[start:start + batch])
+        query = f'[out:csv(amenity,::lat,::lon;true;",")][timeout:300];({around});out;'
+        response = requests.post(OVERPASS_URL, data={'data': query}, timeout=330)
+        response.raise_for_status()
+        frames.append(pd.read_csv(io.StringIO(response.text)).rename(columns={'@lat': 'lat', '@lon': 'lon'}))
+    return pd.concat(frames).drop_duplicates() if frames else pd.DataFrame(columns=['amenity', 'lat', 'lon'])
+
+
+def _transactions(path):
+    from anomaly_pipeline import load_transactions
+    return load_transactions(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch = commands.add_parser('fetch-amenities', help='download amenities around every parcel once')
+    fetch.add_argument('--data', default='anomaly.csv')
+    fetch.add_argument('--types', default=','.join(DEFAULT_AMENITIES), help='OSM amenity values')
+    fetch.add_argument('--radius-km', type=float, default=5.0)
+    fetch.add_argument('--output', default='amenities.csv')
+
+    build = commands.add_parser('build', help='publish a geo index artifact')
+    build.add_argument('--data', default='anomaly.csv')
+    build.add_argument('--amenities', help='CSV with amenity, lat, lon columns (e.g. from fetch-amenities)')
+    build.add_argument('--k', type=int, default=DEFAULT_K, help='neighbouring parcels per median')
+    build.add_argument('--max-km', type=float, default=DEFAULT_MAX_KM, help='ignore parcels further than this')
+
+    bench = commands.add_parser('bench', help='time single and vectorized lookups')
+    bench.add_argument('--version', help='geo index version (default: LATEST)')
+    bench.add_argument('--queries', type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'fetch-amenities':
+        data = _transactions(args.data)
+        points = data[['Latitude', 'Longitude']].dropna().drop_duplicates().to_numpy()
+        amenities = fetch_amenities(points, args.types.split(','), args.radius_km)
+        amenities.to_csv(args.output, index=False)
+        print(f"Wrote {len(amenities)} amenities around {len(points)} locations to {args.output}")
+
+    elif args.command == 'build':
+        start = time.perf_counter()
+        amenities = pd.read_csv(args.amenities) if args.amenities else None
+        index = GeoIndex.build(_transactions(args.data), amenities, k=args.k, max_km=args.max_km)
+        path = index.save(source={'data': args.data, 'amenities': args.amenities})
+        print(f"Indexed {len(index)} parcels and {len(index.amenity_types)} amenity types "
+              f"in {time.perf_counter() - start:.2f}s")
+        print(f"Geo index saved to {path}")
+
+    else:
+        index = GeoIndex.load(version=args.version)
+        rng = np.random.default_rng(0)
+        rows = rng.integers(len(index), size=args.queries)
+        coords = index.parcel_coords[rows] + rng.normal(0, 0.01, (args.queries, 2))
+        ids, price = index.parcel_ids[rows], index.parcel_price[rows]
+
+        start = time.perf_counter()
+        index.features(coords[:, 0], coords[:, 1], price, ids)
+        batch = time.perf_counter() - start
+        single = []
+        for i in range(min(args.queries, 2000)):
+            start = time.perf_counter()
+            index.features(coords[i:i + 1, 0], coords[i:i + 1, 1], price[i:i + 1], ids[i:i + 1])
+            single.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(np.array(single) * 1e3, [50, 99])
+        print(f"{len(index)} parcels, amenity types: {', '.join(index.amenity_types) or 'none'}")
+        print(f"vectorized: {args.queries} lookups in {batch * 1e3:.1f} ms ({args.queries / batch:,.0f}/s)")
+        print(f"single lookup: p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,586 @@
+"""Asynchronous bulk scoring jobs for the valuation and anomaly services.
+
+A district revaluation or a month of transactions is too much for one
+synchronous request. Instead, both apps register jobs_blueprint():
+
+    POST /jobs                  upload a CSV, Parquet or Arrow file (multipart field "file")
+                                -> 202 {"job_id": ..., "status_url": ..., "result_url": ...}
+    GET  /jobs/<id>             status and progress (chunks and rows done)
+    GET  /jobs/<id>/result      the scored rows as one CSV, streamed from the chunk files
+    POST /jobs/<id>/cancel      stop after the current chunk
+    GET  /jobs                  recent jobs of this service
+
+For the anomaly service (mounted at /anomaly under serve.py) the routes are
+/anomaly/jobs/...; its jobs score with the pre-screen rules unless the upload
+sets the form field prescreen=0.
+
+The uploaded file is split into chunks by score.py's shard planner: line
+ranges of a CSV, row groups of a Parquet file, batches of an Arrow file.
+Each chunk is scored with the same functions as score.py, then written to
+JOBS_DIR/<id>/part-NNNNN.csv under a temporary name and renamed. Only after
+that is it recorded in the SQLite store (JOBS_DB). A job pins the model
+version it started with.
+
+If the process dies, a restarted worker claims the job again and skips the
+chunks already recorded. A job counts as abandoned when the process that
+owned it is gone (same host) or its heartbeat is older than
+JOB_STALE_SECONDS. The owner's heartbeat is refreshed by a background
+thread while the job runs, however long one chunk or the preparation takes.
+A chunk is only recorded, and a job only finished, by its current owner: a
+worker whose job was reclaimed stops at its next chunk.
+
+Each app process runs JOB_WORKERS worker threads (default 1), started by
+its first request. Set JOB_WORKERS=0 to leave the jobs to separate worker
+processes:
+
+    python jobs.py worker --kind land --threads 2
+    python jobs.py list
+    python jobs.py submit anomaly transactions.parquet    # without the HTTP API
+    python jobs.py purge --older-than-days 7
+
+Other settings: JOB_CHUNK_ROWS (rows per chunk, default 50000; saved with
+each job when it is submitted, so a resumed job keeps its chunk boundaries)
+and JOB_POLL_INTERVAL (seconds between queue checks, default 1).
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context, url_for
+
+from metrics import counter, error_response
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(BASE_DIR, 'jobs'))
+JOBS_DB = os.getenv('JOBS_DB', os.path.join(JOBS_DIR, 'jobs.sqlite3'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+JOB_CHUNK_ROWS = int(os.getenv('JOB_CHUNK_ROWS', '50000'))
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '300'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+KINDS = ('land', 'anomaly')
+INPUT_EXTENSIONS = ('.csv', '.parquet', '.arrow', '.feather')
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+jobs_finished = counter('ml_jobs_finished_total', 'Bulk jobs that reached a final status', ['kind', 'status'])
+job_chunks = counter('ml_job_chunks_total', 'Bulk job chunks scored', ['kind'])
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, input TEXT NOT NULL, options TEXT NOT NULL,
+    model_version TEXT, chunks INTEGER, chunks_done INTEGER NOT NULL DEFAULT 0,
+    rows_in INTEGER NOT NULL DEFAULT 0, rows_out INTEGER NOT NULL DEFAULT 0, error TEXT,
+    owner TEXT, heartbeat REAL, created REAL NOT NULL, started REAL, finished REAL, updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (kind, status, created);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL, idx INTEGER NOT NULL, rows_in INTEGER NOT NULL, rows_out INTEGER NOT NULL,
+    seconds REAL NOT NULL, PRIMARY KEY (job_id, idx)
+);
+'''
+
+_PUBLIC_FIELDS = ('id', 'kind', 'status', 'model_version', 'chunks', 'chunks_done', 'rows_in', 'rows_out', 'error',
+                  'created', 'started', 'finished')
+
+
+def _owner():
+    """host:pid:thread of the calling worker thread"""
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def _owner_gone(owner):
+    """True when owner is a process on this host that no longer exists"""
+    parts = (owner or '').rsplit(':', 2)
+    if len(parts) != 3 or parts[0] != socket.gethostname() or not parts[1].isdigit():
+        return False
+    pid = parts[1]
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class JobStore:
+    """Job records and chunk progress in SQLite, shared by every process on the host"""
+
+    def __init__(self, path=JOBS_DB, directory=JOBS_DIR):
+        self.path = path
+        self.directory = directory
+        # One connection per thread and process: a connection must not cross a fork
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(_SCHEMA)
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def create(self, kind, filename, write_input, options=None):
+        """Register a queued job; write_input(path) saves the upload into the job directory"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in INPUT_EXTENSIONS:
+            raise ValueError(f"Unsupported file type {extension or filename!r} "
+                             f"(expected one of {', '.join(INPUT_EXTENSIONS)})")
+        # Completed chunks are recorded by index, so the chunking must not change if the job is resumed
+        options = dict(options or {}, chunk_rows=JOB_CHUNK_ROWS)
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        path = os.path.join(self.job_dir(job_id), f'input{extension}')
+        write_input(path)
+        now = time.time()
+        self._db().execute('INSERT INTO jobs (id, kind, status, input, options, created, updated) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (job_id, kind, QUEUED, path, json.dumps(options), now, now))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self._db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        return job
+
+    def list(self, kind=None, limit=50):
+        query = 'SELECT id FROM jobs' + (' WHERE kind = ?' if kind else '') + ' ORDER BY created DESC LIMIT ?'
+        rows = self._db().execute(query, ((kind,) if kind else ()) + (limit,)).fetchall()
+        return [self.get(row['id']) for row in rows]
+
+    def claim(self, kinds, owner):
+        """Take the oldest queued (or abandoned running) job of the given kinds, or None"""
+        db = self._db()
+        marks = ','.join('?' * len(kinds))
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            stale = time.time() - JOB_STALE_SECONDS
+            running = db.execute(f'SELECT id, owner, heartbeat FROM jobs WHERE status = ? AND kind IN ({marks})',
+                                 (RUNNING, *kinds)).fetchall()
+            abandoned = [row['id'] for row in running
+                         if row['owner'] != owner and ((row['heartbeat'] or 0) < stale or _owner_gone(row['owner']))]
+            row = db.execute(f'SELECT id FROM jobs WHERE status = ? AND kind IN ({marks}) ORDER BY created LIMIT 1',
+                             (QUEUED, *kinds)).fetchone()
+            job_id = abandoned[0] if abandoned else (row['id'] if row else None)
+            if job_id is not None:
+                now = time.time()
+                db.execute('UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, started = COALESCE(started, ?), '
+                           'updated = ? WHERE id = ?', (RUNNING, owner, now, now, now, job_id))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return self.get(job_id) if job_id is not None else None
+
+    def start(self, job_id, chunks, model_version):
+        """Record the chunk plan and pin the model version (kept if the job already has one)"""
+        self._db().execute('UPDATE jobs SET chunks = ?, model_version = COALESCE(model_version, ?), updated = ? '
+                           'WHERE id = ?', (chunks, model_version, time.time(), job_id))
+        return self.get(job_id)
+
+    def completed_chunks(self, job_id):
+        rows = self._db().execute('SELECT idx FROM job_chunks WHERE job_id = ?', (job_id,)).fetchall()
+        return {row['idx'] for row in rows}
+
+    def heartbeat(self, job_id, owner):
+        """Refresh a running job's heartbeat; False if owner no longer holds it"""
+        cursor = self._db().execute('UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ? AND status = ?',
+                                    (time.time(), job_id, owner, RUNNING))
+        return cursor.rowcount == 1
+
+    def holds(self, job_id, owner):
+        """Whether owner is still running this job"""
+        row = self._db().execute('SELECT owner, status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row is not None and row['owner'] == owner and row['status'] == RUNNING
+
+    def chunk_done(self, job_id, owner, index, rows_in, rows_out, seconds, publish=None):
+        """Record a scored chunk if owner still holds the job; returns False (nothing recorded) if not.
+
+        publish() moves the chunk's file into place inside the same
+        transaction, after the ownership check.
+        """
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT owner, status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or row['owner'] != owner or row['status'] != RUNNING:
+                db.execute('ROLLBACK')
+                return False
+            if publish is not None:
+                publish()
+            db.execute('INSERT OR IGNORE INTO job_chunks VALUES (?, ?, ?, ?, ?)',
+                       (job_id, index, rows_in, rows_out, seconds))
+            db.execute('UPDATE jobs SET chunks_done = (SELECT COUNT(*) FROM job_chunks WHERE job_id = ?), '
+                       'rows_in = (SELECT COALESCE(SUM(rows_in), 0) FROM job_chunks WHERE job_id = ?), '
+                       'rows_out = (SELECT COALESCE(SUM(rows_out), 0) FROM job_chunks WHERE job_id = ?), '
+                       'heartbeat = ?, updated = ? WHERE id = ?', (job_id, job_id, job_id, now, now, job_id))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return True
+
+    def finish(self, job_id, status, error=None, owner=None):
+        """Set a final status; with owner, only if that worker still holds the running job"""
+        now = time.time()
+        query = 'UPDATE jobs SET status = ?, error = ?, finished = ?, updated = ? WHERE id = ?'
+        params = (status, error, now, now, job_id)
+        if owner is not None:
+            query += ' AND owner = ? AND status = ?'
+            params += (owner, RUNNING)
+        return self._db().execute(query, params).rowcount == 1
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it had already finished"""
+        cursor = self._db().execute('UPDATE jobs SET status = ?, finished = ?, updated = ? '
+                                    'WHERE id = ? AND status IN (?, ?)',
+                                    (CANCELLED, time.time(), time.time(), job_id, QUEUED, RUNNING))
+        return cursor.rowcount > 0
+
+    def delete(self, job_id):
+        """Remove a job's record, chunk progress and files"""
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        db = self._db()
+        db.execute('DELETE FROM job_chunks WHERE job_id = ?', (job_id,))
+        db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def part_paths(self, job_id):
+        return sorted(glob.glob(os.path.join(self.job_dir(job_id), 'part-*.csv')))
+
+
+# ------------------------------
+# Scoring
+# ------------------------------
+
+class LandScorer:
+    def __init__(self, version=None):
+        from feature_encoding import ValuationEncoder
+        from model_artifact import load_estimator, load_land_artifact
+
+        artifact = load_land_artifact(version=version)
+        self.version = artifact.version
+        # Chunks are thousands of rows, where scikit-learn beats the compiled forest
+        self.model = load_estimator(artifact)
+        self.encoder = ValuationEncoder(artifact.feature_columns, artifact.locations, artifact.property_types)
+
+    def prepare(self, input_path):
+        pass
+
+    def score(self, input_path, shard):
+        """(rows read, scored frame) for one chunk"""
+        from columnar_cache import LAND_DATA_DTYPES
+        from score import read_shard, score_land_frame
+        data = read_shard(input_path, shard, LAND_DATA_DTYPES)
+        return len(data), score_land_frame(self.model, self.encoder, data)
+
+
+class AnomalyScorer:
+    def __init__(self, version=None, prescreen=True):
+        from geo_index import geo_index_for
+        from model_artifact import load_anomaly_artifact
+        from prescreen_rules import RULES
+
+        artifact = load_anomaly_artifact(version=version)
+        self.version = artifact.version
+        self.model = artifact.model
+        self.features = artifact.features
+        self.geo = geo_index_for(artifact)
+        self.rules = RULES if prescreen else None
+        self.history = self.medians = None
+
+    def prepare(self, input_path):
+        # days_since_prev and the fill-in medians come from the whole upload, as in score.py, not from the chunk
+        from score import build_history
+        self.history, self.medians = build_history(input_path)
+
+    def score(self, input_path, shard):
+        from columnar_cache import TRANSACTION_DTYPES
+        from score import read_shard, score_anomaly_frame
+        data = read_shard(input_path, shard, TRANSACTION_DTYPES)
+        return len(data), score_anomaly_frame(self.model, self.features, data, self.history, self.geo, self.rules,
+                                                  self.medians)
+
+
+def make_scorer(job):
+    if job['kind'] == 'land':
+        return LandScorer(job['model_version'])
+    return AnomalyScorer(job['model_version'], prescreen=job['options'].get('prescreen', True))
+
+
+class Heartbeat:
+    """Background thread that keeps a claimed job's heartbeat fresh until stopped"""
+
+    def __init__(self, store, job_id, owner, interval=JOB_STALE_SECONDS / 5):
+        self.store = store
+        self.job_id = job_id
+        self.owner = owner
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f'job-heartbeat:{job_id}', daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.store.heartbeat(self.job_id, self.owner):
+                    self.lost.set()
+                    return
+            except sqlite3.OperationalError as e:
+                print(f"Could not refresh heartbeat of job {self.job_id}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(store, job):
+    """Score a claimed job's remaining chunks; returns its final status ('reclaimed' if another worker took it)"""
+    from score import plan_shards
+
+    job_id, owner = job['id'], job['owner']
+    try:
+        with Heartbeat(store, job_id, owner) as heartbeat:
+            scorer = make_scorer(job)
+            shards = plan_shards(job['input'], job['options'].get('chunk_rows', JOB_CHUNK_ROWS))
+            job = store.start(job_id, len(shards), scorer.version)
+            done = store.completed_chunks(job_id)
+            if len(done) < len(shards):
+                scorer.prepare(job['input'])
+            for shard in shards:
+                if shard.index in done:
+                    continue
+                if heartbeat.lost.is_set() or not store.holds(job_id, owner):
+                    return _stopped(store, job_id, owner)
+                start = time.perf_counter()
+                rows_in, result = scorer.score(job['input'], shard)
+                part = os.path.join(store.job_dir(job_id), f'part-{shard.index:05d}.csv')
+                # Written under a name of our own, moved into place only if we still hold the job
+                staging = f'{part}.{os.getpid()}-{threading.get_ident()}.tmp'
+                result.to_csv(staging, index=False)
+                if not store.chunk_done(job_id, owner, shard.index, rows_in, len(result),
+                                        time.perf_counter() - start, publish=lambda: os.replace(staging, part)):
+                    os.remove(staging)
+                    return _stopped(store, job_id, owner)
+                job_chunks.inc(job['kind'])
+    except Exception as e:
+        if store.finish(job_id, FAILED, f'{type(e).__name__}: {e}', owner=owner):
+            jobs_finished.inc(job['kind'], FAILED)
+        return FAILED
+    if not store.finish(job_id, DONE, owner=owner):
+        return _stopped(store, job_id, owner)
+    jobs_finished.inc(job['kind'], DONE)
+    return DONE
+
+
+def _stopped(store, job_id, owner):
+    """Why a worker had to stop: the job was cancelled or deleted, or another worker reclaimed it"""
+    job = store.get(job_id)
+    if job is None or job['status'] == CANCELLED:
+        return CANCELLED
+    return 'reclaimed' if job['owner'] != owner else job['status']
+
+
+class JobWorkers:
+    """Threads that claim and run jobs of the given kinds, started once per process"""
+
+    def __init__(self, store, kinds, threads=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.store = store
+        self.kinds = tuple(kinds)
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        """Start the worker threads in this process if they aren't running (cheap to call per request)"""
+        if self._pid == os.getpid() or self.threads <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        for i in range(self.threads):
+            threading.Thread(target=self.work, name=f'job-worker:{"+".join(self.kinds)}:{i}', daemon=True).start()
+
+    def work(self, once=False):
+        owner = _owner()
+        while True:
+            try:
+                job = self.store.claim(self.kinds, owner)
+            except sqlite3.OperationalError as e:  # database locked for longer than the timeout
+                print(f"Job queue unavailable: {e}")
+                job = None
+            if job is not None:
+                print(f"Running {job['kind']} job {job['id']} ({job['chunks_done']} chunks already done)")
+                status = run_job(self.store, job)
+                print(f"Job {job['id']} {status}")
+            elif once:
+                return
+            else:
+                time.sleep(self.poll_interval)
+
+
+# ------------------------------
+# HTTP API
+# ------------------------------
+
+def describe(job):
+    info = {key: job[key] for key in _PUBLIC_FIELDS}
+    info['progress'] = round(job['chunks_done'] / job['chunks'], 4) if job['chunks'] else 0.0
+    return info
+
+
+def stream_parts(paths):
+    """The chunk CSVs as one CSV: every part's header but the first is skipped"""
+    for i, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            if i:
+                f.readline()
+            while True:
+                block = f.read(1 << 16)
+                if not block:
+                    break
+                yield block
+
+
+def jobs_blueprint(store, kind, workers=None, name='jobs'):
+    """Flask routes to submit, poll, cancel and download bulk jobs of one kind"""
+    bp = Blueprint(name, __name__)
+
+    def find(job_id):
+        job = store.get(job_id)
+        return job if job is not None and job['kind'] == kind else None
+
+    def links(job_id):
+        return {'status_url': url_for(f'{name}.job_status', job_id=job_id),
+                'result_url': url_for(f'{name}.job_result', job_id=job_id)}
+
+    @bp.before_request
+    def start_workers():
+        if workers is not None:
+            workers.ensure_running()
+
+    @bp.route('/jobs', methods=['POST'])
+    def submit_job():
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return error_response("Upload the file to score as multipart field 'file'", 'missing_field')
+        options = {}
+        if kind == 'anomaly':
+            options['prescreen'] = request.form.get('prescreen', '1') not in ('0', 'false', 'no')
+        try:
+            job = store.create(kind, upload.filename, upload.save, options)
+        except ValueError as e:
+            return error_response(str(e), 'unsupported_file')
+        return jsonify(dict(describe(job), job_id=job['id'], **links(job['id']))), 202
+
+    @bp.route('/jobs')
+    def list_jobs():
+        return jsonify({'jobs': [describe(job) for job in store.list(kind)]})
+
+    @bp.route('/jobs/<job_id>')
+    def job_status(job_id):
+        job = find(job_id)
+        if job is None:
+            return error_response("No such job", 'not_found', 404)
+        return jsonify(dict(describe(job), **links(job_id)))
+
+    @bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+    def cancel_job(job_id):
+        if find(job_id) is None:
+            return error_response("No such job", 'not_found', 404)
+        if not store.cancel(job_id):
+            return error_response("Job has already finished", 'job_finished', 409)
+        return jsonify(describe(store.get(job_id)))
+
+    @bp.route('/jobs/<job_id>/result')
+    def job_result(job_id):
+        job = find(job_id)
+        if job is None:
+            return error_response("No such job", 'not_found', 404)
+        if job['status'] != DONE:
+            return error_response(f"Job is {job['status']}; results are available once it is done", 'job_not_done',
+                                  409)
+        return Response(stream_with_context(stream_parts(store.part_paths(job_id))), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename="{kind}-{job_id}.csv"'})
+
+    return bp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='run queued jobs')
+    worker.add_argument('--kind', choices=KINDS, action='append', help='job kinds to run (default: all)')
+    worker.add_argument('--threads', type=int, default=1)
+    worker.add_argument('--once', action='store_true', help='exit when the queue is empty')
+    submit = commands.add_parser('submit', help='queue a file without the HTTP API')
+    submit.add_argument('kind', choices=KINDS)
+    submit.add_argument('input')
+    submit.add_argument('--no-prescreen', action='store_true', help='anomaly jobs: skip the rule pre-screen')
+    commands.add_parser('list', help='show recent jobs')
+    purge = commands.add_parser('purge', help='delete finished jobs and their files')
+    purge.add_argument('--older-than-days', type=float, default=7)
+    args = parser.parse_args(argv)
+
+    store = JobStore()
+    if args.command == 'worker':
+        pool = JobWorkers(store, args.kind or KINDS, threads=args.threads)
+        if args.once:
+            pool.work(once=True)
+            return
+        threads = [threading.Thread(target=pool.work, daemon=True) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        print(f"{args.threads} worker thread(s) for {', '.join(pool.kinds)} jobs; Ctrl-C to stop")
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'submit':
+        options = {'prescreen': not args.no_prescreen} if args.kind == 'anomaly' else {}
+        job = store.create(args.kind, args.input, lambda path: shutil.copyfile(args.input, path), options)
+        print(f"Queued {args.kind} job {job['id']}")
+    elif args.command == 'list':
+        for job in store.list():
+            info = describe(job)
+            print(f"{job['id']}  {job['kind']:<8} {job['status']:<10} {info['progress']:>6.0%}  "
+                  f"{job['rows_out']:>10} rows  {job['model_version'] or '-':<6} {job['error'] or ''}")
+    else:
+        cutoff = time.time() - args.older_than_days * 86400
+        removed = 0
+        for job in store.list(limit=1_000_000):
+            if job['status'] in (DONE, FAILED, CANCELLED) and (job['finished'] or 0) < cutoff:
+                store.delete(job['id'])
+                removed += 1
+        print(f"Removed {removed} finished jobs")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,15 @@
 import pandas as pd
 import numpy as np
 import requests
+
+from columnar_cache import read_land_data
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
 # --- 1. Load Dataset ---
-data = pd.read_csv("land_data.csv")
+# Typed columns come from the Parquet cache after the first run (see columnar_cache.py)
+data = read_land_data("land_data.csv")
 print("Columns in the dataset:")
 print(data.columns)
 
@@ -57,9 +60,14 @@ model.fit(X_train, y_train)
 
 # --- 5. Evaluation ---
 y_pred = model.predict(X_test)
-print("MAE:", mean_absolute_error(y_test, y_pred))
-print("RMSE:", np.sqrt(mean_squared_error(y_test, y_pred)))
-print("R²:", r2_score(y_test, y_pred))
+metrics = {
+    'mae': float(mean_absolute_error(y_test, y_pred)),
+    'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred))),
+    'r2': float(r2_score(y_test, y_pred)),
+}
+print("MAE:", metrics['mae'])
+print("RMSE:", metrics['rmse'])
+print("R²:", metrics['r2'])
 
 # --- 6. Feature Importance ---
 feature_importance = pd.DataFrame({
@@ -71,21 +79,14 @@ feature_importance = pd.DataFrame({
 # print(feature_importance)
 
 
-# --- 7. Save the Model ---
-import joblib
+# --- 7. Save the Model Artifact ---
+# Versioned directory with a JSON manifest and memory-mappable tree arrays (see model_artifact.py)
+from model_artifact import save_land_artifact
 
 # Get unique locations and property types from original data
-original_data = pd.read_csv("land_data.csv")
+original_data = read_land_data("land_data.csv", columns=['Location', 'Property_Type'])
 locations = list(original_data['Location'].unique())
 property_types = list(original_data['Property_Type'].unique())
 
-# Save model and metadata
-model_data = {
-    'model': model,
-    'locations': locations,
-    'property_types': property_types,
-    'feature_columns': X.columns.tolist()
-}
-
-joblib.dump(model_data, 'land_model.pkl')
-print("Model and metadata saved successfully!")
\ No newline at end of file
+artifact_path = save_land_artifact(model, locations, property_types, X.columns.tolist(), metrics=metrics)
+print(f"Model artifact saved to {artifact_path}")
@@ -0,0 +1,100 @@
+"""Closed-loop HTTP load test for the ML services.
+
+    python app.py &                                  # dev server, port 5000
+    python loadtest.py --url http://127.0.0.1:5000 --target predict
+    python serve.py &                                # production server, port 8000
+    python loadtest.py --url http://127.0.0.1:8000 --target predict
+
+Each of --concurrency threads keeps one HTTP/1.1 connection open and sends
+requests back to back for --duration seconds. Prints throughput, latency
+percentiles and error count. Targets:
+
+    predict        POST /predict, form fields, HTML response
+    predict-json   POST /predict, JSON body and response
+    anomaly        POST {--anomaly-prefix}/ with a JSON transaction
+    anomaly-form   POST {--anomaly-prefix}/ with form fields, HTML response
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+LAND_FIELDS = {'location': 'Salt Lake', 'area_sqft': 2400, 'property_type': 'Residential Plot',
+               'proximity_to_highway': 1.5, 'land_quality': 4}
+ANOMALY_FIELDS = {'parcel_id': 'P-LOADTEST', 'transaction_date': '2024-06-01', 'sale_price': 350000,
+                  'market_value': 320000, 'land_area': 100}
+
+
+def build_request(target, anomaly_prefix):
+    """(path, body, headers) for a target"""
+    if target == 'predict':
+        return '/predict', urlencode(LAND_FIELDS), {'Content-Type': 'application/x-www-form-urlencoded'}
+    if target == 'predict-json':
+        return '/predict', json.dumps(LAND_FIELDS), {'Content-Type': 'application/json'}
+    if target == 'anomaly':
+        return f'{anomaly_prefix}/', json.dumps(ANOMALY_FIELDS), {'Content-Type': 'application/json'}
+    if target == 'anomaly-form':
+        return f'{anomaly_prefix}/', urlencode(ANOMALY_FIELDS), {'Content-Type': 'application/x-www-form-urlencoded'}
+    raise ValueError(f"Unknown target {target!r}")
+
+
+def worker(host, port, path, body, headers, deadline, latencies, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('POST', path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+            if response.getheader('Connection', '').lower() == 'close':
+                conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(url, target, concurrency, duration, anomaly_prefix='/anomaly'):
+    parts = urlsplit(url)
+    path, body, headers = build_request(target, anomaly_prefix)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(parts.hostname, parts.port or 80, path, body, headers,
+                                                     deadline, latencies, errors))
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {'target': target, 'requests': len(latencies), 'errors': len(errors),
+              'rps': round(len(latencies) / elapsed, 1)}
+    if latencies:
+        ms = np.array(latencies) * 1e3
+        result.update(p50_ms=round(float(np.percentile(ms, 50)), 2), p99_ms=round(float(np.percentile(ms, 99)), 2))
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--target', default='predict', choices=['predict', 'predict-json', 'anomaly', 'anomaly-form'])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--anomaly-prefix', default='/anomaly',
+                        help="path of the anomaly app ('' when it runs standalone via app_anomaly.py)")
+    args = parser.parse_args()
+    result = run(args.url, args.target, args.concurrency, args.duration, args.anomaly_prefix)
+    print(json.dumps(result))
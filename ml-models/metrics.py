@@ -0,0 +1,348 @@
+"""Request metrics and slow-request profiling for the Flask services.
+
+instrument(app, service) adds:
+
+- Per-request counters and latency histograms, plus per-stage timers. Wrap a
+  step of a handler in `with stage('encode'):`, or call lap = stage_laps()
+  and then lap('parse'), lap('predict'), ... after each step. Outside a
+  request, both do nothing.
+- GET /metrics in the Prometheus text format. The metrics are:
+    ml_requests_total{service,endpoint,method,status}
+    ml_request_duration_seconds{service,endpoint}
+    ml_stage_duration_seconds{service,endpoint,stage}
+    ml_errors_total{service,endpoint,type}
+  Errors returned through error_response() are counted under their type, and
+  uncaught exceptions under their class name. Services add their own
+  counters with counter().
+
+The metrics are kept in plain dicts, so prometheus_client isn't needed. With
+several worker processes (serve.py), set METRICS_DIR to a directory shared
+by the workers. Every process then writes a snapshot there about once a
+second, and /metrics adds up the snapshots of all of them.
+
+Opt-in profiling: set PROFILE_SLOW_MS. A sampler thread then records the
+stack of every in-flight request every PROFILE_INTERVAL_MS (default 5). The
+stacks of requests slower than the threshold are appended to
+PROFILE_DIR/<service>.<endpoint>.folded (default: profiles/) as collapsed
+stacks, ready for flamegraph.pl or speedscope.
+"""
+
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, has_request_context, jsonify, request
+
+METRICS_DIR = os.getenv('METRICS_DIR')
+SNAPSHOT_INTERVAL = 1.0
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic count per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        key = tuple(map(str, labelvalues))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(total, values):
+        for key, value in values:
+            total[tuple(key)] = total.get(tuple(key), 0) + value
+
+    def render(self, merged):
+        for key, value in sorted(merged.items()):
+            yield f'{self.name}{_labels(self.labelnames, key)} {value}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        key = tuple(map(str, labelvalues))
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][slot] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(total, values):
+        for key, counts, value_sum in values:
+            entry = total.setdefault(tuple(key), [[0] * len(counts), 0.0])
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += value_sum
+
+    def render(self, merged):
+        for key, (counts, value_sum) in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound))
+                yield f'{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {value_sum}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}'
+
+
+class Registry:
+    """All metrics of this process, optionally merged with other processes' snapshots in METRICS_DIR"""
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.metrics = {}
+        self._flusher_pid = None
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def write_snapshot(self):
+        path = self._snapshot_path(os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def ensure_flushing(self):
+        """Start this process's snapshot thread if METRICS_DIR is set (cheap to call per request)"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._flush_forever, name='metrics-flusher', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                print(f"Could not write metrics snapshot to {self.directory}: {e}")
+
+    def collect(self):
+        """{name: {labels: value}} for this process plus every other process's latest snapshot"""
+        snapshots = [self.snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = f'{os.getpid()}.json'
+            for entry in os.listdir(self.directory):
+                if entry.endswith('.json') and entry != own:
+                    try:
+                        with open(os.path.join(self.directory, entry)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue  # a worker replacing its file right now
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                if name in self.metrics:
+                    self.metrics[name].merge(merged[name], values)
+        return merged
+
+    def render(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines += [f'# HELP {name} {metric.help}', f'# TYPE {name} {metric.kind}']
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, help, labelnames=()):
+    return registry.register(Counter(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return registry.register(Histogram(name, help, labelnames, buckets))
+
+
+requests_total = counter('ml_requests_total', 'Requests handled', ['service', 'endpoint', 'method', 'status'])
+request_seconds = histogram('ml_request_duration_seconds', 'Time in the Flask handler', ['service', 'endpoint'])
+stage_seconds = histogram('ml_stage_duration_seconds', 'Time in one step of a handler',
+                          ['service', 'endpoint', 'stage'])
+errors_total = counter('ml_errors_total', 'Error responses and uncaught exceptions',
+                       ['service', 'endpoint', 'type'])
+slow_requests_total = counter('ml_slow_requests_profiled_total', 'Requests over PROFILE_SLOW_MS',
+                              ['service', 'endpoint'])
+
+
+def _service():
+    return current_app.config.get('METRICS_SERVICE', current_app.name)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as one stage of the current request"""
+    if not has_request_context():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, _service(), _endpoint(), name)
+
+
+def stage_laps():
+    """Stage timer for straight-line handler code: lap('parse') records the time since the previous lap"""
+    last = [time.perf_counter()]
+
+    def lap(name):
+        now = time.perf_counter()
+        if has_request_context():
+            stage_seconds.observe(now - last[0], _service(), _endpoint(), name)
+        last[0] = now
+    return lap
+
+
+def error_response(message, kind, status=400):
+    """JSON error response, counted in ml_errors_total under `kind`"""
+    errors_total.inc(_service(), _endpoint(), kind)
+    g.metrics_error_counted = True
+    return jsonify({"error": message}), status
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight requests and keeps those of slow ones"""
+
+    def __init__(self, threshold_ms, interval_ms=PROFILE_INTERVAL_MS, directory=PROFILE_DIR):
+        self.threshold = threshold_ms / 1e3
+        self.interval = interval_ms / 1e3
+        self.directory = directory
+        self._active = {}  # thread ident -> Tally of collapsed stacks
+        self._sampler_pid = None
+        self._write_lock = threading.Lock()
+
+    def begin(self):
+        if self._sampler_pid != os.getpid():
+            self._sampler_pid = os.getpid()
+            threading.Thread(target=self._sample_forever, name='slow-request-sampler', daemon=True).start()
+        self._active[threading.get_ident()] = Tally()
+
+    def end(self, elapsed, service, endpoint):
+        stacks = self._active.pop(threading.get_ident(), None)
+        if stacks is None or elapsed < self.threshold:
+            return
+        slow_requests_total.inc(service, endpoint)
+        if not stacks:
+            return  # finished between two samples
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{service}.{endpoint}.folded')
+        with self._write_lock, open(path, 'a') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in stacks.items())
+
+    def _sample_forever(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for ident, stacks in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is None or ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stacks[';'.join(reversed(names))] += 1
+
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_MS) if PROFILE_SLOW_MS > 0 else None
+
+
+def instrument(app, service):
+    """Time every request of `app`, count errors and serve GET /metrics"""
+    app.config['METRICS_SERVICE'] = service
+
+    @app.before_request
+    def start_timer():
+        registry.ensure_flushing()
+        g.metrics_start = time.perf_counter()
+        if profiler is not None:
+            profiler.begin()
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('metrics_start')
+        if start is not None and request.endpoint != 'metrics':
+            g.metrics_elapsed = time.perf_counter() - start
+            g.metrics_status = response.status_code
+            requests_total.inc(service, _endpoint(), request.method, response.status_code)
+            request_seconds.observe(g.metrics_elapsed, service, _endpoint())
+        return response
+
+    @app.teardown_request
+    def record_errors(exc):
+        # Runs after after_request, also for requests that raised
+        status = g.get('metrics_status', 500)
+        if exc is not None:
+            errors_total.inc(service, _endpoint(), type(exc).__name__)
+        elif status >= 400 and not g.get('metrics_error_counted'):
+            errors_total.inc(service, _endpoint(), f'http_{status}')
+        if profiler is not None:
+            profiler.end(g.get('metrics_elapsed', 0.0), service, _endpoint())
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
@@ -0,0 +1,235 @@
+"""Versioned, memory-mappable model artifacts.
+
+Each model kind lives in its own directory under artifacts/, one subdirectory
+per version:
+
+    artifacts/land_model/   (anomaly_model/, retrieval_index/, geo_index/ and valuation_surface/ have the same layout)
+        LATEST              <- name of the active version, replaced atomically
+        v0001/
+            manifest.json   <- metadata (locations, property_types, feature_columns, ...)
+            feature.npy     <- forest node tables, opened with mmap_mode='r'
+            threshold.npy
+            ...
+            model.joblib    <- fitted estimator, used for large batches and LAND_MODEL_ENGINE=sklearn
+
+A valuation model that can't be compiled to node tables (e.g. the
+HistGradientBoostingRegressor train_search.py may select) is stored as
+model.joblib alone; its manifest has "forest": null and the artifact's
+`forest` is the unpickled estimator, so callers predict the same way.
+
+A version directory is written under a temporary name and renamed into place
+before LATEST is updated, so readers never see a half-written artifact. Because
+the tree arrays are memory-mapped read-only, every worker process on a host
+shares one copy of their pages.
+"""
+
+import json
+import os
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from forest_engine import FOREST_ARRAYS, CompiledForest, can_compile, export_forest
+
+FORMAT_VERSION = 1
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_ROOT = os.getenv('MODEL_ARTIFACT_ROOT', os.path.join(BASE_DIR, 'artifacts'))
+LAND_MODEL_DIR = os.path.join(ARTIFACT_ROOT, 'land_model')
+ANOMALY_MODEL_DIR = os.path.join(ARTIFACT_ROOT, 'anomaly_model')
+RETRIEVAL_INDEX_DIR = os.path.join(ARTIFACT_ROOT, 'retrieval_index')
+GEO_INDEX_DIR = os.path.join(ARTIFACT_ROOT, 'geo_index')
+VALUATION_SURFACE_DIR = os.path.join(ARTIFACT_ROOT, 'valuation_surface')
+
+MANIFEST = 'manifest.json'
+LATEST = 'LATEST'
+ESTIMATOR = 'model.joblib'
+CALIBRATION = 'calibration.npy'
+
+_VERSION_RE = re.compile(r'^v(\d+)$')
+
+LandArtifact = namedtuple('LandArtifact', [
+    'version', 'path', 'manifest', 'forest', 'locations', 'property_types', 'feature_columns',
+])
+AnomalyArtifact = namedtuple('AnomalyArtifact', ['version', 'path', 'manifest', 'model', 'features'])
+
+
+def list_versions(root):
+    """Published version names under root, oldest first"""
+    if not os.path.isdir(root):
+        return []
+    versions = [name for name in os.listdir(root)
+                if _VERSION_RE.match(name) and os.path.exists(os.path.join(root, name, MANIFEST))]
+    return sorted(versions, key=lambda name: int(name[1:]))
+
+
+def latest_version(root):
+    """Version named by the LATEST pointer, falling back to the newest directory"""
+    try:
+        with open(os.path.join(root, LATEST)) as f:
+            version = f.read().strip()
+        if os.path.exists(os.path.join(root, version, MANIFEST)):
+            return version
+    except FileNotFoundError:
+        pass
+    versions = list_versions(root)
+    return versions[-1] if versions else None
+
+
+def write_version(root, manifest, write_files):
+    """Create the next version directory, fill it and publish it as LATEST.
+
+    write_files(path) writes the payload files into the staging directory;
+    the manifest is written last. Returns the new version directory.
+    """
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f'.staging-{os.getpid()}-{time.time_ns()}')
+    os.makedirs(staging)
+    write_files(staging)
+
+    while True:
+        versions = list_versions(root)
+        version = f'v{int(versions[-1][1:]) + 1 if versions else 1:04d}'
+        manifest = dict(manifest, format_version=FORMAT_VERSION, version=version,
+                        created_at=time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        try:
+            os.rename(staging, os.path.join(root, version))
+            break
+        except OSError:
+            # Another trainer published the same version number first
+            if not os.path.exists(os.path.join(root, version)):
+                raise
+
+    pointer = os.path.join(root, f'.{LATEST}.tmp-{os.getpid()}')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, LATEST))
+    return os.path.join(root, version)
+
+
+def read_manifest(root, version=None):
+    """Return (version, path, manifest) for a version, defaulting to LATEST"""
+    version = version or latest_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No model artifact found in {root}")
+    path = os.path.join(root, version)
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format_version')!r} in {path}")
+    return version, path, manifest
+
+
+def save_land_artifact(model, locations, property_types, feature_columns, metrics=None, root=LAND_MODEL_DIR,
+                       search=None):
+    """Write a fitted valuation model and its metadata as a new artifact version.
+
+    search is the train_search.py summary (candidates, Pareto front, selection
+    rule) of the search that picked this model, if any.
+    """
+    import joblib
+
+    arrays = export_forest(model) if can_compile(model) else {}
+
+    def write_files(path):
+        for name in FOREST_ARRAYS if arrays else ():
+            np.save(os.path.join(path, f'{name}.npy'), arrays[name])
+        joblib.dump(model, os.path.join(path, ESTIMATOR))
+
+    manifest = {
+        'kind': 'land_valuation',
+        'estimator': type(model).__name__,
+        'locations': [str(loc) for loc in locations],
+        'property_types': [str(pt) for pt in property_types],
+        'feature_columns': [str(col) for col in feature_columns],
+        'forest': {
+            'n_trees': int(len(arrays['roots'])),
+            'n_nodes': int(len(arrays['value'])),
+            'max_depth': int(arrays['max_depth']),
+            'n_features': int(arrays['n_features']),
+        } if arrays else None,
+        'metrics': metrics or {},
+    }
+    if search is not None:
+        manifest['search'] = search
+    return write_version(root, manifest, write_files)
+
+
+def load_land_artifact(root=LAND_MODEL_DIR, version=None, mmap=True):
+    """Open a valuation artifact; the node tables are memory-mapped read-only by default"""
+    version, path, manifest = read_manifest(root, version)
+    if manifest['forest'] is None:
+        import joblib
+        model = joblib.load(os.path.join(path, ESTIMATOR))
+        return LandArtifact(version, path, manifest, model, manifest['locations'],
+                            manifest['property_types'], manifest['feature_columns'])
+    mmap_mode = 'r' if mmap else None
+    # np.asarray drops the memmap subclass without copying, keeping take() on the fast path
+    arrays = {name: np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode))
+              for name in FOREST_ARRAYS}
+    forest = CompiledForest(**arrays, max_depth=manifest['forest']['max_depth'],
+                            n_features=manifest['forest']['n_features'])
+    if forest.n_features != len(manifest['feature_columns']):
+        raise ValueError(f"Forest in {path} does not match its feature_columns")
+    return LandArtifact(version, path, manifest, forest, manifest['locations'],
+                        manifest['property_types'], manifest['feature_columns'])
+
+
+def load_estimator(artifact):
+    """Unpickle the fitted scikit-learn estimator stored alongside an artifact"""
+    import joblib
+    if not isinstance(artifact.forest, CompiledForest):
+        return artifact.forest  # already the unpickled estimator
+    return joblib.load(os.path.join(artifact.path, ESTIMATOR))
+
+
+def save_anomaly_artifact(model, features, training, root=ANOMALY_MODEL_DIR, geo_index=None, calibration=None):
+    """Write a fitted IsolationForest, its feature schema and training lineage as a new version.
+
+    geo_index is the version of the geo index (see geo_index.py) the model's
+    neighbourhood features were computed with, if it uses any. calibration is
+    a bounded sample of the training history's feature rows, which warm-start
+    refits recalibrate the threshold on (see train_anomaly.py).
+    """
+    import joblib
+
+    def write_files(path):
+        joblib.dump(model, os.path.join(path, ESTIMATOR))
+        if calibration is not None:
+            np.save(os.path.join(path, CALIBRATION), np.asarray(calibration, dtype=np.float64))
+
+    manifest = {
+        'kind': 'anomaly_detection',
+        'estimator': type(model).__name__,
+        'features': list(features),
+        'params': {
+            'n_estimators': int(model.n_estimators),
+            'contamination': model.contamination,
+            'random_state': model.random_state,
+        },
+        'training': training,
+    }
+    if geo_index:
+        manifest['geo_index'] = geo_index
+    return write_version(root, manifest, write_files)
+
+
+def load_anomaly_artifact(root=ANOMALY_MODEL_DIR, version=None):
+    """Load an anomaly model artifact and its feature schema"""
+    import joblib
+
+    version, path, manifest = read_manifest(root, version)
+    model = joblib.load(os.path.join(path, ESTIMATOR))
+    return AnomalyArtifact(version, path, manifest, model, manifest['features'])
+
+
+def load_calibration(artifact):
+    """The artifact's calibration sample (rows x features), or None if it was saved without one"""
+    try:
+        return np.load(os.path.join(artifact.path, CALIBRATION))
+    except FileNotFoundError:
+        return None
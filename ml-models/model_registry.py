@@ -0,0 +1,183 @@
+"""Hot reloading of model artifacts for the Flask services.
+
+A ModelRegistry holds the active model as one immutable bundle (a namedtuple
+built by a load function). A background thread polls the artifact
+directory's LATEST pointer every MODEL_POLL_INTERVAL seconds. When it names
+a new version, the bundle is loaded off the request path and swapped in with
+a single reference assignment. A request reads registry.current once and
+uses that bundle throughout, so in-flight requests finish on the version
+they started with. If a version fails to load, the error is recorded and
+the current bundle stays active.
+
+The watcher thread is started lazily, by the first request a process serves
+(ensure_watching()). A gunicorn master that preloads the app and then forks
+therefore doesn't leave its workers without a watcher.
+
+A pin (rollback) is written to a PINNED file next to LATEST, and every
+registry on the host watches both files. So every gunicorn worker serves the
+pinned version within one poll interval, not just the one that handled the
+request, and the pin survives a restart.
+
+admin_blueprint() adds GET /admin/model (active version and reload status)
+and POST /admin/model/reload (reload now, or pin {"version": "v0003"}; an
+empty body un-pins). Set MODEL_ADMIN_TOKEN to require a matching
+X-Admin-Token header on both. Without it, reload is disabled.
+"""
+
+import os
+import threading
+import time
+
+from flask import Blueprint, jsonify, request
+
+from model_artifact import LATEST, latest_version
+
+PINNED = 'PINNED'
+
+POLL_INTERVAL = float(os.getenv('MODEL_POLL_INTERVAL', '10'))
+ADMIN_TOKEN = os.getenv('MODEL_ADMIN_TOKEN')
+
+
+class ModelRegistry:
+    """Active model bundle for one artifact root, reloaded when LATEST changes"""
+
+    def __init__(self, root, load, poll_interval=POLL_INTERVAL, on_swap=None):
+        self.root = root
+        self._load = load
+        self.poll_interval = poll_interval
+        self._on_swap = on_swap
+        self._reload_lock = threading.Lock()
+        self._watcher_pid = None
+        self.status = {'loaded_at': None, 'last_check': None, 'last_error': None, 'swaps': 0}
+
+        # Raises FileNotFoundError when nothing has been published yet
+        pinned = self.pinned
+        version = pinned if pinned and os.path.isdir(os.path.join(root, pinned)) else latest_version(root)
+        if version is None:
+            raise FileNotFoundError(f"No model artifact found in {root}")
+        self._current = load(version)
+        self.status['loaded_at'] = time.time()
+
+    @property
+    def current(self):
+        """The active bundle; read it once per request"""
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    @property
+    def pinned(self):
+        """Version named by the PINNED file, or None when following LATEST"""
+        try:
+            with open(os.path.join(self.root, PINNED)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_pin(self, version):
+        path = os.path.join(self.root, PINNED)
+        if version is None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return
+        staging = os.path.join(self.root, f'.{PINNED}.tmp-{os.getpid()}')
+        with open(staging, 'w') as f:
+            f.write(version)
+        os.replace(staging, path)
+
+    def refresh(self, version=None):
+        """Activate `version` (default: LATEST, unless pinned) if it isn't active already; True if swapped"""
+        with self._reload_lock:
+            self.status['last_check'] = time.time()
+            target = version or self.pinned or latest_version(self.root)
+            if target is None or target == self._current.version:
+                return False
+            try:
+                bundle = self._load(target)
+            except Exception as e:
+                self.status['last_error'] = f"{target}: {type(e).__name__}: {e}"
+                print(f"Could not load model {target} from {self.root}: {e}")
+                return False
+            self._current = bundle
+            self.status.update(loaded_at=time.time(), last_error=None, swaps=self.status['swaps'] + 1)
+            print(f"Activated model {bundle.version} from {self.root}")
+        if self._on_swap is not None:
+            self._on_swap(bundle)
+        return True
+
+    def pin(self, version):
+        """Serve `version` in every process until un-pinned with pin(None), which goes back to LATEST.
+
+        The pin is only written once the version has loaded here, so a bad
+        version never reaches the other workers.
+        """
+        swapped = self.refresh(version or latest_version(self.root))
+        if version is not None and self._current.version != version:
+            return swapped
+        self._write_pin(version)
+        return swapped
+
+    def ensure_watching(self):
+        """Start the polling thread in this process if it isn't running (cheap to call per request)"""
+        if self._watcher_pid == os.getpid() or self.poll_interval <= 0:
+            return
+        with self._reload_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name=f'model-watcher:{os.path.basename(self.root)}',
+                         daemon=True).start()
+
+    def _watch(self):
+        pointers = [os.path.join(self.root, LATEST), os.path.join(self.root, PINNED)]
+        last_seen = None
+        while True:
+            time.sleep(self.poll_interval)
+            seen = []
+            for pointer in pointers:
+                try:
+                    stat = os.stat(pointer)
+                    seen.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+                except FileNotFoundError:
+                    seen.append(None)
+            if seen != last_seen:
+                last_seen = seen
+                self.refresh()
+
+    def describe(self):
+        return dict(self.status, root=self.root, version=self._current.version, pinned=self.pinned,
+                    latest=latest_version(self.root), poll_interval=self.poll_interval,
+                    watching=self._watcher_pid == os.getpid(), pid=os.getpid())
+
+
+def admin_blueprint(registry, name='model_admin'):
+    """Flask routes to inspect and reload a registry"""
+    admin = Blueprint(name, __name__)
+
+    @admin.before_request
+    def check_token():
+        if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+            return jsonify({"error": "Invalid admin token"}), 403
+
+    @admin.route('/admin/model')
+    def model_status():
+        return jsonify(registry.describe())
+
+    @admin.route('/admin/model/reload', methods=['POST'])
+    def reload_model():
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Model reload is disabled; set MODEL_ADMIN_TOKEN to enable it"}), 403
+        payload = request.get_json(silent=True) or {}
+        version = payload.get('version')
+        if version is not None and not isinstance(version, str):
+            return jsonify({"error": "version must be a string like 'v0003'"}), 400
+        swapped = registry.pin(version)
+        if version is not None and registry.version != version:
+            return jsonify(dict(registry.describe(), swapped=False)), 400
+        return jsonify(dict(registry.describe(), swapped=swapped))
+
+    return admin
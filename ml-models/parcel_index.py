@@ -0,0 +1,160 @@
+"""In-memory index of transaction dates per parcel.
+
+Maps each parcel ID to a sorted array of transaction days (proleptic Gregorian
+ordinals), so days_since_prev for a transaction is one bisect on its parcel's
+array instead of a sort + groupby over the whole history.
+
+The anomaly service builds it at startup from the cleaned transaction file,
+the same rows the model is trained on. Checking a transaction only reads the
+index. Recorded transactions are added through a TransactionLog, a SQLite
+table that every worker process on the host reads (sync()), so all workers
+see the same history and a restart keeps it. Transactions are keyed by
+their registration number, and a key already in the index is not added twice.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime
+
+import pandas as pd
+
+from anomaly_pipeline import clean_transactions, parcel_id_col, transaction_date_col
+from columnar_cache import read_transactions
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_DB = os.getenv('ANOMALY_HISTORY_DB', os.path.join(BASE_DIR, 'parcel_history.sqlite3'))
+REGISTRATION_COL = 'Registration No'
+
+
+def _day(value):
+    """Date-like value -> ordinal day number"""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    if isinstance(value, pd.Timestamp):
+        return value.date().toordinal()
+    return datetime.strptime(value, '%Y-%m-%d').toordinal()
+
+
+class ParcelHistoryIndex:
+    """Parcel ID -> sorted transaction days, with O(log n) previous-transaction lookups"""
+
+    def __init__(self):
+        self._days = {}
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._log_position = 0
+        self._synced_at = 0.0
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from an iterable of (parcel_id, date) pairs, e.g. a stream of ingested transactions"""
+        index = cls()
+        for parcel_id, day in records:
+            index._days.setdefault(parcel_id, array('i')).append(_day(day))
+        # Sort every parcel once instead of inserting one at a time
+        for parcel_id, days in index._days.items():
+            index._days[parcel_id] = array('i', sorted(days))
+        return index
+
+    @classmethod
+    def from_transactions(cls, data, key_col=REGISTRATION_COL):
+        """Build from a cleaned transaction frame (see anomaly_pipeline.clean_transactions)"""
+        data = data[data[parcel_id_col].notna()]
+        index = cls.from_records(zip(data[parcel_id_col].astype(str), data[transaction_date_col]))
+        if key_col in data:
+            index._keys.update(data[key_col].dropna().astype(str))
+        return index
+
+    @classmethod
+    def from_file(cls, path='anomaly.csv'):
+        """Build from the transactions in a file that training would keep"""
+        return cls.from_transactions(clean_transactions(read_transactions(path)))
+
+    def __len__(self):
+        return len(self._days)
+
+    @property
+    def n_transactions(self):
+        return sum(len(days) for days in self._days.values())
+
+    def known(self, key):
+        """Whether a transaction with this key is indexed"""
+        return key in self._keys
+
+    def add(self, parcel_id, day, key=None):
+        """Record a transaction; False if one with the same key is already indexed"""
+        with self._lock:
+            if key is not None:
+                if key in self._keys:
+                    return False
+                self._keys.add(key)
+            insort(self._days.setdefault(parcel_id, array('i')), _day(day))
+            return True
+
+    def sync(self, log, max_age=0.0):
+        """Add the transactions appended to log since the last sync (at most every max_age seconds)"""
+        now = time.monotonic()
+        if max_age and now - self._synced_at < max_age:
+            return 0
+        self._synced_at = now
+        added = 0
+        for position, key, parcel_id, day in log.since(self._log_position):
+            added += self.add(parcel_id, date.fromordinal(day), key)
+            self._log_position = position
+        return added
+
+    def days_since_prev(self, parcel_id, day, ingested=False):
+        """Days between a transaction and the previous one on the same parcel (0 if none).
+
+        Matches the groupby().shift(1) feature in anomaly_pipeline.add_features:
+        an earlier transaction on the same day counts as 0 days. Pass
+        ingested=True when the transaction itself is already in the index.
+        """
+        days = self._days.get(parcel_id)
+        if not days:
+            return 0
+        day = _day(day)
+        with self._lock:
+            if not ingested:
+                i = bisect_right(days, day)
+                return day - days[i - 1] if i else 0
+            first = bisect_left(days, day)
+            if bisect_right(days, day) - first > 1:
+                return 0
+            return day - days[first - 1] if first else 0
+
+
+class TransactionLog:
+    """Recorded transactions in SQLite, shared by every process on the host"""
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        # One connection per thread and process: a connection must not cross a fork
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS transactions '
+                       '(key TEXT PRIMARY KEY, parcel_id TEXT NOT NULL, day INTEGER NOT NULL, recorded REAL NOT NULL)')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def append(self, key, parcel_id, day):
+        """Persist a transaction; False if its key was recorded before"""
+        cursor = self._db().execute('INSERT OR IGNORE INTO transactions (key, parcel_id, day, recorded) '
+                                    'VALUES (?, ?, ?, ?)', (key, parcel_id, _day(day), time.time()))
+        return cursor.rowcount == 1
+
+    def since(self, position):
+        """(position, key, parcel_id, day) of the transactions appended after position"""
+        return self._db().execute('SELECT rowid, key, parcel_id, day FROM transactions WHERE rowid > ? '
+                                  'ORDER BY rowid', (position,)).fetchall()
@@ -0,0 +1,128 @@
+"""LRU cache of single-parcel valuations for app.py.
+
+The cache key is a canonical form of the parsed request (parse_inputs strips
+the categorical fields for both the key and the model): area_sqft /
+proximity_to_highway are rounded to
+PREDICTION_CACHE_ROUNDING decimals (default: area to whole square feet,
+proximity to 0.01 km). Only the key is rounded. On a miss the model sees
+the values as sent (parse_inputs), exactly as without the cache and as in
+/predict/batch, so a hit returns the answer computed for the first request
+that rounded to the same key.
+
+Entries are tagged with the model artifact version. When a different version
+is loaded, set_version() empties the cache. Optional TTL, in seconds, with
+PREDICTION_CACHE_TTL (0 = no expiry).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '10000'))
+CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', '0'))
+
+
+def parse_rounding(spec):
+    """'area_sqft=0,proximity_to_highway=2' -> {'area_sqft': 0, 'proximity_to_highway': 2}"""
+    rounding = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, digits = item.partition('=')
+        rounding[name.strip()] = int(digits)
+    return rounding
+
+
+ROUNDING = parse_rounding(os.getenv('PREDICTION_CACHE_ROUNDING', 'area_sqft=0,proximity_to_highway=2'))
+
+
+def parse_inputs(location, property_type, area_sqft, proximity_to_highway, land_quality):
+    """Request fields as the values the model is called with.
+
+    Categorical fields are stripped; the numbers must be finite and
+    land_quality a whole number.
+    """
+    location = location.strip() if isinstance(location, str) else location
+    property_type = property_type.strip() if isinstance(property_type, str) else property_type
+    area_sqft, proximity_to_highway = float(area_sqft), float(proximity_to_highway)
+    if not (math.isfinite(area_sqft) and math.isfinite(proximity_to_highway)):
+        raise ValueError("area_sqft and proximity_to_highway must be finite numbers")
+    quality = float(land_quality)
+    if not quality.is_integer():
+        raise ValueError(f"land_quality must be a whole number, got {land_quality!r}")
+    return (location, property_type, area_sqft, proximity_to_highway, int(quality))
+
+
+def canonical_inputs(location, property_type, area_sqft, proximity_to_highway, land_quality, rounding=None):
+    """Cache key for the output of parse_inputs"""
+    rounding = ROUNDING if rounding is None else rounding
+    area = round(area_sqft, rounding.get('area_sqft', 0))
+    proximity = round(proximity_to_highway, rounding.get('proximity_to_highway', 2))
+    return (location, property_type, area, proximity, land_quality)
+
+
+class PredictionCache:
+    """Thread-safe LRU (+ optional TTL) of canonical inputs -> prediction for one model version"""
+
+    def __init__(self, version=None, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_version(self, version):
+        """Switch to a new model version, dropping every cached prediction if it changed"""
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                if self._entries:
+                    self.counters['invalidations'] += 1
+                self._entries.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.counters['expired'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def put(self, key, value, version=None):
+        """Store a prediction; ignored if it was computed by a model version other than the current one"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def get_or_compute(self, key, compute, version=None):
+        """Cached value for key, or compute() and store it; bypasses the cache if version isn't the current one"""
+        if version is not None and version != self.version:
+            return compute()
+        value = self.get(key)
+        if value is None:
+            version = self.version if version is None else version
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(self.counters, version=self.version, entries=len(self._entries),
+                        max_entries=self.max_entries, ttl=self.ttl,
+                        hit_rate=round(self.counters['hits'] / lookups, 4) if lookups else 0.0)
@@ -0,0 +1,213 @@
+"""Rule-based pre-screen that runs before the IsolationForest.
+
+Some transactions don't need the model. A disputed title or a resale within
+days is suspicious whatever the price looks like. A gift or inheritance
+recorded at zero has no price to judge. Each rule is a row of data:
+
+    Rule(name, outcome, reason, when=[(column, op, value), ...])
+
+A rule matches a row when all of its clauses hold. Every clause is one
+vectorized comparison over a whole NumPy column, so screening costs a few
+array passes however many rows there are. The outcome of a row comes from
+the first rule it matches, in list order:
+
+    anomaly     flagged without calling the model (anomaly_score -1)
+    ineligible  not scored (anomaly_score 0, is_anomaly False)
+    model       no rule matched; the IsolationForest decides
+
+Only the `model` rows reach the forest. The output gets two extra columns:
+`prescreen`, holding the outcome, and `prescreen_reasons`, listing every
+rule the row matched separated by '; ', not just the first one.
+
+Rules can also be loaded from a JSON list of {"name", "outcome", "reason",
+"when"} objects (anomaly_detect.py --rules rules.json). Clause ops are eq, ne,
+in, not_in, lt, le, gt, ge, between (inclusive) and isna / notna (value
+ignored). Comparisons with a missing value are false. Whatever the rules,
+an undecided row the model can't take (no positive amount or area, so a
+missing or infinite feature) is marked ineligible as `not_scorable`.
+
+    python prescreen_rules.py --data anomaly.csv    # rule hits on a file, without the model
+"""
+
+import argparse
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from feature_encoding import predict_rows
+
+ANOMALY = 'anomaly'
+INELIGIBLE = 'ineligible'
+MODEL = 'model'
+OUTCOMES = (ANOMALY, INELIGIBLE, MODEL)
+
+# A resale of the same parcel within this many days is flagged outright
+RESALE_DAYS = int(os.getenv('PRESCREEN_RESALE_DAYS', '30'))
+
+Rule = namedtuple('Rule', ['name', 'outcome', 'reason', 'when'])
+
+RULES = [
+    Rule('disputed_title', ANOMALY, 'title is under dispute',
+         [('Encumbrances', 'eq', 'Dispute')]),
+    Rule('rapid_resale', ANOMALY, f'parcel resold within {RESALE_DAYS} days',
+         [('Transaction Type', 'eq', 'Sale'), ('days_since_prev', 'between', (1, RESALE_DAYS))]),
+    Rule('zero_amount_transfer', INELIGIBLE, 'gift or inheritance with no consideration',
+         [('Transaction Type', 'in', ['Gift', 'Inheritance']), ('Transaction Amount', 'le', 0)]),
+    Rule('zero_amount_sale', ANOMALY, 'sale or mortgage recorded with no amount',
+         [('Transaction Type', 'in', ['Sale', 'Mortgage']), ('Transaction Amount', 'le', 0)]),
+]
+
+# Reason given to undecided rows whose features the model can't take (e.g. no positive area)
+NOT_SCORABLE = 'not_scorable'
+
+
+def _missing(values):
+    return np.asarray(pd.isna(values), dtype=bool)
+
+
+def _equal(values, value):
+    # Object columns compare elementwise; a missing value never equals anything
+    return np.asarray(values == value, dtype=bool)
+
+
+def _one_of(values, choices):
+    mask = np.zeros(len(values), dtype=bool)
+    for choice in choices:
+        mask |= _equal(values, choice)
+    return mask
+
+
+def _ordered(compare):
+    def op(values, value):
+        values = np.asarray(values, dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            return compare(values, value)
+    return op
+
+
+CLAUSE_OPS = {
+    'eq': _equal,
+    'ne': lambda values, value: ~_equal(values, value) & ~_missing(values),
+    'in': _one_of,
+    'not_in': lambda values, value: ~_one_of(values, value) & ~_missing(values),
+    'lt': _ordered(np.less),
+    'le': _ordered(np.less_equal),
+    'gt': _ordered(np.greater),
+    'ge': _ordered(np.greater_equal),
+    'between': _ordered(lambda values, bounds: (values >= bounds[0]) & (values <= bounds[1])),
+    'isna': lambda values, value: _missing(values),
+    'notna': lambda values, value: ~_missing(values),
+}
+
+
+def validate_rules(rules):
+    for rule in rules:
+        if rule.outcome not in (ANOMALY, INELIGIBLE):
+            raise ValueError(f"Rule {rule.name!r}: outcome must be {ANOMALY!r} or {INELIGIBLE!r}, "
+                             f"got {rule.outcome!r}")
+        for column, op, _ in rule.when:
+            if op not in CLAUSE_OPS:
+                raise ValueError(f"Rule {rule.name!r}: unknown op {op!r} on {column!r}")
+    return rules
+
+
+def load_rules(path):
+    """Rules from a JSON file (see the module docstring for the format)"""
+    with open(path) as f:
+        return validate_rules([Rule(r['name'], r['outcome'], r.get('reason', r['name']),
+                                    [tuple(clause) for clause in r['when']]) for r in json.load(f)])
+
+
+def _column(series):
+    """A column as a NumPy array: float64 with NaN for numbers, objects with None for anything else"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return series.to_numpy(dtype=object, na_value=None)
+
+
+def rule_masks(data, rules=RULES):
+    """{rule name: boolean mask} over the rows of data; a rule on a missing column never matches"""
+    columns = {}
+    masks = {}
+    for rule in rules:
+        mask = np.ones(len(data), dtype=bool)
+        for column, op, value in rule.when:
+            if column not in data:
+                mask[:] = False
+                break
+            if column not in columns:
+                columns[column] = _column(data[column])
+            mask &= CLAUSE_OPS[op](columns[column], value)
+        masks[rule.name] = mask
+    return masks
+
+
+def evaluate(data, rules=RULES, features=None):
+    """(outcome, reasons) arrays: the first matching rule's outcome (MODEL if none) and all rule hits.
+
+    With features, undecided rows with a missing or infinite feature value
+    are ineligible (reason NOT_SCORABLE) instead of being left to the model.
+    """
+    masks = rule_masks(data, rules)
+    if features is not None:
+        undecided = ~np.logical_or.reduce([masks[rule.name] for rule in rules] + [np.zeros(len(data), bool)])
+        finite = np.isfinite(data[list(features)].to_numpy(dtype=np.float64, na_value=np.nan)).all(axis=1)
+        masks[NOT_SCORABLE] = undecided & ~finite
+        rules = list(rules) + [Rule(NOT_SCORABLE, INELIGIBLE, 'features the model cannot score', [])]
+    outcome = np.select([masks[rule.name] for rule in rules], [rule.outcome for rule in rules], MODEL)
+    reasons = np.full(len(data), '', dtype=object)
+    for rule in rules:
+        mask = masks[rule.name]
+        if mask.any():
+            reasons[mask] = np.where(reasons[mask] == '', rule.name, reasons[mask] + '; ' + rule.name)
+    return outcome.astype(object), reasons
+
+
+def prescreen_and_score(model, features, data, rules=RULES):
+    """Add prescreen, prescreen_reasons, anomaly_score and is_anomaly; the model only sees undecided rows"""
+    outcome, reasons = evaluate(data, rules, features)
+    data['prescreen'] = outcome
+    data['prescreen_reasons'] = reasons
+    score = np.where(outcome == ANOMALY, -1, 0)
+    undecided = outcome == MODEL
+    if undecided.any():
+        score[undecided] = predict_rows(model, data.loc[undecided, list(features)].to_numpy(dtype=np.float64))
+    data['anomaly_score'] = score
+    data['is_anomaly'] = score == -1
+    return data
+
+
+def summarize(data):
+    """{outcome: rows} plus {rule name: hits} of a prescreened frame"""
+    hits = {}
+    for reasons in data.loc[data['prescreen_reasons'] != '', 'prescreen_reasons']:
+        for name in reasons.split('; '):
+            hits[name] = hits.get(name, 0) + 1
+    return {outcome: int((data['prescreen'] == outcome).sum()) for outcome in OUTCOMES}, hits
+
+
+def main(argv=None):
+    from anomaly_pipeline import load_transactions
+    from feature_encoding import ANOMALY_FEATURES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='anomaly.csv', help='transaction file (default: anomaly.csv)')
+    parser.add_argument('--rules', help='JSON rules file (default: the built-in RULES)')
+    args = parser.parse_args(argv)
+
+    rules = load_rules(args.rules) if args.rules else RULES
+    data = load_transactions(args.data, keep_unscorable=True)
+    data['prescreen'], data['prescreen_reasons'] = evaluate(data, rules, ANOMALY_FEATURES)
+    outcomes, hits = summarize(data)
+    print(f"{len(data)} transactions: " + ', '.join(f"{count} {outcome}" for outcome, count in outcomes.items()))
+    for rule in rules:
+        print(f"  {rule.name:<22} {hits.get(rule.name, 0):>6}  {rule.outcome:<10} {rule.reason}")
+    if hits.get(NOT_SCORABLE):
+        print(f"  {NOT_SCORABLE:<22} {hits[NOT_SCORABLE]:>6}  {INELIGIBLE:<10} features the model cannot score")
+
+
+if __name__ == '__main__':
+    main()
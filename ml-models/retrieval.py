@@ -0,0 +1,307 @@
+"""BM25 retrieval over land registration documents, for grounding the chatbot.
+
+    python retrieval.py build --docs docs/           # index every .txt / .md file under docs/
+    python retrieval.py query "documents for mutation"
+    python retrieval.py bench --synthetic 50000      # build + query latency
+
+Documents are split into passages of about CHUNK_WORDS words (paragraphs are
+kept together where they fit; longer ones are windowed with overlap). The
+index is a versioned artifact under artifacts/retrieval_index/ (see
+model_artifact.py), stored as flat arrays that are memory-mapped on load:
+
+    postings_ptr.npy     <- CSR row pointers, one row per term
+    postings_doc.npy     <- passage IDs per term, ascending
+    postings_weight.npy  <- precomputed BM25 weight of the term in that passage
+    text.npy, text_ptr.npy, source.npy  <- UTF-8 passage text, offsets, source file
+
+A query is scored by summing its terms' posting weights (np.bincount over
+the concatenated postings), so its cost grows with the postings touched,
+not with the corpus size.
+"""
+
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from model_artifact import RETRIEVAL_INDEX_DIR, read_manifest, write_version
+
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 20
+K1 = 1.2
+B = 0.75
+
+DOC_EXTENSIONS = ('.txt', '.md')
+INDEX_ARRAYS = ('postings_ptr', 'postings_doc', 'postings_weight', 'text', 'text_ptr', 'source')
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+Passage = namedtuple('Passage', ['text', 'source', 'score'])
+SearchResult = namedtuple('SearchResult', ['passages', 'coverage'])
+
+
+def tokenize(text):
+    """Lower-case words without stop words, with plurals folded ("documents" -> "document")"""
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word in ENGLISH_STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split a document into passages of at most chunk_words words"""
+    passages, current = [], []
+    for paragraph in re.split(r'\n\s*\n', text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if len(current) + len(words) > chunk_words and current:
+            passages.append(' '.join(current))
+            current = []
+        if len(words) <= chunk_words:
+            current.extend(words)
+            continue
+        step = chunk_words - overlap
+        for start in range(0, len(words), step):
+            passages.append(' '.join(words[start:start + chunk_words]))
+            if start + chunk_words >= len(words):
+                break
+    if current:
+        passages.append(' '.join(current))
+    return passages
+
+
+def read_documents(docs_dir):
+    """(relative path, text) for every document under docs_dir"""
+    for folder, _, files in sorted(os.walk(docs_dir)):
+        for name in sorted(files):
+            if name.lower().endswith(DOC_EXTENSIONS):
+                path = os.path.join(folder, name)
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    yield os.path.relpath(path, docs_dir), f.read()
+
+
+def build_arrays(documents):
+    """BM25 index arrays for an iterable of (source, text) documents"""
+    sources, passages, passage_source = [], [], []
+    for source, text in documents:
+        chunks = chunk_text(text)
+        if chunks:
+            passage_source.extend([len(sources)] * len(chunks))
+            passages.extend(chunks)
+            sources.append(source)
+    if not passages:
+        raise ValueError("No passages to index")
+
+    vocab = {}
+    term_ids, doc_ids, counts = [], [], []
+    lengths = np.empty(len(passages), dtype=np.float32)
+    for doc, passage in enumerate(passages):
+        terms = tokenize(passage)
+        lengths[doc] = len(terms)
+        for term, count in Counter(terms).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(doc)
+            counts.append(count)
+
+    term_ids = np.asarray(term_ids, dtype=np.int32)
+    doc_ids = np.asarray(doc_ids, dtype=np.int32)
+    tf = np.asarray(counts, dtype=np.float32)
+
+    # Group postings by term; a stable sort keeps passage IDs ascending within each term
+    order = np.argsort(term_ids, kind='stable')
+    term_ids, doc_ids, tf = term_ids[order], doc_ids[order], tf[order]
+    doc_freq = np.bincount(term_ids, minlength=len(vocab))
+    ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(doc_freq, out=ptr[1:])
+
+    n = len(passages)
+    idf = np.log(1 + (n - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+    norm = K1 * (1 - B + B * lengths[doc_ids] / max(lengths.mean(), 1))
+    weight = idf[term_ids] * tf * (K1 + 1) / (tf + norm)
+
+    encoded = [p.encode('utf-8') for p in passages]
+    text_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in encoded], out=text_ptr[1:])
+
+    arrays = {
+        'postings_ptr': ptr,
+        'postings_doc': doc_ids,
+        'postings_weight': weight.astype(np.float32),
+        'text': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'text_ptr': text_ptr,
+        'source': np.asarray(passage_source, dtype=np.int32),
+    }
+    terms = sorted(vocab, key=vocab.get)
+    return arrays, terms, sources
+
+
+def save_index(arrays, terms, sources, docs_dir=None, root=RETRIEVAL_INDEX_DIR):
+    """Publish an index as a new artifact version"""
+    def write_files(path):
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), arrays[name])
+        with open(os.path.join(path, 'terms.json'), 'w') as f:
+            json.dump(terms, f)
+
+    manifest = {
+        'kind': 'retrieval_index',
+        'scoring': {'method': 'bm25', 'k1': K1, 'b': B},
+        'chunking': {'words': CHUNK_WORDS, 'overlap': CHUNK_OVERLAP},
+        'docs_dir': docs_dir,
+        'sources': sources,
+        'n_passages': int(len(arrays['source'])),
+        'n_terms': len(terms),
+    }
+    return write_version(root, manifest, write_files)
+
+
+class BM25Index:
+    """Read-only BM25 index over memory-mapped postings"""
+
+    def __init__(self, arrays, terms, sources, version=None):
+        self.version = version
+        self.sources = sources
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        self._ptr = arrays['postings_ptr']
+        self._doc = arrays['postings_doc']
+        self._weight = arrays['postings_weight']
+        self._text = arrays['text']
+        self._text_ptr = arrays['text_ptr']
+        self._source = arrays['source']
+
+    @classmethod
+    def load(cls, root=RETRIEVAL_INDEX_DIR, version=None):
+        version, path, manifest = read_manifest(root, version)
+        arrays = {name: np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+                  for name in INDEX_ARRAYS}
+        with open(os.path.join(path, 'terms.json')) as f:
+            terms = json.load(f)
+        return cls(arrays, terms, manifest['sources'], version)
+
+    def __len__(self):
+        return len(self._source)
+
+    def passage(self, doc, score=0.0):
+        text = bytes(self._text[self._text_ptr[doc]:self._text_ptr[doc + 1]]).decode('utf-8')
+        return Passage(text, self.sources[self._source[doc]], float(score))
+
+    def search(self, query, k=3):
+        """Top-k passages and how much of the query (by IDF weight) the best passage covers"""
+        term_ids = [self._term_ids[t] for t in dict.fromkeys(tokenize(query)) if t in self._term_ids]
+        if not term_ids:
+            return SearchResult([], 0.0)
+        slices = [slice(self._ptr[t], self._ptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self._doc[s] for s in slices])
+        scores = np.bincount(docs, weights=np.concatenate([self._weight[s] for s in slices]), minlength=len(self))
+
+        k = min(k, np.count_nonzero(scores))
+        if k == 0:
+            return SearchResult([], 0.0)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        # Share of the query's term importance present in the best passage; unknown terms count as missing
+        best, covered, total = top[0], 0.0, 0.0
+        for s in slices:
+            posting_docs = self._doc[s]
+            i = np.searchsorted(posting_docs, best)
+            idf = float(np.log(1 + (len(self) - len(posting_docs) + 0.5) / (len(posting_docs) + 0.5)))
+            total += idf
+            if i < len(posting_docs) and posting_docs[i] == best:
+                covered += idf
+        n_unknown = len(set(tokenize(query))) - len(term_ids)
+        total += n_unknown * float(np.log(1 + (len(self) + 0.5) / 0.5))
+        return SearchResult([self.passage(doc, scores[doc]) for doc in top], covered / total)
+
+
+def build(docs_dir, root=RETRIEVAL_INDEX_DIR):
+    arrays, terms, sources = build_arrays(read_documents(docs_dir))
+    return save_index(arrays, terms, sources, docs_dir=os.path.abspath(docs_dir), root=root)
+
+
+def synthetic_documents(n_passages, seed=0):
+    """Random documents over a Zipf-distributed vocabulary, for benchmarking"""
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f'term{i}' for i in range(50_000)])
+    per_doc = 20
+    for d in range(0, n_passages, per_doc):
+        paragraphs = []
+        for _ in range(min(per_doc, n_passages - d)):
+            ids = np.minimum(rng.zipf(1.3, size=CHUNK_WORDS - 10), len(vocab)) - 1
+            paragraphs.append(' '.join(vocab[ids]))
+        yield f'synthetic/{d // per_doc:05d}.txt', '\n\n'.join(paragraphs)
+
+
+def bench(docs_dir=None, synthetic=0, n_queries=1000, k=3):
+    """Time index build, load and queries; queries are drawn from the indexed passages"""
+    documents = list(synthetic_documents(synthetic) if synthetic else read_documents(docs_dir))
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        path = save_index(*build_arrays(documents), root=root)
+        build_s = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+        start = time.perf_counter()
+        index = BM25Index.load(root)
+        load_ms = (time.perf_counter() - start) * 1e3
+
+        rng = np.random.default_rng(1)
+        queries = []
+        for doc in rng.integers(0, len(index), size=n_queries):
+            words = index.passage(doc).text.split()
+            queries.append(' '.join(rng.choice(words, size=min(6, len(words)), replace=False)))
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, k)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1e3
+
+    print(f"Passages: {len(index):,}  terms: {len(index._term_ids):,}  index size: {size / 1e6:.1f} MB")
+    print(f"Build: {build_s:.2f}s  load (mmap): {load_ms:.1f}ms")
+    print(f"Query latency over {n_queries} queries: p50 {np.percentile(timings, 50):.2f}ms  "
+          f"p99 {np.percentile(timings, 99):.2f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_cmd = commands.add_parser('build', help='index a folder of documents')
+    build_cmd.add_argument('--docs', default=os.getenv('CHAT_DOCS_DIR', 'docs'))
+    build_cmd.add_argument('--root', default=RETRIEVAL_INDEX_DIR)
+    query_cmd = commands.add_parser('query', help='print the top passages for a question')
+    query_cmd.add_argument('text')
+    query_cmd.add_argument('-k', type=int, default=3)
+    query_cmd.add_argument('--root', default=RETRIEVAL_INDEX_DIR)
+    bench_cmd = commands.add_parser('bench', help='time index build and query latency')
+    bench_cmd.add_argument('--docs', help='documents to index (default: --synthetic)')
+    bench_cmd.add_argument('--synthetic', type=int, default=20_000, help='number of random passages')
+    bench_cmd.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        path = build(args.docs, args.root)
+        index = BM25Index.load(args.root)
+        print(f"Indexed {len(index)} passages from {len(index.sources)} documents into {path}")
+    elif args.command == 'query':
+        result = BM25Index.load(args.root).search(args.text, args.k)
+        print(f"Coverage of the query by the best passage: {result.coverage:.0%}")
+        for passage in result.passages:
+            print(f"\n[{passage.score:.2f}] {passage.source}\n{passage.text}")
+    else:
+        bench(args.docs, 0 if args.docs else args.synthetic, args.queries)
+
+
+if __name__ == '__main__':
+    main()
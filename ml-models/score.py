@@ -0,0 +1,251 @@
+"""Score a large file with a fitted model artifact across CPU cores.
+
+    python score.py land --input parcels.parquet --output valued.parquet --workers 32
+    python score.py anomaly --input transactions.csv --output scored.parquet --workers 32
+
+The input (CSV, Parquet or Arrow IPC) is split into row-range shards: whole
+lines by byte offset for CSV, groups of row groups / record batches for the
+columnar formats. The shards are scored in a ProcessPoolExecutor. Each worker
+loads the model once at startup. Land shards are scored with the fitted
+scikit-learn estimator, which is faster than the compiled forest for batches
+of this size. Results are written to
+--output in input order, with a bounded number of shards in flight.
+
+For the anomaly model, days_since_prev is looked up in a ParcelHistoryIndex
+built once from the cleaned --history file (default: the input itself), so
+shard boundaries don't split a parcel's history. Missing numeric values are
+filled with the medians of the whole --input, computed in the same pass, so
+scores don't depend on --shard-rows or --workers. Rows are not deduplicated
+across shards.
+Pre-screen rules (prescreen_rules.py; --rules, or --no-prescreen to skip
+them) decide the obvious rows first, so only the rest reach the model.
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from anomaly_pipeline import (add_price_features, clean_transactions, numeric_cols, parcel_id_col,
+                              scorable_mask, transaction_date_col)
+from columnar_cache import (LAND_DATA_DTYPES, TRANSACTION_DTYPES, TableWriter, coerce_numeric, csv_dtypes,
+                            read_transactions)
+from feature_encoding import ValuationEncoder, predict_rows
+from geo_index import geo_index_for
+from model_artifact import load_anomaly_artifact, load_estimator, load_land_artifact
+from parcel_index import ParcelHistoryIndex
+from prescreen_rules import RULES, load_rules, prescreen_and_score
+
+PREDICTION_COL = 'Predicted_Price_INR'
+
+# A shard is rows [start, stop) of a columnar file (in row groups / record
+# batches) or bytes [start, stop) of a CSV, always on line boundaries
+Shard = namedtuple('Shard', ['index', 'unit', 'start', 'stop'])
+
+
+def plan_shards(path, shard_rows):
+    """Split a file into shards of roughly shard_rows rows"""
+    lower = path.lower()
+    if lower.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        metadata = pq.ParquetFile(path).metadata
+        sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        return _group_units(sizes, shard_rows, 'row_group')
+    if lower.endswith(('.arrow', '.feather')):
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            sizes = [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+        return _group_units(sizes, shard_rows, 'batch')
+    return _csv_byte_shards(path, shard_rows)
+
+
+def _group_units(sizes, shard_rows, unit):
+    shards, start, rows = [], 0, 0
+    for i, size in enumerate(sizes):
+        rows += size
+        if rows >= shard_rows or i == len(sizes) - 1:
+            shards.append(Shard(len(shards), unit, start, i + 1))
+            start, rows = i + 1, 0
+    return shards
+
+
+def _csv_byte_shards(path, shard_rows):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        sample = f.readlines(1 << 20)
+        bytes_per_row = max(1, sum(map(len, sample)) // max(1, len(sample)))
+        shard_bytes = max(1 << 16, shard_rows * bytes_per_row)
+
+        offsets = [len(header)]
+        while offsets[-1] + shard_bytes < size:
+            f.seek(offsets[-1] + shard_bytes)
+            f.readline()  # move to the next line boundary
+            if f.tell() >= size:
+                break
+            offsets.append(f.tell())
+        offsets.append(size)
+    return [Shard(i, 'byte', start, stop) for i, (start, stop) in enumerate(zip(offsets, offsets[1:]))]
+
+
+def read_shard(path, shard, dtypes=None):
+    if shard.unit == 'row_group':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).read_row_groups(range(shard.start, shard.stop)).to_pandas()
+    if shard.unit == 'batch':
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            batches = [reader.get_batch(i) for i in range(shard.start, shard.stop)]
+            return pa.Table.from_batches(batches).to_pandas()
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(shard.start)
+        body = f.read(shard.stop - shard.start)
+    return coerce_numeric(pd.read_csv(io.BytesIO(header + body), dtype=csv_dtypes(dtypes)), dtypes)
+
+
+def score_land_frame(model, encoder, data):
+    """Append the predicted price to rows with the land_data.csv columns"""
+    data[PREDICTION_COL] = predict_rows(model, encoder.encode_frame(data))
+    return data
+
+
+def _medians(data):
+    return {col: float(data[col].median()) for col in numeric_cols}
+
+
+def transaction_medians(path):
+    """Medians of the numeric columns over a whole file, as clean_transactions fills gaps with"""
+    return _medians(read_transactions(path, columns=numeric_cols, use_cache=False).drop_duplicates())
+
+
+def build_history(path):
+    """(ParcelHistoryIndex, medians) over the transactions the batch pipeline would keep after cleaning"""
+    # Inputs are one-off files, so read just these columns rather than building a Parquet cache of them
+    data = read_transactions(path, columns=[parcel_id_col, transaction_date_col] + numeric_cols,
+                             use_cache=False).drop_duplicates()
+    medians = _medians(data)
+    data = clean_transactions(data, medians, drop_duplicates=False)
+    return ParcelHistoryIndex.from_records(zip(data[parcel_id_col].astype(str), data[transaction_date_col])), medians
+
+
+def score_anomaly_frame(model, features, data, history, geo=None, rules=None, medians=None):
+    """Clean, featurize and score a frame of transactions; days_since_prev comes from history.
+
+    Pass the medians of the whole input (see build_history), otherwise gaps
+    are filled with the medians of this frame alone.
+    """
+    data = add_price_features(clean_transactions(data, medians, drop_duplicates=False,
+                                                 drop_unscorable=rules is None))
+    # Only scorable rows are in the history; the others are left for the pre-screen with NaN
+    scorable = scorable_mask(data)
+    days = np.full(len(data), np.nan)
+    days[scorable] = np.fromiter(
+        (history.days_since_prev(parcel, day, ingested=True)
+         for parcel, day in zip(data.loc[scorable, parcel_id_col].astype(str),
+                                data.loc[scorable, transaction_date_col])),
+        dtype=np.float64, count=int(scorable.sum()))
+    data['days_since_prev'] = days
+    if geo is not None:
+        data = geo.add_features(data)
+    if rules is not None:
+        return prescreen_and_score(model, features, data, rules)
+    data['anomaly_score'] = predict_rows(model, data[features].to_numpy(dtype=np.float64))
+    data['is_anomaly'] = data['anomaly_score'] == -1
+    return data
+
+
+# Per-process state, filled once by _init_worker
+_worker = {}
+
+
+def _init_worker(kind, version, input_path, history, rules=None, medians=None):
+    _worker['kind'] = kind
+    _worker['path'] = input_path
+    if kind == 'land':
+        artifact = load_land_artifact(version=version)
+        _worker['model'] = load_estimator(artifact)
+        _worker['encoder'] = ValuationEncoder(artifact.feature_columns, artifact.locations, artifact.property_types)
+    else:
+        artifact = load_anomaly_artifact(version=version)
+        _worker['model'] = artifact.model
+        _worker['features'] = artifact.features
+        _worker['geo'] = geo_index_for(artifact)
+        _worker['history'] = history
+        _worker['rules'] = rules
+        _worker['medians'] = medians
+
+
+def _score_shard(shard):
+    if _worker['kind'] == 'land':
+        data = read_shard(_worker['path'], shard, LAND_DATA_DTYPES)
+        return score_land_frame(_worker['model'], _worker['encoder'], data)
+    data = read_shard(_worker['path'], shard, TRANSACTION_DTYPES)
+    return score_anomaly_frame(_worker['model'], _worker['features'], data, _worker['history'], _worker['geo'],
+                               _worker['rules'], _worker['medians'])
+
+
+def ordered_results(pool, fn, items, window):
+    """pool.map that yields in input order but keeps at most `window` tasks in flight"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', choices=['land', 'anomaly'], help='which model artifact to score with')
+    parser.add_argument('--input', required=True, help='CSV, Parquet or Arrow IPC file')
+    parser.add_argument('--output', required=True, help='.parquet, .arrow or .csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    parser.add_argument('--shard-rows', type=int, default=100_000, help='approximate rows per shard')
+    parser.add_argument('--version', help='artifact version (default: LATEST)')
+    parser.add_argument('--history', help='transactions used for days_since_prev (anomaly only, default: --input)')
+    parser.add_argument('--rules', help='JSON pre-screen rules (anomaly only, default: prescreen_rules.RULES)')
+    parser.add_argument('--no-prescreen', action='store_true', help='send every scorable row to the anomaly model')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    shards = plan_shards(args.input, args.shard_rows)
+    history = rules = medians = None
+    if args.model == 'anomaly' and not args.no_prescreen:
+        rules = load_rules(args.rules) if args.rules else RULES
+    if args.model == 'anomaly':
+        history, medians = build_history(args.history or args.input)
+        if args.history and args.history != args.input:
+            medians = transaction_medians(args.input)
+        print(f"Indexed {history.n_transactions} transactions on {len(history)} parcels")
+
+    # fork lets workers inherit the history index instead of unpickling a copy each
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    rows = 0
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker,
+                             initargs=(args.model, args.version, args.input, history, rules, medians)) as pool, \
+            TableWriter(args.output) as writer:
+        for result in ordered_results(pool, _score_shard, shards, window=2 * args.workers):
+            writer.write(result)
+            rows += len(result)
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {rows} rows in {len(shards)} shards with {args.workers} workers "
+          f"in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    if os.path.exists(args.output):
+        print(f"Results written to {args.output}")
+    else:
+        print(f"No rows to write; {args.output} was not created")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Production server for the land valuation and anomaly detection services.
+
+    python serve.py                        # both apps on http://0.0.0.0:8000
+    ML_JSON_ONLY=1 python serve.py         # JSON responses only, no template rendering
+
+The valuation app (app.py) is mounted at / and the anomaly app
+(app_anomaly.py) at /anomaly, in one gunicorn server:
+
+- Both apps, their models and the parcel history index are imported once in
+  the master (preload_app). Its heap is then frozen with gc.freeze() and the
+  workers are forked from it, so they share those pages copy-on-write
+  instead of loading a copy each. gc.freeze() keeps the cyclic GC from
+  writing to the shared objects and un-sharing them.
+- Every Jinja template is compiled in the master before the fork, and
+  auto-reload is off, so no worker parses a template at request time.
+- Workers are threaded (gthread) and keep client connections alive.
+
+Settings: SERVE_BIND (0.0.0.0:8000), SERVE_WORKERS (CPU count), SERVE_THREADS
+(4), SERVE_KEEPALIVE (seconds, 5). /metrics and /anomaly/metrics both report
+every worker's requests, merged through a fresh METRICS_DIR. Transactions scored by the anomaly app are
+added to the history index of the worker that scored them only.
+"""
+
+import gc
+import os
+import tempfile
+
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+# Workers write metrics snapshots here so /metrics reports the whole server, not one worker
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='ml-metrics-'))
+
+import app as land_app  # noqa: E402
+import app_anomaly as anomaly_app  # noqa: E402
+
+ANOMALY_PREFIX = '/anomaly'
+
+
+def warm_templates(flask_app):
+    """Compile every template up front and stop checking them for changes"""
+    flask_app.jinja_env.auto_reload = False
+    flask_app.config['TEMPLATES_AUTO_RELOAD'] = False
+    for name in flask_app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            flask_app.jinja_env.get_template(name)
+
+
+def create_app():
+    """One WSGI app: valuation at /, anomaly detection at /anomaly"""
+    for flask_app in (land_app.app, anomaly_app.app):
+        warm_templates(flask_app)
+    return DispatcherMiddleware(land_app.app, {ANOMALY_PREFIX: anomaly_app.app})
+
+
+application = create_app()
+
+
+def run():
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("serve.py needs gunicorn (pip install gunicorn); it is not available on Windows.")
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', os.getenv('SERVE_BIND', '0.0.0.0:8000'))
+            self.cfg.set('workers', int(os.getenv('SERVE_WORKERS', str(os.cpu_count() or 1))))
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', int(os.getenv('SERVE_THREADS', '4')))
+            self.cfg.set('keepalive', int(os.getenv('SERVE_KEEPALIVE', '5')))
+            self.cfg.set('preload_app', True)
+            # Freeze everything allocated so far just before the workers are forked
+            self.cfg.set('pre_fork', lambda server, worker: gc.freeze())
+
+        def load(self):
+            return application
+
+    Server().run()
+
+
+if __name__ == '__main__':
+    run()
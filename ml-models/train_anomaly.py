@@ -0,0 +1,201 @@
+"""Train the transaction anomaly model and save it as a versioned artifact.
+
+Full fit on the transaction history:
+
+    python train_anomaly.py --data anomaly.csv
+
+Warm-start refit on the transactions newer than the latest artifact. The
+existing trees are kept and --add-estimators new trees are fitted on the new
+window only, so the cost of a daily retrain grows with the new data rather
+than with the whole history:
+
+    python train_anomaly.py --warm-start --add-estimators 20
+
+Add neighbourhood price and amenity distance features from the latest geo
+index (build one first with `python geo_index.py build`):
+
+    python train_anomaly.py --geo
+
+A warm-start refit keeps the features and geo index version of its base.
+The new trees are grown on the same number of samples as the existing ones,
+so the window must have at least that many rows (max_samples_, at most 256);
+widen it with --since otherwise. The score threshold is then recalibrated
+on a uniform sample of the whole history (at most CALIBRATION_ROWS rows, kept
+in the artifact and updated with each window), so the share of transactions
+flagged stays at --contamination rather than following the new window alone,
+without scoring the full history on every refit.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from anomaly_pipeline import feature_matrix, load_transactions, transaction_date_col
+from feature_encoding import ANOMALY_FEATURES
+from geo_index import GeoIndex, geo_index_for
+from model_artifact import ANOMALY_MODEL_DIR, load_anomaly_artifact, load_calibration, save_anomaly_artifact
+
+# Size of the history sample the score threshold is calibrated on
+CALIBRATION_ROWS = 10000
+
+
+def training_window(data):
+    dates = data[transaction_date_col]
+    return {
+        'rows': int(len(data)),
+        'trained_from': dates.min().strftime('%Y-%m-%d'),
+        'trained_through': dates.max().strftime('%Y-%m-%d'),
+    }
+
+
+def full_fit(data, n_estimators=100, contamination=0.2, random_state=42, features=ANOMALY_FEATURES):
+    """Fit a fresh IsolationForest on every transaction"""
+    model = IsolationForest(n_estimators=n_estimators, contamination=contamination,
+                            random_state=random_state)
+    model.fit(feature_matrix(data, features))
+    return model
+
+
+def warm_start_fit(model, window, add_estimators, features=ANOMALY_FEATURES, calibration=None):
+    """Grow an already fitted IsolationForest with trees fitted on a new window.
+
+    The new trees subsample as many rows as the existing ones. fit() would
+    otherwise shrink max_samples_ to the window, which changes how every
+    tree's path lengths are normalized. With a calibration sample of the
+    history, the threshold is recalibrated on it (see calibrate).
+    """
+    max_samples = model.max_samples_
+    if len(window) < max_samples:
+        raise ValueError(f"Window has {len(window)} transactions; a warm start needs at least {max_samples} "
+                         f"(the trees' sample size). Widen it with --since or run a full fit")
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + add_estimators, max_samples=max_samples)
+    model.fit(feature_matrix(window, features))
+    if calibration is not None:
+        calibrate(model, calibration, features)
+    return model
+
+
+def sample_rows(data, features=ANOMALY_FEATURES, size=CALIBRATION_ROWS, seed=0):
+    """Uniform sample of at most `size` feature rows, as the calibration sample of a full fit"""
+    X = feature_matrix(data, features).to_numpy(dtype=np.float64)
+    if len(X) <= size:
+        return X
+    rng = np.random.default_rng(seed)
+    return X[np.sort(rng.choice(len(X), size, replace=False))]
+
+
+def update_sample(sample, seen, data, features=ANOMALY_FEATURES, size=CALIBRATION_ROWS, seed=0):
+    """Reservoir-sample the rows of data into a uniform sample of the `seen` rows before them"""
+    rng = np.random.default_rng([seed, seen])
+    X = feature_matrix(data, features).to_numpy(dtype=np.float64)
+    fill = max(0, min(size - len(sample), len(X)))
+    sample = np.concatenate([sample, X[:fill]])
+    # Row i of the rest replaces a random slot with probability size / (rows seen so far)
+    slots = rng.integers(0, seen + fill + np.arange(1, len(X) - fill + 1))
+    for row in np.flatnonzero(slots < size):
+        sample[slots[row]] = X[fill + row]
+    return sample
+
+
+def calibrate(model, sample, features=ANOMALY_FEATURES):
+    """Set the score threshold so that `contamination` of the sample is flagged, as a full fit does.
+
+    fit() sets it from the training rows, which after a warm start are only
+    the new window.
+    """
+    if model.contamination != 'auto':
+        model.offset_ = np.percentile(model.score_samples(pd.DataFrame(sample, columns=list(features))),
+                                      100.0 * model.contamination)
+    return model
+
+
+def flag_rate(model, sample, features=ANOMALY_FEATURES):
+    """Share of the sample's rows the model flags as anomalies"""
+    return float(np.mean(model.predict(pd.DataFrame(sample, columns=list(features))) == -1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='anomaly.csv', help='transaction file (default: anomaly.csv)')
+    parser.add_argument('--root', default=ANOMALY_MODEL_DIR, help='artifact directory')
+    parser.add_argument('--n-estimators', type=int, default=100, help='trees for a full fit')
+    parser.add_argument('--contamination', type=float, default=0.2)
+    parser.add_argument('--warm-start', action='store_true',
+                        help='extend the latest artifact instead of fitting from scratch')
+    parser.add_argument('--add-estimators', type=int, default=20, help='trees added by a warm-start refit')
+    parser.add_argument('--geo', action='store_true',
+                        help='add neighbourhood features from the latest geo index (full fit only)')
+    parser.add_argument('--since', help='first day of the warm-start window (default: day after the '
+                                        'latest artifact was trained through)')
+    args = parser.parse_args(argv)
+
+    # Features are derived over the full file so days_since_prev still sees
+    # earlier transactions on the same parcel; only the fit is windowed.
+    data = load_transactions(args.data)
+
+    if not args.warm_start:
+        geo = None
+        if args.geo:
+            try:
+                geo = GeoIndex.load()
+            except FileNotFoundError:
+                raise SystemExit("No geo index found. Build one with `python geo_index.py build`.")
+        features = ANOMALY_FEATURES + (geo.feature_names if geo else [])
+        if geo:
+            data = geo.add_features(data)
+        model = full_fit(data, args.n_estimators, args.contamination, features=features)
+        training = dict(training_window(data), mode='full', source=args.data, windows=[])
+        sample = sample_rows(data, features)
+    else:
+        base = load_anomaly_artifact(args.root)
+        geo = geo_index_for(base)
+        features = ANOMALY_FEATURES + (geo.feature_names if geo else [])
+        if base.features != features:
+            raise SystemExit(f"Artifact {base.version} was trained on {base.features}, "
+                             f"expected {features}; run a full fit instead")
+        if geo:
+            data = geo.add_features(data)
+        lineage = base.manifest['training']
+        # Rows up to trained_through are already in the lineage (and the calibration sample);
+        # a --since window may overlap them, but they are only counted once
+        new_rows = data[transaction_date_col] > pd.Timestamp(lineage['trained_through'])
+        if args.since:
+            window = data[data[transaction_date_col] >= pd.Timestamp(args.since)]
+        else:
+            window = data[new_rows]
+        if window.empty:
+            print(f"No new transactions since artifact {base.version}; nothing to do")
+            return
+
+        sample = load_calibration(base)
+        if sample is None:
+            # Artifacts saved before calibration samples: draw one from the history once
+            sample = sample_rows(data[~new_rows], features)
+        sample = update_sample(sample, lineage['rows'], data[new_rows], features)
+        try:
+            model = warm_start_fit(base.model, window, args.add_estimators, features, calibration=sample)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        new_window = dict(training_window(window), added_estimators=args.add_estimators,
+                          new_rows=int(new_rows.sum()))
+        training = dict(lineage, mode='warm_start', base_version=base.version,
+                        rows=lineage['rows'] + new_window['new_rows'],
+                        trained_through=max(lineage['trained_through'], new_window['trained_through']),
+                        windows=lineage.get('windows', []) + [new_window])
+
+    # A refit must flag about as much of the history as a full fit would
+    rate = flag_rate(model, sample, features)
+    if model.contamination != 'auto' and abs(rate - model.contamination) > 0.02:
+        raise SystemExit(f"Model flags {rate:.1%} of the history, expected about {model.contamination:.1%}; "
+                         f"not saved")
+    path = save_anomaly_artifact(model, features, training, root=args.root, geo_index=geo and geo.version,
+                                 calibration=sample)
+    print(f"Trained on {training['rows']} transactions through {training['trained_through']} "
+          f"({model.n_estimators} trees, {len(features)} features, {rate:.1%} of history flagged)")
+    print(f"Anomaly model artifact saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
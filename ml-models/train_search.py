@@ -0,0 +1,317 @@
+"""Cross-validated model search for land valuation, publishing the Pareto-best model.
+
+    python train_search.py                       # full search on land_data.csv, publish the winner
+    python train_search.py --quick --no-save     # a few candidates, report only
+    python train_search.py --workers 8 --report search.json
+
+land_valuation.py fits a single RandomForestRegressor on a single 80/20 split.
+This script compares a grid of candidates instead (SEARCH_SPACE): random
+forests and extra trees of several sizes and depths, plus
+HistGradientBoostingRegressor. Each candidate is scored on three things:
+
+- accuracy: mean MAE / RMSE / R^2 over --folds shuffled K-fold splits;
+- latency: p50 / p99 single-row predict and batch rows/s, measured one
+  model at a time on the engine the service would use (the compiled node
+  tables for forests, scikit-learn for gradient boosting);
+- size: bytes the service holds (node tables or the pickled estimator).
+
+Every (candidate, fold) fit and every full-data refit runs as a task in a
+process pool. The encoded fold arrays are written once to a cache directory
+and memory-mapped by the workers, so every candidate reads the same pages
+and none of them rebuilds or unpickles the data.
+
+Selection: the candidates no other candidate beats on RMSE, latency and size
+together form the Pareto front. From the front, take the ones whose CV RMSE
+is within --tolerance of the best, then pick the fastest, breaking ties on
+size. The winner is saved as a new land_model artifact. Its manifest records
+the CV metrics and the whole search, so app.py, score.py and the registry
+pick it up like any other version.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import pickle
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import read_land_data
+from feature_encoding import CATEGORICAL_FEATURES, predict_rows, training_feature_columns
+from forest_engine import FOREST_ARRAYS, CompiledForest, can_compile, export_forest
+
+RANDOM_STATE = 42
+
+SEARCH_SPACE = {
+    'random_forest': {'n_estimators': [25, 50, 100, 200], 'max_depth': [None, 8, 12]},
+    'extra_trees': {'n_estimators': [50, 100, 200], 'max_depth': [None, 12]},
+    'hist_gradient_boosting': {'max_iter': [100, 300], 'max_leaf_nodes': [15, 31], 'learning_rate': [0.05, 0.1]},
+}
+QUICK_SPACE = {
+    'random_forest': {'n_estimators': [25, 100], 'max_depth': [None]},
+    'extra_trees': {'n_estimators': [50], 'max_depth': [None]},
+    'hist_gradient_boosting': {'max_iter': [100], 'max_leaf_nodes': [15], 'learning_rate': [0.1]},
+}
+
+Candidate = namedtuple('Candidate', ['name', 'estimator', 'params'])
+
+
+def make_estimator(estimator, params):
+    from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor, RandomForestRegressor
+    if estimator == 'random_forest':
+        return RandomForestRegressor(random_state=RANDOM_STATE, **params)
+    if estimator == 'extra_trees':
+        return ExtraTreesRegressor(random_state=RANDOM_STATE, **params)
+    if estimator == 'hist_gradient_boosting':
+        return HistGradientBoostingRegressor(random_state=RANDOM_STATE, **params)
+    raise ValueError(f"Unknown estimator {estimator!r}")
+
+
+def candidates(space):
+    """Every parameter combination of every estimator in a search space"""
+    result = []
+    for estimator, grid in space.items():
+        keys = sorted(grid)
+        for values in itertools.product(*(grid[key] for key in keys)):
+            params = dict(zip(keys, values))
+            label = ','.join(f'{key}={value}' for key, value in params.items())
+            result.append(Candidate(f'{estimator}[{label}]', estimator, params))
+    return result
+
+
+def load_training_data(path):
+    """(X, y, feature_columns, locations, property_types) encoded as land_valuation.py does"""
+    data = read_land_data(path)
+    locations = [str(loc) for loc in data['Location'].unique()]
+    property_types = [str(pt) for pt in data['Property_Type'].unique()]
+    dummies = pd.get_dummies(data, columns=CATEGORICAL_FEATURES, drop_first=True)
+    feature_columns = training_feature_columns(dummies.columns)
+    X = dummies[feature_columns].to_numpy(dtype=np.float64)
+    y = dummies['Price_INR'].to_numpy(dtype=np.float64)
+    return X, y, feature_columns, locations, property_types
+
+
+class FoldCache:
+    """Train/test arrays of every fold, written once and memory-mapped by each worker"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def write(cls, directory, X, y, n_folds, seed=RANDOM_STATE):
+        from sklearn.model_selection import KFold
+
+        np.save(os.path.join(directory, 'X.npy'), X)
+        np.save(os.path.join(directory, 'y.npy'), y)
+        splits = KFold(n_splits=n_folds, shuffle=True, random_state=seed).split(X)
+        for fold, (train, test) in enumerate(splits):
+            for part, rows in (('train', train), ('test', test)):
+                np.save(os.path.join(directory, f'X_{part}_{fold}.npy'), X[rows])
+                np.save(os.path.join(directory, f'y_{part}_{fold}.npy'), y[rows])
+        return cls(directory)
+
+    def load(self, name):
+        return np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r')
+
+    def fold(self, fold):
+        """(X_train, y_train, X_test, y_test); fold None is the full data for the final refit"""
+        if fold is None:
+            return self.load('X'), self.load('y'), None, None
+        return tuple(self.load(f'{name}_{fold}') for name in ('X_train', 'y_train', 'X_test', 'y_test'))
+
+
+def regression_metrics(y_true, y_pred):
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    return {
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        'r2': float(r2_score(y_true, y_pred)),
+    }
+
+
+# Per-process state, filled once by _init_worker
+_worker = {}
+
+
+def _init_worker(cache_dir):
+    import warnings
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    _worker['cache'] = FoldCache(cache_dir)
+
+
+def _fit_task(task):
+    """Fit one candidate on one fold (scores it) or on all rows (pickles it to the cache)"""
+    index, candidate, fold = task
+    X_train, y_train, X_test, y_test = _worker['cache'].fold(fold)
+    start = time.perf_counter()
+    model = make_estimator(candidate.estimator, candidate.params).fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    if fold is None:
+        path = os.path.join(_worker['cache'].directory, f'model_{index}.pkl')
+        with open(path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return index, fold, {'fit_seconds': fit_seconds, 'path': path}
+    return index, fold, dict(regression_metrics(y_test, model.predict(X_test)), fit_seconds=fit_seconds)
+
+
+def serving_model(model):
+    """What the service would run: the compiled node tables for forests, the estimator otherwise"""
+    return CompiledForest(**export_forest(model)) if can_compile(model) else model
+
+
+def serving_bytes(model):
+    if can_compile(model):
+        arrays = export_forest(model)
+        return sum(arrays[name].nbytes for name in FOREST_ARRAYS)
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def measure_latency(model, X, single_calls=300, batch_rows=10_000):
+    """p50 / p99 single-row predict in ms and batch predict rows/s"""
+    engine = serving_model(model)
+    rows = np.ascontiguousarray(X[np.arange(single_calls) % len(X)])
+    predict_rows(engine, rows[:1])  # warm-up
+    single = np.empty(single_calls)
+    for i in range(single_calls):
+        start = time.perf_counter()
+        predict_rows(engine, rows[i:i + 1])
+        single[i] = time.perf_counter() - start
+    batch = np.ascontiguousarray(X[np.arange(batch_rows) % len(X)])
+    start = time.perf_counter()
+    predict_rows(engine, batch)
+    batch_seconds = time.perf_counter() - start
+    p50, p99 = np.percentile(single * 1e3, [50, 99])
+    return {'p50_ms': float(p50), 'p99_ms': float(p99), 'rows_per_s': float(batch_rows / batch_seconds)}
+
+
+def pareto_front(results):
+    """Indices of the results no other result matches or beats on rmse, p50_ms and size_bytes"""
+    keys = np.array([[r['rmse'], r['p50_ms'], r['size_bytes']] for r in results])
+    front = []
+    for i, point in enumerate(keys):
+        dominated = ((keys <= point).all(axis=1) & (keys < point).any(axis=1)).any()
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def select(results, front, tolerance):
+    """The fastest (then smallest) front member whose RMSE is within tolerance of the best"""
+    best_rmse = min(results[i]['rmse'] for i in front)
+    eligible = [i for i in front if results[i]['rmse'] <= best_rmse * (1 + tolerance)]
+    return min(eligible, key=lambda i: (results[i]['p50_ms'], results[i]['size_bytes'], results[i]['rmse']))
+
+
+def search(X, y, space, cache_dir, n_folds=5, workers=None):
+    """Cross-validate and time every candidate; returns (results, fitted models' paths).
+
+    The fold arrays and fitted models are written to cache_dir, which the
+    caller deletes once it has loaded the model it wants.
+    """
+    cands = candidates(space)
+    cache = FoldCache.write(cache_dir, X, y, n_folds)
+
+    # Full-data refits go first: they are the longest tasks
+    tasks = [(i, c, None) for i, c in enumerate(cands)]
+    tasks += [(i, c, fold) for i, c in enumerate(cands) for fold in range(n_folds)]
+    folds = [[] for _ in cands]
+    fitted = [None] * len(cands)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+        for index, fold, outcome in pool.map(_fit_task, tasks):
+            if fold is None:
+                fitted[index] = outcome
+            else:
+                folds[index].append(outcome)
+    print(f"Fitted {len(tasks)} models ({len(cands)} candidates x {n_folds} folds + refits) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    # Latency is timed here, one model at a time, so workers don't compete for cores
+    results = []
+    sample = np.asarray(cache.load('X'))
+    for candidate, scores, refit in zip(cands, folds, fitted):
+        with open(refit['path'], 'rb') as f:
+            model = pickle.load(f)
+        result = {
+            'name': candidate.name,
+            'estimator': candidate.estimator,
+            'params': candidate.params,
+            **{key: float(np.mean([s[key] for s in scores])) for key in ('mae', 'rmse', 'r2')},
+            'rmse_std': float(np.std([s['rmse'] for s in scores])),
+            'fit_seconds': refit['fit_seconds'],
+            'size_bytes': serving_bytes(model),
+            **measure_latency(model, sample),
+        }
+        results.append(result)
+    return results, [refit['path'] for refit in fitted]
+
+
+def print_table(results, front, chosen):
+    width = max(len(r['name']) for r in results) + 2
+    print(f"\n{'':2}{'candidate':<{width}}{'rmse':>12}{'r2':>8}{'p50 ms':>9}{'p99 ms':>9}{'rows/s':>12}{'KiB':>9}")
+    order = sorted(range(len(results)), key=lambda i: results[i]['rmse'])
+    for i in order:
+        r = results[i]
+        mark = '*' if i == chosen else ('P' if i in front else '')
+        print(f"{mark:<2}{r['name']:<{width}}{r['rmse']:>12,.0f}{r['r2']:>8.4f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}"
+              f"{r['rows_per_s']:>12,.0f}{r['size_bytes'] / 1024:>9,.0f}")
+    print("\nP = Pareto front (rmse, p50 latency, size), * = selected")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='land_data.csv', help='training file (default: land_data.csv)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='accept RMSE up to this fraction above the best for a faster model (default: 0.02)')
+    parser.add_argument('--quick', action='store_true', help='search QUICK_SPACE instead of SEARCH_SPACE')
+    parser.add_argument('--report', help='write every candidate result to this JSON file')
+    parser.add_argument('--no-save', action='store_true', help="don't publish the selected model")
+    args = parser.parse_args(argv)
+
+    X, y, feature_columns, locations, property_types = load_training_data(args.data)
+    print(f"{len(X)} rows, {len(feature_columns)} features")
+    # The fold arrays and fitted models are deleted however the search ends
+    with tempfile.TemporaryDirectory(prefix='train-search-') as cache_dir:
+        results, model_paths = search(X, y, QUICK_SPACE if args.quick else SEARCH_SPACE, cache_dir,
+                                      n_folds=args.folds, workers=args.workers)
+        front = pareto_front(results)
+        chosen = select(results, front, args.tolerance)
+        print_table(results, front, chosen)
+        winner = results[chosen]
+        print(f"\nSelected {winner['name']}: CV RMSE {winner['rmse']:,.0f} (R² {winner['r2']:.4f}), "
+              f"p50 {winner['p50_ms']:.3f} ms, {winner['size_bytes'] / 1024:,.0f} KiB")
+
+        summary = {
+            'data': args.data,
+            'folds': args.folds,
+            'tolerance': args.tolerance,
+            'selected': winner['name'],
+            'pareto_front': [results[i]['name'] for i in front],
+            'candidates': results,
+        }
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(summary, f, indent=2)
+            print(f"Search report written to {args.report}")
+
+        if not args.no_save:
+            from model_artifact import save_land_artifact
+
+            with open(model_paths[chosen], 'rb') as f:
+                model = pickle.load(f)
+            metrics = {key: winner[key] for key in ('mae', 'rmse', 'r2')}
+            metrics['cv_folds'] = args.folds
+            path = save_land_artifact(model, locations, property_types, feature_columns, metrics=metrics,
+                                      search=summary)
+            print(f"Model artifact saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""Precomputed valuation surface for instant quotes (GET/POST /quote in app.py).
+
+    python valuation_surface.py build      # for the latest land model; writes artifacts/valuation_surface/
+    python valuation_surface.py bench
+
+Most valuation inputs are discrete. Location and property type come from
+land_data.csv, and the land quality rating is an integer. Area and highway
+distance are bounded by the training data. The build step evaluates the
+model once over a grid of these inputs, one slice per (location, property
+type, quality):
+
+    values[location, property_type, quality, area cell, proximity cell]
+
+A quote is then a few dictionary lookups, two binary searches over the
+knots and one or four array reads, a few microseconds in all. Inputs outside
+the grid (a quality or area the training data never had) return None, and
+app.py falls back to the model.
+
+Two ways to lay out the continuous axes:
+
+    step    knots at the forest's own split thresholds on area and proximity.
+            A tree ensemble is constant between consecutive thresholds, so
+            each cell holds the exact model value and a quote is identical to
+            the forest. Needs a compiled forest (see forest_engine.py).
+    linear  a uniform grid of --area-points x --proximity-points knots, with
+            bilinear interpolation between them. Used for models whose splits
+            aren't readable (e.g. gradient boosting from train_search.py), or
+            when the step table would exceed SURFACE_MAX_CELLS cells.
+
+--method auto (the default) picks step when it can. Linear interpolation
+across the steps of a forest gives errors close to the size of a step, so it
+is only a fallback.
+
+Either way the build measures the surface against the model on
+--check-points random inputs, half of them on the knots. The error (max and
+p99 absolute, max relative) is printed and stored in the manifest, and with
+--max-rel-error a surface above the limit is not published. A surface
+records the model version it was built from; app.py only uses it while that
+version is active.
+"""
+
+import argparse
+import os
+import time
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from feature_encoding import predict_rows
+from forest_engine import CompiledForest
+from model_artifact import VALUATION_SURFACE_DIR, read_manifest, write_version
+
+METHODS = ('auto', 'step', 'linear')
+MAX_CELLS = int(os.getenv('SURFACE_MAX_CELLS', '4000000'))
+
+
+def split_knots(model, column):
+    """Sorted distinct split thresholds of one feature column, or None if the model has no node tables"""
+    if not isinstance(model, CompiledForest):
+        return None
+    threshold = model.threshold[(model.feature == column) & np.isfinite(model.threshold)]
+    return np.unique(threshold).astype(np.float64)
+
+
+def _step_points(knots):
+    """One input per step cell: each knot is the last value of its cell, plus one value past the last knot"""
+    past = np.nextafter(np.float32(knots[-1]), np.float32(np.inf)) if len(knots) else np.float32(0)
+    return np.append(knots, np.float64(past))
+
+
+def _step_cells(knots, x):
+    """Cell of each value, comparing in float32 as the forest does (x <= threshold goes left)"""
+    return np.searchsorted(knots, np.asarray(x, dtype=np.float32).astype(np.float64), side='left')
+
+
+def _bracket(knots, x):
+    """Index of the knot interval holding each value and the position within it (0..1)"""
+    i = np.clip(np.searchsorted(knots, x, side='right') - 1, 0, len(knots) - 2)
+    return i, (x - knots[i]) / (knots[i + 1] - knots[i])
+
+
+class ValuationSurface:
+    """Valuation model tabulated over locations, property types, quality ratings, area and proximity"""
+
+    def __init__(self, values, area_knots, proximity_knots, locations, property_types, qualities,
+                 area_range, proximity_range, method, model_version=None, error=None, version=None):
+        if method not in ('step', 'linear'):
+            raise ValueError(f"Unknown surface method {method!r}")
+        self.values = values
+        self.area_knots = np.asarray(area_knots, dtype=np.float64)
+        self.proximity_knots = np.asarray(proximity_knots, dtype=np.float64)
+        self.locations = list(locations)
+        self.property_types = list(property_types)
+        self.qualities = [int(q) for q in qualities]
+        self.area_range = tuple(float(v) for v in area_range)
+        self.proximity_range = tuple(float(v) for v in proximity_range)
+        self.method = method
+        self.model_version = model_version
+        self.error = error
+        self.version = version
+        # Plain lists and dicts: bisect and dict lookups beat NumPy calls for a single quote
+        self._area = self.area_knots.tolist()
+        self._proximity = self.proximity_knots.tolist()
+        self.location_index = {loc: i for i, loc in enumerate(self.locations)}
+        self.property_type_index = {pt: i for i, pt in enumerate(self.property_types)}
+        self.quality_index = {q: i for i, q in enumerate(self.qualities)}
+
+    @classmethod
+    def build(cls, model, encoder, qualities, area_range, proximity_range, method='auto',
+              area_points=241, proximity_points=345, max_cells=MAX_CELLS, model_version=None):
+        """Evaluate the model over the grid; encoder is the model's ValuationEncoder"""
+        if method not in METHODS:
+            raise ValueError(f"Unknown surface method {method!r} (expected one of {', '.join(METHODS)})")
+        locations = list(encoder.location_index)
+        property_types = list(encoder.property_type_index)
+        area_col, proximity_col, _ = encoder.numeric_index
+        slices = len(locations) * len(property_types) * len(qualities)
+
+        if method != 'linear':
+            area_knots, proximity_knots = split_knots(model, area_col), split_knots(model, proximity_col)
+            if area_knots is None:
+                if method == 'step':
+                    raise ValueError(f"{type(model).__name__} has no split thresholds; use --method linear")
+            elif slices * (len(area_knots) + 1) * (len(proximity_knots) + 1) > max_cells:
+                if method == 'step':
+                    raise ValueError(f"Step surface would have more than {max_cells} cells")
+                area_knots = None
+        if method == 'linear' or area_knots is None:
+            method = 'linear'
+            area_knots = np.linspace(*area_range, area_points)
+            proximity_knots = np.linspace(*proximity_range, proximity_points)
+            area_inputs, proximity_inputs = area_knots, proximity_knots
+        else:
+            method = 'step'
+            area_inputs, proximity_inputs = _step_points(area_knots), _step_points(proximity_knots)
+
+        area, proximity = np.meshgrid(area_inputs, proximity_inputs, indexing='ij')
+        values = np.empty((len(locations), len(property_types), len(qualities)) + area.shape, dtype=np.float64)
+        for i, location in enumerate(locations):
+            for j, property_type in enumerate(property_types):
+                for k, quality in enumerate(qualities):
+                    rows = np.repeat(encoder.encode_one(location, property_type, 0.0, 0.0, quality), area.size, axis=0)
+                    rows[:, area_col] = area.ravel()
+                    rows[:, proximity_col] = proximity.ravel()
+                    values[i, j, k] = predict_rows(model, rows).reshape(area.shape)
+        return cls(values, area_knots, proximity_knots, locations, property_types, qualities,
+                   area_range, proximity_range, method, model_version=model_version)
+
+    @property
+    def cells(self):
+        return int(self.values.size)
+
+    def quote(self, location, property_type, area_sqft, proximity_to_highway, land_quality):
+        """Price of one parcel from the table, or None if the inputs fall outside the grid"""
+        try:
+            cell = (self.location_index[location], self.property_type_index[property_type],
+                    self.quality_index[land_quality])
+        except (KeyError, TypeError):
+            return None
+        if not (self.area_range[0] <= area_sqft <= self.area_range[1]
+                and self.proximity_range[0] <= proximity_to_highway <= self.proximity_range[1]):
+            return None
+        if self.method == 'step':
+            return self.values.item(cell + (bisect_left(self._area, float(np.float32(area_sqft))),
+                                            bisect_left(self._proximity, float(np.float32(proximity_to_highway)))))
+
+        a = min(bisect_right(self._area, area_sqft) - 1, len(self._area) - 2)
+        p = min(bisect_right(self._proximity, proximity_to_highway) - 1, len(self._proximity) - 2)
+        ta = (area_sqft - self._area[a]) / (self._area[a + 1] - self._area[a])
+        tp = (proximity_to_highway - self._proximity[p]) / (self._proximity[p + 1] - self._proximity[p])
+        value = self.values.item
+        return ((value(cell + (a, p)) * (1 - tp) + value(cell + (a, p + 1)) * tp) * (1 - ta)
+                + (value(cell + (a + 1, p)) * (1 - tp) + value(cell + (a + 1, p + 1)) * tp) * ta)
+
+    def quote_many(self, location_idx, property_type_idx, quality_idx, area_sqft, proximity_to_highway):
+        """Vectorized quote() over index arrays; inputs must lie inside the grid"""
+        cell = (location_idx, property_type_idx, quality_idx)
+        if self.method == 'step':
+            return self.values[cell + (_step_cells(self.area_knots, area_sqft),
+                                       _step_cells(self.proximity_knots, proximity_to_highway))]
+        a, ta = _bracket(self.area_knots, area_sqft)
+        p, tp = _bracket(self.proximity_knots, proximity_to_highway)
+        values = self.values
+        return ((values[cell + (a, p)] * (1 - tp) + values[cell + (a, p + 1)] * tp) * (1 - ta)
+                + (values[cell + (a + 1, p)] * (1 - tp) + values[cell + (a + 1, p + 1)] * tp) * ta)
+
+    def sample(self, n, seed=0):
+        """n random in-grid inputs as index arrays, half of them with area and proximity on the knots"""
+        rng = np.random.default_rng(seed)
+        location_idx = rng.integers(len(self.locations), size=n)
+        property_type_idx = rng.integers(len(self.property_types), size=n)
+        quality_idx = rng.integers(len(self.qualities), size=n)
+        axes = []
+        for knots, (low, high) in ((self.area_knots, self.area_range), (self.proximity_knots, self.proximity_range)):
+            x = rng.uniform(low, high, n)
+            inside = knots[(knots >= low) & (knots <= high)]
+            if len(inside):
+                on_knot = rng.random(n) < 0.5
+                x[on_knot] = rng.choice(inside, on_knot.sum())
+            axes.append(x)
+        return location_idx, property_type_idx, quality_idx, axes[0], axes[1]
+
+    def check(self, model, encoder, points=100_000, seed=0):
+        """Error of the surface against the model on random in-grid inputs"""
+        location_idx, property_type_idx, quality_idx, area, proximity = self.sample(points, seed)
+        numeric = np.column_stack([area, proximity, np.asarray(self.qualities, dtype=np.float64)[quality_idx]])
+        loc_cols = np.array([encoder.location_index[loc] for loc in self.locations])[location_idx]
+        pt_cols = np.array([encoder.property_type_index[pt] for pt in self.property_types])[property_type_idx]
+        X = np.zeros((points, encoder.n_features), dtype=np.float64)
+        X[:, encoder.numeric_index] = numeric
+        rows = np.arange(points)
+        for cols in (loc_cols, pt_cols):
+            hit = cols >= 0
+            X[rows[hit], cols[hit]] = 1.0
+
+        expected = np.concatenate([predict_rows(model, X[start:start + 10_000]) for start in range(0, points, 10_000)])
+        error = np.abs(self.quote_many(location_idx, property_type_idx, quality_idx, area, proximity) - expected)
+        relative = error / np.maximum(np.abs(expected), 1.0)
+        return {
+            'points': int(points),
+            'max_abs_error': float(error.max()),
+            'p99_abs_error': float(np.percentile(error, 99)),
+            'mean_abs_error': float(error.mean()),
+            'max_rel_error': float(relative.max()),
+        }
+
+    def save(self, source=None, root=VALUATION_SURFACE_DIR):
+        """Publish as a new artifact version"""
+        def write_files(path):
+            np.save(os.path.join(path, 'values.npy'), np.ascontiguousarray(self.values))
+            np.save(os.path.join(path, 'area_knots.npy'), self.area_knots)
+            np.save(os.path.join(path, 'proximity_knots.npy'), self.proximity_knots)
+
+        manifest = {
+            'kind': 'valuation_surface',
+            'model_version': self.model_version,
+            'method': self.method,
+            'locations': self.locations,
+            'property_types': self.property_types,
+            'qualities': self.qualities,
+            'area_range': list(self.area_range),
+            'proximity_range': list(self.proximity_range),
+            'shape': list(self.values.shape),
+            'error': self.error,
+            'source': source,
+        }
+        return write_version(root, manifest, write_files)
+
+    @classmethod
+    def load(cls, root=VALUATION_SURFACE_DIR, version=None):
+        """Open a surface version (default LATEST); the table is memory-mapped read-only"""
+        version, path, manifest = read_manifest(root, version)
+
+        def array(name, mmap_mode=None):
+            return np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode))
+
+        return cls(array('values', 'r'), array('area_knots'), array('proximity_knots'), manifest['locations'],
+                   manifest['property_types'], manifest['qualities'], manifest['area_range'],
+                   manifest['proximity_range'], manifest['method'], model_version=manifest['model_version'],
+                   error=manifest['error'], version=version)
+
+
+def _load_model(version):
+    from feature_encoding import ValuationEncoder
+    from model_artifact import load_land_artifact
+
+    artifact = load_land_artifact(version=version)
+    encoder = ValuationEncoder(artifact.feature_columns, artifact.locations, artifact.property_types)
+    return artifact, encoder
+
+
+def _describe(surface):
+    error = surface.error or {}
+    return (f"{surface.method} surface for model {surface.model_version}: {surface.values.shape[3]} area x "
+            f"{surface.values.shape[4]} proximity cells per slice, {surface.cells:,} values "
+            f"({surface.values.nbytes / 1e6:.1f} MB); max error {error.get('max_abs_error', float('nan')):,.2f} "
+            f"({error.get('max_rel_error', float('nan')):.4%}), p99 {error.get('p99_abs_error', float('nan')):,.2f} "
+            f"over {error.get('points', 0)} checks")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='tabulate a land model and publish the surface')
+    build.add_argument('--model-version', help='land model version (default: LATEST)')
+    build.add_argument('--data', default='land_data.csv', help='training data that bounds the grid')
+    build.add_argument('--method', choices=METHODS, default='auto')
+    build.add_argument('--area-points', type=int, default=241, help='area knots of a linear surface')
+    build.add_argument('--proximity-points', type=int, default=345, help='proximity knots of a linear surface')
+    build.add_argument('--check-points', type=int, default=100_000, help='random inputs checked against the model')
+    build.add_argument('--max-rel-error', type=float, help="don't publish if the max relative error is above this")
+
+    bench = commands.add_parser('bench', help='time single quotes against the model')
+    bench.add_argument('--version', help='surface version (default: LATEST)')
+    bench.add_argument('--queries', type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        from columnar_cache import read_land_data
+
+        artifact, encoder = _load_model(args.model_version)
+        data = read_land_data(args.data)
+        quality = data['Land_Quality_Rating']
+        start = time.perf_counter()
+        surface = ValuationSurface.build(
+            artifact.forest, encoder, list(range(int(quality.min()), int(quality.max()) + 1)),
+            (float(data['Area_SqFt'].min()), float(data['Area_SqFt'].max())),
+            (float(data['Proximity_to_Highway_km'].min()), float(data['Proximity_to_Highway_km'].max())),
+            method=args.method, area_points=args.area_points, proximity_points=args.proximity_points,
+            model_version=artifact.version)
+        built = time.perf_counter() - start
+        surface.error = surface.check(artifact.forest, encoder, args.check_points)
+        print(f"Built in {built:.1f}s, checked in {time.perf_counter() - start - built:.1f}s")
+        print(_describe(surface))
+        if args.max_rel_error is not None and surface.error['max_rel_error'] > args.max_rel_error:
+            raise SystemExit(f"Max relative error {surface.error['max_rel_error']:.4%} is above "
+                             f"{args.max_rel_error:.4%}; not published (try more points or --method step)")
+        path = surface.save(source={'data': args.data})
+        print(f"Valuation surface saved to {path}")
+
+    else:
+        surface = ValuationSurface.load(version=args.version)
+        artifact, encoder = _load_model(surface.model_version)
+        print(_describe(surface))
+        location_idx, property_type_idx, quality_idx, area, proximity = surface.sample(args.queries, seed=1)
+        queries = [(surface.locations[l], surface.property_types[p], surface.qualities[q], float(a), float(x))
+                   for l, p, q, a, x in zip(location_idx, property_type_idx, quality_idx, area, proximity)]
+
+        def time_each(fn):
+            laps = []
+            for location, property_type, quality, a, x in queries:
+                start = time.perf_counter()
+                fn(location, property_type, a, x, quality)
+                laps.append(time.perf_counter() - start)
+            return np.percentile(np.array(laps) * 1e6, [50, 99])
+
+        quote = time_each(surface.quote)
+        model = time_each(lambda *inputs: artifact.forest.predict(encoder.encode_one(*inputs)))
+        print(f"surface quote: p50 {quote[0]:.1f} us, p99 {quote[1]:.1f} us")
+        print(f"model predict: p50 {model[0]:.1f} us, p99 {model[1]:.1f} us")
+
+
+if __name__ == '__main__':
+    main()